@@ -3,6 +3,15 @@
 #include <OneWire.h>
 #include <DallasTemperature.h>  
 
+// Set to 1 to send the readings as binary frames (see framework/io/input/sensors/sensor_protocol.py) instead of text.
+// The python side understands both.
+#define BINARY_FRAMES 0
+#define FRAME_VERSION 1
+#define FRAME_PAYLOAD_LENGTH 22
+#define FRAME_LENGTH (4 + FRAME_PAYLOAD_LENGTH + 2)
+
+uint16_t frameSequence = 0;
+
 // Setup for the TDS meter
 #define TdsSensorPin A1
 #define VREF 5.0      // analog reference voltage(Volt) of the ADC
@@ -40,6 +49,9 @@ void setup() {
 
 void loop() {
 
+#if BINARY_FRAMES
+  sendFrame(getTDS(), getPh(), getWaterTemp(), getAirTemp(), getHumidity());
+#else
   Serial.print("TDS: ");
   Serial.print(getTDS());
 
@@ -55,10 +67,52 @@ void loop() {
 
   Serial.print(" Humidity: ");
   Serial.println(getHumidity());
+#endif
 
   delay(5000);
 }
 
+uint16_t crc16(const uint8_t* data, uint8_t length){
+  /*
+   * CRC-16/CCITT-FALSE (polynomial 0x1021, starting value 0xFFFF). Matches binascii.crc_hqx(data, 0xFFFF) in python.
+   */
+
+  uint16_t crc = 0xFFFF;
+  for (uint8_t i = 0; i < length; i++) {
+
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+
+  return crc;
+}
+
+void sendFrame(float tds, float ph, float waterTemp, float airTemp, float humidity){
+  /*
+   * Sends the readings as one version 1 frame: sync bytes 0xAA 0x55, version, payload length, sequence number, the 5
+   * readings as 4 byte floats and the CRC of everything after the sync bytes. AVR boards are little endian like the
+   * frame so the numbers are copied as they are.
+   */
+
+  uint8_t frame[FRAME_LENGTH];
+  float readings[5] = {tds, ph, waterTemp, airTemp, humidity};
+
+  frame[0] = 0xAA;
+  frame[1] = 0x55;
+  frame[2] = FRAME_VERSION;
+  frame[3] = FRAME_PAYLOAD_LENGTH;
+  memcpy(&frame[4], &frameSequence, 2);
+  memcpy(&frame[6], readings, 20);
+
+  uint16_t crc = crc16(&frame[2], FRAME_LENGTH - 4);
+  memcpy(&frame[FRAME_LENGTH - 2], &crc, 2);
+
+  Serial.write(frame, FRAME_LENGTH);
+  frameSequence++;
+}
+
 float getAirTemp(){
   /*
    * Gets the temperature value form the DHT22 temperature and humidity sensor.  
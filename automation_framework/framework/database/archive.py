@@ -0,0 +1,532 @@
+"""
+Compressed column files for rows that have aged out of a table. Instead of being deleted, each whole day of old rows is
+written to its own file (archive_directory/table_name/YYYY-MM-DD.arc) and then removed from sqlite, so the live
+database stays small while years of history stay readable. ArchiveReader answers range queries and aggregates over the
+archive files and the live table as if they were one table.
+
+File layout:
+    magic (8 bytes) | header length (uint32) | header (json) | one compressed block for each column
+
+The header holds the table name, the row count, the first and last timestamp and the type, offset and length of each
+column block. Columns are stored separately so a query only decompresses the columns it asks for. The files are memory
+mapped, reading a column only touches the pages of its block.
+
+Column encodings (all compressed with zlib):
+    timestamp   int64 differences between rows. Readings a few seconds apart compress to almost nothing.
+    real        float64 with NaN for NULL. The bytes are grouped by position (all first bytes, then all second bytes...)
+                which puts the bytes that rarely change next to each other and compresses much better.
+    json        a json list. Used for text and for columns that do not hold only numbers.
+"""
+
+import bisect
+import json
+import logging as log
+import math
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from datetime import date, datetime, timedelta
+
+from framework.database import database
+
+magic = b"ACARCH1\n"
+header_length_format = "<I"
+file_extension = ".arc"
+
+
+def shuffle_bytes(data: bytes, item_size: int) -> bytes:
+    """ Groups the bytes of fixed size items by their position in the item """
+
+    return b"".join(data[position::item_size] for position in range(item_size))
+
+
+def unshuffle_bytes(data: bytes, item_size: int) -> bytes:
+    """ Reverses shuffle_bytes() """
+
+    count = len(data) // item_size
+    result = bytearray(len(data))
+    for position in range(item_size):
+        result[position::item_size] = data[position * count:(position + 1) * count]
+
+    return bytes(result)
+
+
+def to_little_endian(values: array) -> bytes:
+
+    if sys.byteorder == "big":
+        values.byteswap()
+
+    return values.tobytes()
+
+
+def from_little_endian(type_code: str, data: bytes) -> array:
+
+    values = array(type_code, data)
+    if sys.byteorder == "big":
+        values.byteswap()
+
+    return values
+
+
+def is_number(value) -> bool:
+
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+
+
+def encode_column(values: list, column_type: str) -> bytes:
+    """
+    :param values: the values of a column, oldest row first
+    :param column_type: 'timestamp', 'real' or 'json'
+    :return: the compressed block
+    """
+
+    if column_type == "timestamp":
+        deltas = array("q", (value - previous for previous, value in zip([0] + values[:-1], values)))
+        data = shuffle_bytes(to_little_endian(deltas), 8)
+
+    elif column_type == "real":
+        floats = array("d", (math.nan if value is None else value for value in values))
+        data = shuffle_bytes(to_little_endian(floats), 8)
+
+    else:
+        data = json.dumps(values, separators=(",", ":")).encode("utf-8")
+
+    return zlib.compress(data, 9)
+
+
+def decode_column(block, column_type: str) -> list:
+    """
+    :param block: a compressed block (any bytes like object)
+    :param column_type: 'timestamp', 'real' or 'json'
+    :return: the values of the column, oldest row first
+    """
+
+    data = zlib.decompress(block)
+    if column_type == "timestamp":
+
+        timestamps = []
+        timestamp = 0
+        for delta in from_little_endian("q", unshuffle_bytes(data, 8)):
+            timestamp += delta
+            timestamps.append(timestamp)
+
+        return timestamps
+
+    if column_type == "real":
+        return [None if math.isnan(value) else value for value in from_little_endian("d", unshuffle_bytes(data, 8))]
+
+    return json.loads(data.decode("utf-8"))
+
+
+def write_archive(path: str, table_name: str, timestamp_column: str, columns: list, rows: list) -> None:
+    """
+    Writes rows to an archive file. The file is written next to its final path and renamed into place so a crash
+    never leaves half a file.
+
+    :param path: file to write
+    :param table_name: table the rows came from
+    :param timestamp_column: column holding the time of each row in seconds since epoch
+    :param columns: names of the columns in each row
+    :param rows: rows sorted by timestamp
+    :return: None
+    """
+
+    blocks = []
+    column_headers = []
+    offset = 0
+    for index, column in enumerate(columns):
+
+        values = [row[index] for row in rows]
+        if column == timestamp_column:
+            column_type = "timestamp"
+
+        elif all(is_number(value) for value in values) and not all(isinstance(value, int) for value in values
+                                                                    if value is not None):
+            column_type = "real"
+
+        else:
+            # Text, and whole numbers which have to come back as ints
+            column_type = "json"
+
+        block = encode_column(values, column_type)
+        blocks.append(block)
+        column_headers.append({"name": column, "type": column_type, "offset": offset, "length": len(block)})
+        offset += len(block)
+
+    timestamps = [row[columns.index(timestamp_column)] for row in rows]
+    header = json.dumps({"table_name": table_name, "timestamp_column": timestamp_column, "row_count": len(rows),
+                         "first_timestamp": timestamps[0] if rows else None,
+                         "last_timestamp": timestamps[-1] if rows else None,
+                         "columns": column_headers}).encode("utf-8")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as archive_file:
+
+        archive_file.write(magic)
+        archive_file.write(struct.pack(header_length_format, len(header)))
+        archive_file.write(header)
+        for block in blocks:
+            archive_file.write(block)
+
+        archive_file.flush()
+        os.fsync(archive_file.fileno())
+
+    os.replace(temporary_path, path)
+
+
+class ArchiveFile:
+
+    def __init__(self, path: str):
+        """
+        One memory mapped archive file
+
+        :param path: file to open
+        """
+
+        self.path = path
+        with open(path, "rb") as archive_file:
+            self.map = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.map[:len(magic)] != magic:
+            self.map.close()
+            raise ValueError(f"'{path}' is not an archive file")
+
+        header_start = len(magic) + struct.calcsize(header_length_format)
+        header_length = struct.unpack_from(header_length_format, self.map, len(magic))[0]
+        self.header = json.loads(self.map[header_start:header_start + header_length].decode("utf-8"))
+        self.data_start = header_start + header_length
+
+        self.columns = {column["name"]: column for column in self.header["columns"]}
+        self.timestamp_column = self.header["timestamp_column"]
+        self.row_count = self.header["row_count"]
+
+    def read_column(self, name: str) -> list:
+        """
+        :param name: column to read
+        :return: every value of the column, oldest row first
+        """
+
+        column = self.columns[name]
+        start = self.data_start + column["offset"]
+        with memoryview(self.map) as view:
+            return decode_column(view[start:start + column["length"]], column["type"])
+
+    def get_rows(self, columns: list, start_timestamp: int, end_timestamp: int) -> list:
+        """
+        :param columns: columns to get. A column the file does not have reads as None.
+        :param start_timestamp: seconds since epoch of the first row to include
+        :param end_timestamp: seconds since epoch of the last row to include
+        :return: rows in the range, oldest first
+        """
+
+        timestamps = self.read_column(self.timestamp_column)
+        first = bisect.bisect_left(timestamps, start_timestamp)
+        last = bisect.bisect_right(timestamps, end_timestamp)
+        if first >= last:
+            return []
+
+        values = []
+        for column in columns:
+
+            if column == self.timestamp_column:
+                values.append(timestamps[first:last])
+
+            elif column in self.columns:
+                values.append(self.read_column(column)[first:last])
+
+            else:
+                values.append([None] * (last - first))
+
+        return list(zip(*values))
+
+    def close(self) -> None:
+
+        self.map.close()
+
+
+def get_local_midnight(timestamp: float) -> int:
+    """
+    :param timestamp: seconds since epoch
+    :return: the start of the local day the time is in
+    """
+
+    day = datetime.fromtimestamp(timestamp).date()
+    return int(datetime(day.year, day.month, day.day).timestamp())
+
+
+def get_archive_path(archive_directory: str, table_name: str, day: date) -> str:
+
+    return os.path.join(archive_directory, table_name, day.isoformat() + file_extension)
+
+
+def archive_old_data(table_name: str, max_age: int, archive_directory: str,
+                     path_to_database: str = database.path_to_database, timestamp_column: str = "timestamp",
+                     batch_size: int = 500, max_lock_seconds: float = 0.005, batch_pause: float = 0.05) -> int:
+    """
+    Moves whole days of rows older than max_age days from a table to archive files. The rows are read without taking
+    the write lock, written to their files and then deleted from the table in short batches (see
+    database.delete_rows_before). If the controller stopped after a file was written but before its rows were deleted,
+    the rows are merged into the file again the next time without being stored twice.
+
+    :param table_name: table to archive
+    :param max_age: days of rows to keep in the table
+    :param archive_directory: folder holding a folder of archive files for each table
+    :param path_to_database: name of the database to connect to
+    :param timestamp_column: indexed column holding the time of each row in seconds since epoch
+    :param batch_size: max number of rows to delete in each transaction
+    :param max_lock_seconds: target for how long each delete holds the write lock
+    :param batch_pause: seconds to wait between deletes
+    :return: number of rows archived
+    """
+
+    log.getLogger().debug(f"STARTING archive_old_data '{table_name}'")
+
+    cutoff = get_local_midnight((datetime.now() - timedelta(days=max_age)).timestamp())
+
+    archived_count = archive_rows(table_name, table_name, 0, cutoff, archive_directory, path_to_database,
+                                  timestamp_column)
+    if archived_count > 0:
+        database.delete_rows_before(table_name, cutoff, path_to_database, timestamp_column, batch_size,
+                                    max_lock_seconds, batch_pause)
+
+        log.getLogger().warning(f"Archived {archived_count} rows of '{table_name}' to '{archive_directory}'")
+
+    log.getLogger().debug(f"DONE archive_old_data '{table_name}'")
+
+    return archived_count
+
+
+def archive_rows(source_table: str, table_name: str, start_timestamp: int, end_timestamp: int,
+                 archive_directory: str, path_to_database: str = database.path_to_database,
+                 timestamp_column: str = "timestamp") -> int:
+    """
+    Writes the rows of a time range to archive files, one file for each local day. Rows already in a file are not
+    stored twice. The rows are not deleted.
+
+    :param source_table: table to read the rows from
+    :param table_name: table the files are named after. Differs from source_table for a partition.
+    :param start_timestamp: seconds since epoch of the first row to include
+    :param end_timestamp: rows before this time are included
+    :param archive_directory: folder holding a folder of archive files for each table
+    :param path_to_database: name of the database to connect to
+    :param timestamp_column: indexed column holding the time of each row in seconds since epoch
+    :return: number of rows read from the table
+    """
+
+    column_info = database.execute(f"PRAGMA table_info({source_table})", result_count=database.ResultCount.ALL,
+                                   path_to_database=path_to_database)
+    columns = [column[1] for column in column_info or []]
+
+    archived_count = 0
+    while len(columns) > 0:
+
+        first_timestamp = database.execute(f"SELECT min({timestamp_column}) FROM {source_table} "
+                                           f"WHERE {timestamp_column} >= ? AND {timestamp_column} < ?",
+                                           (start_timestamp, end_timestamp), database.ResultCount.ONE,
+                                           path_to_database)
+        if first_timestamp is None or first_timestamp[0] is None:
+            break
+
+        day = datetime.fromtimestamp(first_timestamp[0]).date()
+        day_start = get_local_midnight(first_timestamp[0])
+        day_end = min(int(datetime.combine(day + timedelta(days=1), datetime.min.time()).timestamp()), end_timestamp)
+
+        rows = database.select_data(source_table, database.ResultCount.ALL, columns, f"ORDER BY {timestamp_column}",
+                                    path_to_database, where=f"{timestamp_column} >= ? AND {timestamp_column} < ?",
+                                    parameters=(max(day_start, start_timestamp), day_end))
+        if rows is None:
+            break
+
+        path = get_archive_path(archive_directory, table_name, day)
+        all_rows = rows
+        if os.path.exists(path):
+
+            archive_file = ArchiveFile(path)
+            try:
+                archived_rows = archive_file.get_rows(columns, day_start, day_end - 1)
+
+            finally:
+                archive_file.close()
+
+            stored = set(archived_rows)
+            all_rows = archived_rows + [row for row in rows if row not in stored]
+            all_rows.sort(key=lambda row: row[columns.index(timestamp_column)])
+
+        write_archive(path, table_name, timestamp_column, columns, all_rows)
+        archived_count += len(rows)
+        start_timestamp = day_end
+
+    return archived_count
+
+
+def delete_old_archives(table_name: str, max_age: int, archive_directory: str) -> int:
+    """
+    Deletes archive files of days more than max_age days ago
+
+    :param table_name: table the files are for
+    :param max_age: days of archive files to keep
+    :param archive_directory: folder holding a folder of archive files for each table
+    :return: number of files deleted
+    """
+
+    oldest_day = date.today() - timedelta(days=max_age)
+    deleted_count = 0
+    for day, path in get_archive_days(table_name, archive_directory):
+
+        if day < oldest_day:
+            os.remove(path)
+            deleted_count += 1
+
+    return deleted_count
+
+
+def get_archive_days(table_name: str, archive_directory: str) -> list:
+    """
+    :param table_name: table the files are for
+    :param archive_directory: folder holding a folder of archive files for each table
+    :return: (date, path) of each archive file, oldest first
+    """
+
+    directory = os.path.join(archive_directory, table_name)
+    if not os.path.isdir(directory):
+        return []
+
+    days = []
+    for file_name in os.listdir(directory):
+
+        if file_name.endswith(file_extension):
+
+            try:
+                days.append((date.fromisoformat(file_name[:-len(file_extension)]), os.path.join(directory, file_name)))
+
+            except ValueError:
+                pass
+
+    return sorted(days)
+
+
+class ArchiveReader:
+
+    def __init__(self, table_name: str, archive_directory: str, path_to_database: str = database.path_to_database,
+                 timestamp_column: str = "timestamp"):
+        """
+        Reads a table and its archive files as one table. Rows of days that have been archived are read from the files
+        and newer rows from sqlite.
+
+        :param table_name: table to read
+        :param archive_directory: folder holding a folder of archive files for each table
+        :param path_to_database: name of the database to connect to
+        :param timestamp_column: column holding the time of each row in seconds since epoch
+        """
+
+        self.table_name = table_name
+        self.archive_directory = archive_directory
+        self.path_to_database = path_to_database
+        self.timestamp_column = timestamp_column
+
+        # Open files. Path/(modified time, ArchiveFile). Re-opened if the archiver rewrites a file.
+        self.open_files = {}
+
+    def _get_file(self, path: str) -> ArchiveFile:
+
+        modified_time = os.stat(path).st_mtime_ns
+        open_file = self.open_files.get(path)
+        if open_file is not None and open_file[0] == modified_time:
+            return open_file[1]
+
+        if open_file is not None:
+            open_file[1].close()
+
+        archive_file = ArchiveFile(path)
+        self.open_files[path] = (modified_time, archive_file)
+
+        return archive_file
+
+    def _get_files_between(self, start_timestamp: int, end_timestamp: int) -> tuple:
+        """
+        :return: (archive files with days in the range, time the live table starts at)
+        """
+
+        days = get_archive_days(self.table_name, self.archive_directory)
+        if len(days) == 0:
+            return [], start_timestamp
+
+        # Everything before the day after the newest file has been moved out of sqlite
+        live_start = int(datetime.combine(days[-1][0] + timedelta(days=1), datetime.min.time()).timestamp())
+
+        first_day = datetime.fromtimestamp(start_timestamp).date()
+        last_day = datetime.fromtimestamp(min(end_timestamp, live_start - 1)).date()
+        files = [self._get_file(path) for day, path in days if first_day <= day <= last_day]
+
+        return files, max(start_timestamp, live_start)
+
+    def get_readings_between(self, columns: list, start_timestamp: int, end_timestamp: int) -> list:
+        """
+        :param columns: columns to get ex. ["timestamp", "water_temp"]
+        :param start_timestamp: seconds since epoch of the first row to include
+        :param end_timestamp: seconds since epoch of the last row to include
+        :return: the rows in the range, oldest first
+        """
+
+        files, live_start = self._get_files_between(start_timestamp, end_timestamp)
+
+        rows = []
+        for archive_file in files:
+            rows.extend(archive_file.get_rows(columns, start_timestamp, end_timestamp))
+
+        if live_start <= end_timestamp:
+            rows.extend(database.select_data(self.table_name, database.ResultCount.ALL, columns,
+                                             f"ORDER BY {self.timestamp_column}", self.path_to_database,
+                                             where=f"{self.timestamp_column} BETWEEN ? AND ?",
+                                             parameters=(live_start, end_timestamp)) or [])
+
+        return rows
+
+    def get_aggregate(self, column: str, start_timestamp: int, end_timestamp: int) -> tuple:
+        """
+        :param column: numeric column to summarise
+        :param start_timestamp: seconds since epoch of the first row to include
+        :param end_timestamp: seconds since epoch of the last row to include
+        :return: (min, max, mean, count) of the values in the range that are not NULL. All None but count if there are
+            none.
+        """
+
+        minimum = maximum = None
+        total = 0
+        count = 0
+
+        files, live_start = self._get_files_between(start_timestamp, end_timestamp)
+        for archive_file in files:
+
+            values = [row[0] for row in archive_file.get_rows([column], start_timestamp, end_timestamp)
+                      if row[0] is not None]
+            if len(values) > 0:
+                minimum = min(values) if minimum is None else min(minimum, min(values))
+                maximum = max(values) if maximum is None else max(maximum, max(values))
+                total += sum(values)
+                count += len(values)
+
+        if live_start <= end_timestamp:
+
+            live = database.execute(f"SELECT min({column}), max({column}), total({column}), count({column}) "
+                                    f"FROM {self.table_name} WHERE {self.timestamp_column} BETWEEN ? AND ?",
+                                    (live_start, end_timestamp), database.ResultCount.ONE, self.path_to_database)
+            if live is not None and live[3] > 0:
+                minimum = live[0] if minimum is None else min(minimum, live[0])
+                maximum = live[1] if maximum is None else max(maximum, live[1])
+                total += live[2]
+                count += live[3]
+
+        return minimum, maximum, total / count if count > 0 else None, count
+
+    def close(self) -> None:
+        """ Closes the open archive files """
+
+        for modified_time, archive_file in self.open_files.values():
+            archive_file.close()
+
+        self.open_files = {}
@@ -0,0 +1,281 @@
+"""
+Long lived connections to a sqlite database. Opening a connection, setting it up and closing it costs more than most
+of the statements the framework runs, so each database gets one ConnectionManager that keeps its connections open.
+
+Sqlite allows one writer at a time, so there is one writer connection shared by every thread behind a lock. Reads use
+a separate connection for each thread so they never wait on the lock. The database is put in WAL mode, which lets the
+readers (including the Django web app reading the same file) keep reading while the writer commits.
+"""
+
+import logging as log
+import os
+import sqlite3
+import threading
+
+# Pragmas set on every connection. journal_mode is stored in the database file so it only has to be set once, but
+# setting it again is harmless. synchronous=NORMAL is safe in WAL mode, a power cut can lose the last commits but can
+# not corrupt the database.
+default_pragmas = {"journal_mode": "WAL", "synchronous": "NORMAL", "temp_store": "MEMORY"}
+
+# How long (in milliseconds) a connection waits for a lock before failing with 'database is locked'
+default_busy_timeout = 5000
+
+# Number of prepared statements each connection keeps. A statement is reused when the same sql text runs again, so
+# queries should bind their values with ? placeholders instead of putting them in the sql.
+default_cached_statements = 256
+
+
+class ConnectionManager:
+
+    def __init__(self, path_to_database: str, busy_timeout: int = default_busy_timeout, pragmas: dict = None):
+        """
+        Holds the open connections to one database
+
+        :param path_to_database: database to connect to
+        :param busy_timeout: milliseconds to wait for a lock held by another connection or process
+        :param pragmas: pragma name/value set on each new connection (default_pragmas if None)
+        """
+
+        self.path_to_database = path_to_database
+        self.busy_timeout = busy_timeout
+        self.pragmas = dict(default_pragmas if pragmas is None else pragmas)
+
+        self.write_lock = threading.RLock()
+        self.writer = None
+
+        self.local = threading.local()
+        self.readers = []
+        self.readers_lock = threading.Lock()
+
+        # Connections can not be used after a fork so a child process opens its own
+        self.pid = os.getpid()
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        """
+        Opens and sets up a new connection
+
+        :param read_only: stop the connection from writing
+        :return: the connection
+        """
+
+        # The python timeout and busy_timeout both wait for locks. Both are set so they agree.
+        connection = sqlite3.connect(self.path_to_database, timeout=self.busy_timeout / 1000, check_same_thread=False,
+                                     cached_statements=default_cached_statements)
+        connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+
+        for pragma, value in self.pragmas.items():
+
+            # Changing the journal mode needs a write lock. The writer sets it before any reader is opened.
+            if not (read_only and pragma == "journal_mode"):
+                connection.execute(f"PRAGMA {pragma} = {value}")
+
+        if read_only:
+            connection.execute("PRAGMA query_only = ON")
+
+        return connection
+
+    def _check_process(self) -> None:
+        """
+        Drops the connections inherited from the parent process after a fork without closing them. The locks are
+        replaced too, a lock held by a parent thread at the time of the fork would never be released in the child.
+        """
+
+        if self.pid != os.getpid():
+
+            self.pid = os.getpid()
+            self.write_lock = threading.RLock()
+            self.writer = None
+            self.local = threading.local()
+            self.readers = []
+            self.readers_lock = threading.Lock()
+
+    def get_writer(self) -> sqlite3.Connection:
+        """
+        Gets the writer connection. Hold write_lock while using it.
+
+        :return: the writer connection
+        """
+
+        self._check_process()
+        if self.writer is None:
+            self.writer = self._connect(False)
+
+        return self.writer
+
+    def get_reader(self) -> sqlite3.Connection:
+        """
+        Gets the read connection of the calling thread, opening it the first time
+
+        :return: a read only connection only used by this thread
+        """
+
+        self._check_process()
+        reader = getattr(self.local, "reader", None)
+        if reader is None:
+
+            # Make sure the writer has created the database and set WAL mode before a reader opens it
+            with self.write_lock:
+                self.get_writer()
+
+            reader = self._connect(True)
+            self.local.reader = reader
+            with self.readers_lock:
+                self.readers.append(reader)
+
+        return reader
+
+    def execute(self, query: str, parameters=(), fetch: str = None):
+        """
+        Runs one statement. Statements that only read use the read connection of the calling thread, everything else
+        runs on the writer connection and is committed right away.
+
+        :param query: sql statement
+        :param parameters: values for the ? placeholders in the statement
+        :param fetch: 'ONE' to return the first row, 'ALL' to return every row or None to return nothing
+        :return: the fetched rows or None
+        """
+
+        if is_read_only(query):
+            cursor = self.get_reader().execute(query, parameters)
+            return _fetch(cursor, fetch)
+
+        with self.write_lock:
+
+            connection = self.get_writer()
+            try:
+                cursor = connection.execute(query, parameters)
+                result = _fetch(cursor, fetch)
+                connection.commit()
+
+            except Exception:
+                connection.rollback()
+                raise
+
+        return result
+
+    def execute_many(self, query: str, rows) -> int:
+        """
+        Runs one statement for each row of parameters. The statement is prepared once and every row is written in one
+        transaction, so either all of the rows are stored or none are.
+
+        :param query: sql statement with ? placeholders
+        :param rows: a parameter tuple for each row (any iterable, it is only read once)
+        :return: number of rows changed
+        """
+
+        with self.write_lock:
+
+            connection = self.get_writer()
+            try:
+                cursor = connection.executemany(query, rows)
+                row_count = cursor.rowcount
+                cursor.close()
+                connection.commit()
+
+            except Exception:
+                connection.rollback()
+                raise
+
+        return row_count
+
+    def close(self) -> None:
+        """ Closes every connection. New ones are opened if the manager is used again. """
+
+        with self.write_lock:
+
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+        with self.readers_lock:
+
+            for reader in self.readers:
+                reader.close()
+
+            self.readers = []
+            self.local = threading.local()
+
+
+def is_read_only(query: str) -> bool:
+    """
+    Checks if a statement only reads. Used to send it to a read connection.
+
+    :param query: sql statement
+    :return: True for SELECT statements
+    """
+
+    return query.lstrip()[:6].upper() == "SELECT"
+
+
+def _fetch(cursor: sqlite3.Cursor, fetch: str):
+    """
+    Gets the result of a statement and closes the cursor. A cursor left open keeps its read transaction open, which
+    stops the WAL file from being checkpointed.
+
+    :param cursor: cursor the statement was run on
+    :param fetch: 'ONE', 'ALL' or None
+    :return: the fetched rows or None
+    """
+
+    result = None
+    if fetch == "ALL":
+        result = cursor.fetchall()
+
+    elif fetch == "ONE":
+        result = cursor.fetchone()
+
+    cursor.close()
+
+    return result
+
+
+# One manager for each database. Path/ConnectionManager.
+managers = {}
+managers_lock = threading.Lock()
+
+
+def get_connection_manager(path_to_database: str) -> ConnectionManager:
+    """
+    Gets the connection manager for a database, creating it the first time
+
+    :param path_to_database: database to connect to
+    :return: ConnectionManager
+    """
+
+    manager = managers.get(path_to_database)
+    if manager is None:
+
+        with managers_lock:
+
+            manager = managers.get(path_to_database)
+            if manager is None:
+                log.getLogger().debug(f"STARTING connection manager for '{path_to_database}'")
+                manager = ConnectionManager(path_to_database)
+                managers[path_to_database] = manager
+
+    return manager
+
+
+def _after_fork() -> None:
+    """
+    Runs in the child process right after a fork, while it only has one thread. Callers take write_lock before they
+    get the writer connection, so waiting for the first get_writer() call to reset the locks would be too late.
+    """
+
+    global managers_lock
+    managers_lock = threading.Lock()
+
+    for manager in managers.values():
+        manager._check_process()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def close_all() -> None:
+    """ Closes the connections of every database """
+
+    with managers_lock:
+
+        for manager in managers.values():
+            manager.close()
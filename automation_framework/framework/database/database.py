@@ -1,10 +1,14 @@
 """
 Functions to create and manipulate a sqlite database
 """
-import time
 from enum import Enum
+import functools
 import sqlite3
 import logging as log
+import time
+
+from framework.database.connection import get_connection_manager
+from framework.database.writer import get_database_writer
 
 from datetime import datetime, timedelta
 
@@ -68,7 +72,8 @@ def format_list(items: list, has_quotes: bool, has_parenthesis: bool) -> str:
     return formatted_items
 
 
-def init_database(table_name: str, column_info: dict, can_be_null: bool, path_to_database: str = path_to_database ) -> None:
+def init_database(table_name: str, column_info: dict, can_be_null: bool, path_to_database: str = path_to_database,
+                  partition_period: str = None):
     """
     Creates the database to store values and other settings
 
@@ -76,15 +81,28 @@ def init_database(table_name: str, column_info: dict, can_be_null: bool, path_to
     :param can_be_null: if the column can be null
     :param table_name: name of initial table to create
     :param path_to_database: name of the database to create (if none the default in the .py file will be used)
+    :param partition_period: 'day' or 'week' to store the rows in a table for each period behind a view with the name
+        of the table (see framework.database.partitions). None for one plain table.
+    :return: the PartitionedTable to insert rows through if partition_period is set, otherwise None
     """
 
     log.getLogger().debug("STARTING init_database 'Database'")
 
     create_database(path_to_database)
-    create_table(table_name, column_info, can_be_null, path_to_database)
+
+    partitioned_table = None
+    if partition_period is None:
+        create_table(table_name, column_info, can_be_null, path_to_database)
+
+    else:
+        # Only imported by partitioned tables
+        from framework.database.partitions import PartitionedTable
+        partitioned_table = PartitionedTable(table_name, column_info, can_be_null, partition_period, path_to_database)
 
     log.getLogger().debug("DONE create_table 'Database'")
 
+    return partitioned_table
+
 
 def create_database(path_to_database: str = path_to_database) -> None:
     """
@@ -124,6 +142,86 @@ def create_table(table_name: str, column_info: dict, can_be_null: bool, path_to_
     log.getLogger().debug("DONE create_table 'Database'")
 
 
+@functools.lru_cache(maxsize=128)
+def build_insert_query(table_name: str, columns: tuple) -> str:
+    """
+    Builds an insert statement with a ? placeholder for each column. Only the table and column names are in the sql,
+    so the text is the same for every row and sqlite reuses the prepared statement.
+
+    :param table_name: table to insert into
+    :param columns: names of the columns being inserted
+    :return: the insert statement
+    """
+
+    return f"INSERT INTO {table_name} {format_list(columns, False, True)} " \
+           f"VALUES ({', '.join('?' for column in columns)})"
+
+
+def execute(query: str, parameters=(), result_count: ResultCount = ResultCount.NONE,
+            path_to_database: str = path_to_database):
+    """
+    Runs a statement with its values bound to ? placeholders. Values are never put in the sql text, so quotes in a
+    value can not break the statement and the prepared statement is reused the next time the same sql runs.
+
+    :param query: sql statement ex. "SELECT Value FROM Settings WHERE Setting_name = ?"
+    :param parameters: values for the placeholders ex. ("zipcode",)
+    :param result_count: the number of results that should be returned
+    :param path_to_database: name of the database to connect to
+    :return: list of results from the query
+    """
+
+    return _execute_query(path_to_database, query, result_count, parameters)
+
+
+def execute_many(query: str, rows, path_to_database: str = path_to_database) -> int:
+    """
+    Runs one statement for a list of rows. The statement is prepared once and all of the rows are written in one
+    transaction. If one row fails none of them are stored.
+
+    :param query: sql statement with ? placeholders
+    :param rows: a tuple of values for each row
+    :param path_to_database: name of the database to connect to
+    :return: number of rows changed (0 if the statement failed)
+    """
+
+    log.getLogger().debug("STARTING execute_many 'Database'")
+
+    row_count = 0
+    try:
+        row_count = get_connection_manager(path_to_database).execute_many(query, rows)
+
+    except Exception as ex:
+
+        print(ex)
+        log.getLogger().critical(f"CRITICAL: Could not execute the query '{query}' on the '{path_to_database}' database.")
+
+    log.getLogger().debug("DONE execute_many 'Database'")
+
+    return row_count
+
+
+def insert_many(table_name: str, columns: list, rows, path_to_database: str = path_to_database) -> int:
+    """
+    Inserts many rows into a table in one transaction. Used for large loads like weather forecasts and imports.
+
+    :param table_name: table name to insert into
+    :param columns: names of the columns being inserted
+    :param rows: a tuple of values for each row in the same order as columns
+    :param path_to_database: name of the database to connect to
+    :return: number of rows inserted (or queued if a database writer is running)
+    """
+
+    query = build_insert_query(table_name, tuple(columns))
+
+    writer = get_database_writer(path_to_database)
+    if writer is not None:
+        rows = list(rows)
+        writer.write_many(query, rows)
+        return len(rows)
+
+    return execute_many(query, rows, path_to_database)
+
+
 def insert_data(table_name: str, data: dict, path_to_database: str = path_to_database) -> None:
     """
     Function to insert data into a table
@@ -135,21 +233,21 @@ def insert_data(table_name: str, data: dict, path_to_database: str = path_to_dat
 
     log.getLogger().debug("STARTING insert_data 'Database'")
 
-    keys = data.keys()
-    values = []
-    for key in keys:
-        values.append(data[key])
+    query = build_insert_query(table_name, tuple(data.keys()))
 
-    formatted_keys = format_list(keys, False, True)
-    formatted_values = format_list(values, True, True)
-    query = f"INSERT INTO {table_name} {formatted_keys} VALUES {formatted_values}"
-    _execute_query(path_to_database, query, ResultCount.NONE)
+    # Sent to the writer thread if one is running so the caller does not wait for the commit
+    writer = get_database_writer(path_to_database)
+    if writer is not None:
+        writer.write(query, tuple(data.values()))
+
+    else:
+        execute(query, tuple(data.values()), path_to_database=path_to_database)
 
     log.getLogger().debug("DONE insert_data 'Database'")
 
 
 def select_data(table_name: str, result_count: ResultCount, columns: list = None, order_by: str = None,
-                path_to_database: str = path_to_database, where: str = None):
+                path_to_database: str = path_to_database, where: str = None, parameters=()):
     """
     Basic select query
 
@@ -158,6 +256,8 @@ def select_data(table_name: str, result_count: ResultCount, columns: list = None
     :param columns: columns to retrieve data from (Leave as None to select all columns)
     :param order_by: how to order the rows format is "ORDER BY column_name [ASC|DESC]"
     :param path_to_database: name of database to connect to
+    :param where: condition for the rows. Use ? for values ex. "Setting_name = ?"
+    :param parameters: values for the ? placeholders in where
     :return: all the rows in the given columns
     """
 
@@ -179,7 +279,7 @@ def select_data(table_name: str, result_count: ResultCount, columns: list = None
 
     log.getLogger().debug("DONE select_data 'Database'")
 
-    return _execute_query(path_to_database, query, result_count)
+    return execute(query, parameters, result_count, path_to_database)
 
 
 def update_output_state(output_name:str, output_state: bool, path_to_database: str = path_to_database):
@@ -192,19 +292,27 @@ def update_output_state(output_name:str, output_state: bool, path_to_database: s
     :return: Updates the status of the output object in the database
     """
 
-    update = f"UPDATE output_states " \
-             f"SET date_time = '{datetime.now().strftime('%m/%d/%Y %H:%M:%S')}', output_state = '{str(output_state)}'" \
-             f"WHERE output_name = '{output_name}'"
-    return _execute_query(path_to_database, update, ResultCount.NONE)
+    update = "UPDATE output_states SET date_time = ?, output_state = ? WHERE output_name = ?"
+    parameters = (datetime.now().strftime('%m/%d/%Y %H:%M:%S'), str(output_state), output_name)
 
+    # Only the latest state of an output matters so queued updates for the same output can replace each other
+    writer = get_database_writer(path_to_database)
+    if writer is not None:
+        return writer.write(update, parameters, key=("output_states", output_name))
 
-def _execute_query(path_to_database: str, query: str, result_count: ResultCount) -> list:
+    return execute(update, parameters, path_to_database=path_to_database)
+
+
+def _execute_query(path_to_database: str, query: str, result_count: ResultCount, parameters=()) -> list:
     """
-    Used to execute sqlite queries
+    Used to execute sqlite queries. The connections to each database stay open between queries (see
+    framework.database.connection). Queries that only read run on a connection owned by the calling thread so they do
+    not wait for writes.
 
     :param path_to_database: name of the database to connect to
     :param query: sqlite query to execute
     :param result_count: the number of results that should be returned by the method
+    :param parameters: values for the ? placeholders in the query
     :return: list of results from a query
     """
 
@@ -213,64 +321,36 @@ def _execute_query(path_to_database: str, query: str, result_count: ResultCount)
     result = None
     try:
 
-        # Connect to database
-        connection = sqlite3.connect(path_to_database)
-        cursor = connection.cursor()
-
-        for try_count in range(0, 2):
-            try:
-
-                # Execute the query
-                cursor.execute(query)
-                break
-
-            except sqlite3.OperationalError as ex:
-                log.getLogger().critical("FAILED to _execute_query()")
-                print(ex)
-                time.sleep(.001)
-
-        if result_count == ResultCount.ALL:
-            result = cursor.fetchall()
-
-        elif result_count == ResultCount.ONE:
-            result = cursor.fetchone()
-
-        elif result_count is ResultCount.NONE or result_count is None:
-
-            # User does not care about return value so return None
-            result = None
-
-        else:
+        if result_count is not None and not isinstance(result_count, ResultCount):
             raise ValueError("Result count for queries must be 'ALL', 'ONE' or None")
 
-        # Save the changes and close the connection
-        connection.commit()
-        cursor.close()
-        connection.close()
+        fetch = None if result_count is None else result_count.value
+        result = get_connection_manager(path_to_database).execute(query, parameters, fetch)
 
     except Exception as ex:
 
         print(ex)
         log.getLogger().critical(f"CRITICAL: Could not execute the query '{query}' on the '{path_to_database}' database.")
 
-    log.getLogger().debug(f"DONE get_sensor_reading 'Database'")
+    log.getLogger().debug(f"DONE _execute_query 'Database'")
 
     return result
 
 
 def get_sensor_reading(table_name: str, columns: list, path_to_database: str = path_to_database) -> list:
     """
-    Retrieves the most recent value in the database for the target sensor
+    Retrieves the most recent value in the database for the target sensor. Rows are ordered by the indexed 'timestamp'
+    column so this is an index lookup no matter how many rows the table has.
 
     :param path_to_database: name of database to connect to
     :param table_name: name of table to get sensor value from
-    :param columns: the name of sensor to get the value of
-    :return: a list with the date and time then the retrieved sensor value
+    :param columns: the name of sensor to get the value of ex. ["timestamp", "water_temp"]
+    :return: a list with the values of the columns for the newest row
     """
 
     log.getLogger().debug(f"STARTING get_sensor_reading 'Database'")
 
-    query_result = select_data(table_name, ResultCount.ONE, columns, "ORDER BY date_time DESC LIMIT 1",
+    query_result = select_data(table_name, ResultCount.ONE, columns, "ORDER BY timestamp DESC LIMIT 1",
                                path_to_database=path_to_database)
 
     log.getLogger().debug(f"DONE get_sensor_reading 'Database'")
@@ -278,27 +358,269 @@ def get_sensor_reading(table_name: str, columns: list, path_to_database: str = p
     return query_result
 
 
-def purge_old_data(table_name: str, max_age: int, path_to_database: str = path_to_database) -> None:
+def get_sensor_readings_between(table_name: str, columns: list, start_timestamp: int, end_timestamp: int,
+                                path_to_database: str = path_to_database) -> list:
     """
-    Delete rows that are older than the given number of days
+    Retrieves the rows of a sensor table in a time range, oldest first. Uses the index on 'timestamp'.
+
+    :param table_name: name of table to get sensor values from
+    :param columns: columns to get ex. ["timestamp", "water_temp"]
+    :param start_timestamp: seconds since epoch of the first row to include
+    :param end_timestamp: seconds since epoch of the last row to include
+    :param path_to_database: name of database to connect to
+    :return: the rows in the range
+    """
+
+    return select_data(table_name, ResultCount.ALL, columns, "ORDER BY timestamp", path_to_database,
+                       where="timestamp BETWEEN ? AND ?", parameters=(start_timestamp, end_timestamp))
+
+
+def purge_old_data(table_name: str, max_age: int, path_to_database: str = path_to_database,
+                   timestamp_column: str = "timestamp", batch_size: int = 500, max_lock_seconds: float = 0.005,
+                   batch_pause: float = 0.05) -> int:
+    """
+    Delete rows that are older than the given number of days (see delete_rows_before)
 
     :param path_to_database: name of the database to connect to
     :param table_name: name of table to check for old rows
     :param max_age: max number of days since inserting a row before purging
-    :return: None
+    :param timestamp_column: indexed column holding the time of each row in seconds since epoch
+    :param batch_size: max number of rows to delete in each transaction
+    :param max_lock_seconds: target for how long each batch holds the write lock
+    :param batch_pause: seconds to wait between batches
+    :return: number of rows deleted
     """
 
     log.getLogger().debug(f"STARTING purge_old_data 'Database'")
 
-    oldest_date = datetime.now()
-    oldest_date = oldest_date - timedelta(days=max_age)
-    oldest_date = oldest_date.strftime("%m/%d/%Y %H:%M:%S")
-
-    update = f"DELETE FROM {table_name} WHERE date_time < '{oldest_date}'"
-    _execute_query(path_to_database, update, ResultCount.NONE)
+    oldest_timestamp = int((datetime.now() - timedelta(days=max_age)).timestamp())
+    deleted_count = delete_rows_before(table_name, oldest_timestamp, path_to_database, timestamp_column, batch_size,
+                                       max_lock_seconds, batch_pause)
 
     log.getLogger().debug(f"DONE purge_old_data 'Database'")
 
+    return deleted_count
+
+
+def delete_rows_before(table_name: str, oldest_timestamp: int, path_to_database: str = path_to_database,
+                       timestamp_column: str = "timestamp", batch_size: int = 500, max_lock_seconds: float = 0.005,
+                       batch_pause: float = 0.05) -> int:
+    """
+    Delete rows older than a time. The rows are deleted in small batches, each in its own short transaction, with a
+    pause between them so the writer thread can commit new readings while a large purge runs. A batch that holds the
+    write lock longer than max_lock_seconds halves the batch size.
+
+    :param table_name: name of table to delete rows from
+    :param oldest_timestamp: rows with a time before this (seconds since epoch) are deleted
+    :param path_to_database: name of the database to connect to
+    :param timestamp_column: indexed column holding the time of each row in seconds since epoch
+    :param batch_size: max number of rows to delete in each transaction
+    :param max_lock_seconds: target for how long each batch holds the write lock
+    :param batch_pause: seconds to wait between batches
+    :return: number of rows deleted
+    """
+
+    # The last row of a batch is found with the index, then everything up to it is deleted. Works for tables without a
+    # rowid like the rollup tables. Rows that share the last value are deleted together so a batch can be a bit larger.
+    find_batch_end = f"SELECT {timestamp_column} FROM {table_name} WHERE {timestamp_column} < ? " \
+                     f"ORDER BY {timestamp_column} LIMIT 1 OFFSET ?"
+    delete = f"DELETE FROM {table_name} WHERE {timestamp_column} < ? AND {timestamp_column} <= ?"
+
+    manager = get_connection_manager(path_to_database)
+    deleted_count = 0
+    current_batch_size = batch_size
+    while True:
+
+        with manager.write_lock:
+
+            start_seconds = time.perf_counter()
+            connection = manager.get_writer()
+            try:
+                batch_end = connection.execute(find_batch_end, (oldest_timestamp, current_batch_size - 1)).fetchone()
+                batch_end = oldest_timestamp if batch_end is None else batch_end[0]
+
+                batch_count = connection.execute(delete, (oldest_timestamp, batch_end)).rowcount
+                connection.commit()
+
+            except Exception as ex:
+                connection.rollback()
+                log.getLogger().critical(f"CRITICAL: Could not purge old rows from '{table_name}'. {ex}")
+                break
+
+            lock_seconds = time.perf_counter() - start_seconds
+
+        deleted_count += batch_count
+        if batch_count < current_batch_size:
+            break
+
+        if lock_seconds > max_lock_seconds and current_batch_size > 1:
+            current_batch_size //= 2
+
+        elif lock_seconds < max_lock_seconds / 4 and current_batch_size < batch_size:
+            current_batch_size = min(current_batch_size * 2, batch_size)
+
+        time.sleep(batch_pause)
+
+    return deleted_count
+
+
+def is_incremental_vacuum(path_to_database: str = path_to_database) -> bool:
+    """
+    Checks if the database is in incremental auto vacuum mode. Only reads the database header.
+
+    :param path_to_database: name of the database to connect to
+    :return: if incremental_vacuum() can give free pages back to the file system
+    """
+
+    # Asked on the writer connection. A reader opened before a VACUUM can still report the old mode.
+    manager = get_connection_manager(path_to_database)
+    with manager.write_lock:
+        mode = manager.get_writer().execute("PRAGMA auto_vacuum").fetchone()[0]
+
+    # 2 = INCREMENTAL
+    return mode == 2
+
+
+def init_incremental_vacuum(path_to_database: str = path_to_database) -> bool:
+    """
+    Makes sure the database is in incremental auto vacuum mode so the space freed by purges can be given back to the
+    file system a few pages at a time with incremental_vacuum(). A database created without it has to be rebuilt once
+    with VACUUM, which locks it while the whole file is copied. This is a one time command run with the controller and
+    the web app stopped ('make incremental-vacuum'), it is never run by the controller.
+
+    :param path_to_database: name of the database to connect to
+    :return: if the database is in incremental auto vacuum mode
+    """
+
+    manager = get_connection_manager(path_to_database)
+    with manager.write_lock:
+
+        connection = manager.get_writer()
+
+        # 2 = INCREMENTAL
+        if connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return True
+
+        log.getLogger().warning(f"Rebuilding '{path_to_database}' to turn on incremental vacuum")
+        try:
+            connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            connection.execute("VACUUM")
+
+        except sqlite3.Error as ex:
+            log.getLogger().critical(f"CRITICAL: Could not turn on incremental vacuum for '{path_to_database}'. {ex}")
+
+        return connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def incremental_vacuum(path_to_database: str = path_to_database, pages_per_step: int = 256,
+                       step_pause: float = 0.05) -> int:
+    """
+    Gives the free pages of the database back to the file system a few at a time so the write lock is only held for a
+    moment at once. Does nothing unless the database is in incremental auto vacuum mode (see init_incremental_vacuum).
+
+    :param path_to_database: name of the database to connect to
+    :param pages_per_step: max number of pages to free in each transaction
+    :param step_pause: seconds to wait between steps
+    :return: number of bytes the database file shrank by
+    """
+
+    manager = get_connection_manager(path_to_database)
+    reclaimed_bytes = 0
+    while True:
+
+        with manager.write_lock:
+
+            connection = manager.get_writer()
+            page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+            if connection.execute("PRAGMA freelist_count").fetchone()[0] == 0:
+                break
+
+            # execute() only runs one step of this pragma, which frees one page. executescript() runs it to the end.
+            connection.executescript(f"PRAGMA incremental_vacuum({int(pages_per_step)})")
+            freed_pages = page_count - connection.execute("PRAGMA page_count").fetchone()[0]
+
+        reclaimed_bytes += freed_pages * page_size
+        if freed_pages == 0:
+            break
+
+        time.sleep(step_pause)
+
+    return reclaimed_bytes
+
+
+# Converts a 'date_time' value ('%m/%d/%Y %H:%M:%S' in local time) to seconds since epoch inside sqlite
+date_time_to_timestamp = "CAST(strftime('%s', substr(date_time, 7, 4) || '-' || substr(date_time, 1, 2) || '-' || " \
+                         "substr(date_time, 4, 2) || ' ' || substr(date_time, 12, 8), 'utc') AS INTEGER)"
+
+
+def init_timestamp_column(table_name: str, path_to_database: str = path_to_database, batch_size: int = 5000) -> int:
+    """
+    Makes sure a sensor table has an indexed 'timestamp' column (seconds since epoch). Tables created before the column
+    existed get it added and their rows are filled in from 'date_time'. The 'date_time' column is kept for the web
+    app. Safe to call every time the table is opened, it does nothing once the table is migrated.
+
+    The rows are migrated in batches, each in its own transaction, so the web app is not locked out for the whole
+    migration on a large table.
+
+    :param table_name: sensor table to migrate
+    :param path_to_database: name of the database to connect to
+    :param batch_size: number of rows to fill in for each transaction
+    :return: number of rows that were filled in
+    """
+
+    log.getLogger().debug(f"STARTING init_timestamp_column 'Database'")
+
+    manager = get_connection_manager(path_to_database)
+    with manager.write_lock:
+
+        connection = manager.get_writer()
+
+        # A partitioned table is a view. Its partitions are created with the column and index.
+        table_type = connection.execute("SELECT type FROM sqlite_master WHERE name = ?", (table_name,)).fetchone()
+        if table_type is not None and table_type[0] == "view":
+            return 0
+
+        column_names = [row[1] for row in connection.execute(f"PRAGMA table_info({table_name})").fetchall()]
+
+        if "timestamp" not in column_names:
+            connection.execute(f"ALTER TABLE {table_name} ADD COLUMN timestamp INTEGER")
+
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_timestamp ON {table_name} (timestamp)")
+        connection.commit()
+
+        # The index covers NULL so this is a quick lookup once the table is migrated
+        first_rowid = connection.execute(f"SELECT MIN(rowid) FROM {table_name} WHERE timestamp IS NULL").fetchone()[0]
+
+    migrated_count = 0
+    if "date_time" in column_names and first_rowid is not None:
+
+        # Walks the table in rowid order so a date_time that can not be converted does not stop the migration
+        find_batch_end = f"SELECT MAX(rowid) FROM (SELECT rowid FROM {table_name} WHERE rowid > ? ORDER BY rowid LIMIT ?)"
+        update = f"UPDATE {table_name} SET timestamp = {date_time_to_timestamp} " \
+                 f"WHERE rowid > ? AND rowid <= ? AND timestamp IS NULL AND {date_time_to_timestamp} IS NOT NULL"
+        last_rowid = first_rowid - 1
+        while True:
+
+            with manager.write_lock:
+
+                connection = manager.get_writer()
+                batch_end = connection.execute(find_batch_end, (last_rowid, batch_size)).fetchone()[0]
+                if batch_end is None:
+                    break
+
+                migrated_count += connection.execute(update, (last_rowid, batch_end)).rowcount
+                connection.commit()
+
+            last_rowid = batch_end
+
+    if migrated_count > 0:
+        log.getLogger().warning(f"Filled in the timestamp of {migrated_count} rows in '{table_name}'")
+
+    log.getLogger().debug(f"DONE init_timestamp_column 'Database'")
+
+    return migrated_count
+
 
 def clear_data_in_table(table_name: str, path_to_database: str = path_to_database):
 
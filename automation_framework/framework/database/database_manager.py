@@ -1,8 +1,10 @@
 from collections import OrderedDict
+from datetime import datetime, timedelta
 import logging as log
 
 
-from framework.database import database
+from framework.database import archive, database, partitions
+from framework.io.actions import action
 from framework.io.io import Io, IoType
 
 
@@ -11,20 +13,111 @@ class DatabaseManager(Io):
     Preforms managerial tasks of the data in the database
     """
 
-    def __init__(self, name: str, actions: OrderedDict, database_name: str, max_data_age: int):
+    def __init__(self, name: str, actions: OrderedDict, path_to_database: str, tables: dict, batch_size: int = 500,
+                 max_lock_seconds: float = 0.005, batch_pause: float = 0.05, incremental_vacuum: bool = True,
+                 vacuum_pages: int = 256, archive_directory: str = "./archives/"):
+        """
+        Purges old rows from the tables in a database and gives the freed space back to the file system.
+
+        :param name: name of the manager
+        :param actions: the method names and the intervals to execute them ex. {"purge_old_data": 3600}
+        :param path_to_database: database to manage
+        :param tables: table name/retention settings.
+            'max_age' number of days to keep rows in the table
+            'timestamp_column' optional, the column holding the time of each row (default 'timestamp')
+            'archive' optional, move old rows to compressed files in archive_directory instead of deleting them
+            'archive_max_age' optional, number of days to keep archive files for (default forever)
+            'partitioned' optional, the table is split into a table for each day or week (see
+            framework.database.partitions). Old partitions are dropped instead of deleting their rows.
+            ex. {"AC_webapp_sensordata": {"max_age": 14, "archive": true, "archive_max_age": 365},
+            "AC_webapp_sensordata_minute": {"max_age": 30, "timestamp_column": "bucket"}}
+        :param batch_size: max number of rows deleted in each transaction
+        :param max_lock_seconds: target for how long each delete holds the write lock
+        :param batch_pause: seconds to wait between deletes so new readings can be written
+        :param incremental_vacuum: give the space freed by a purge back to the file system
+        :param vacuum_pages: max number of pages to free in each transaction
+        :param archive_directory: folder the archive files are written to
+        """
 
         super().__init__(name, IoType.MANGER, actions, [])
-        self.database_name = database_name
-        self.max_data_age = max_data_age
+        self.path_to_database = path_to_database
+        self.tables = tables
+        self.batch_size = batch_size
+        self.max_lock_seconds = max_lock_seconds
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+        self.archive_directory = archive_directory
+
+        # Turning incremental vacuum on rebuilds the whole file so it is left to 'make incremental-vacuum'
+        self.incremental_vacuum = incremental_vacuum and database.is_incremental_vacuum(path_to_database)
+        if incremental_vacuum and not self.incremental_vacuum:
+            log.getLogger().warning(f"'{path_to_database}' is not in incremental vacuum mode so purged space is not "
+                                    f"given back. Stop the controller and run 'make incremental-vacuum' once.")
 
-    def purge_old_sensor_data(self) -> None:
+        # Results of the last purge. Table name/rows deleted and the bytes given back to the file system.
+        self.purged_rows = {}
+        self.reclaimed_bytes = 0
+
+    @action(interval=3600, blocking=True, timeout=300)
+    def purge_old_data(self) -> None:
         """ Purges old data to keep tables from getting to large """
 
-        log.getLogger().debug(f"STARTING purge_old_sensor_data 'Database'")
+        log.getLogger().debug(f"STARTING purge_old_data '{self.name}'")
+
+        for table_name, retention in self.tables.items():
+
+            timestamp_column = retention.get("timestamp_column", "timestamp")
+            if retention.get("partitioned", False):
+
+                oldest_timestamp = int((datetime.now() - timedelta(days=retention["max_age"])).timestamp())
+                archive_directory = self.archive_directory if retention.get("archive", False) else None
+                self.purged_rows[table_name] = partitions.drop_partitions_before(table_name, oldest_timestamp,
+                                                                                 self.path_to_database,
+                                                                                 archive_directory, timestamp_column,
+                                                                                 self.batch_size, self.max_lock_seconds,
+                                                                                 self.batch_pause)
+
+            elif retention.get("archive", False):
+
+                self.purged_rows[table_name] = archive.archive_old_data(table_name, retention["max_age"],
+                                                                        self.archive_directory, self.path_to_database,
+                                                                        timestamp_column, self.batch_size,
+                                                                        self.max_lock_seconds, self.batch_pause)
+
+            else:
+                self.purged_rows[table_name] = database.purge_old_data(table_name, retention["max_age"],
+                                                                       self.path_to_database, timestamp_column,
+                                                                       self.batch_size, self.max_lock_seconds,
+                                                                       self.batch_pause)
+
+            if retention.get("archive", False) and "archive_max_age" in retention:
+                archive.delete_old_archives(table_name, retention["archive_max_age"], self.archive_directory)
+
+        self.reclaimed_bytes = 0
+        if self.incremental_vacuum:
+            self.reclaimed_bytes = database.incremental_vacuum(self.path_to_database, self.vacuum_pages,
+                                                               self.batch_pause)
+
+        log.getLogger().warning(f"Purged or archived {sum(self.purged_rows.values())} rows {self.purged_rows} and "
+                                f"reclaimed {self.reclaimed_bytes} bytes from '{self.path_to_database}'")
+
+        log.getLogger().debug(f"DONE purge_old_data '{self.name}'")
+
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file. The new retention settings are used on the next purge.
 
-        # Rows more than 14 days should not be kept. Performance suffers greatly.
-        database.purge_old_data(self.database_name, "sensors", self.max_data_age)
+        :param data: the new contents of the json file
+        :return: if the object needs to be rescheduled
+        """
 
-        log.getLogger().debug(f"DONE purge_old_sensor_data 'Database'")
+        rescheduled = super().apply_config(data)
 
+        self.tables = data["tables"]
+        self.batch_size = data["batch_size"]
+        self.max_lock_seconds = data["max_lock_seconds"]
+        self.batch_pause = data["batch_pause"]
+        self.vacuum_pages = data["vacuum_pages"]
+        self.archive_directory = data["archive_directory"]
 
+        return rescheduled
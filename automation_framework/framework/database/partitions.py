@@ -0,0 +1,379 @@
+"""
+Optional partitioned layout for sensor tables. The rows of each day (or week) go in their own table named after the
+logical table and the start of its period ex. 'AC_webapp_sensordata_d20261018' or 'AC_webapp_sensordata_w20261012'. A
+view with the name of the logical table joins them with UNION ALL so the web app and any query by that name still see
+one table.
+
+Retention drops whole partitions instead of deleting rows one at a time, which takes a moment no matter how many rows
+they hold and leaves no free pages behind. The partition being written to stays small so it and its index stay in the
+page cache.
+
+A table that existed before it was partitioned is renamed to '<table>_legacy' and stays part of the view. Its rows are
+purged row by row as they age out and the table is dropped once it is empty.
+
+The view is always rebuilt from the partitions found in the database so every process sees the same list. Sqlite allows
+at most 500 tables in one UNION ALL, more than a year of daily partitions.
+"""
+
+import logging as log
+import re
+from datetime import date, datetime, timedelta
+
+from framework.database import archive, database
+from framework.database.connection import get_connection_manager
+
+# Period name/(letter used in the partition names, days in each partition)
+periods = {"day": ("d", 1), "week": ("w", 7)}
+period_days = {letter: days for letter, days in periods.values()}
+
+
+def get_period_start(timestamp: float, period: str) -> date:
+    """
+    :param timestamp: seconds since epoch
+    :param period: 'day' or 'week'
+    :return: the local day the partition holding the time starts on. Weeks start on Monday.
+    """
+
+    day = datetime.fromtimestamp(timestamp).date()
+    if period == "week":
+        day -= timedelta(days=day.weekday())
+
+    return day
+
+
+def day_to_timestamp(day: date) -> int:
+    """ Seconds since epoch of local midnight at the start of a day """
+
+    return int(datetime(day.year, day.month, day.day).timestamp())
+
+
+def get_partition_name(table_name: str, period: str, start: date) -> str:
+
+    return f"{table_name}_{periods[period][0]}{start.strftime('%Y%m%d')}"
+
+
+def get_legacy_table_name(table_name: str) -> str:
+
+    return f"{table_name}_legacy"
+
+
+def get_partitions(table_name: str, path_to_database: str = database.path_to_database) -> list:
+    """
+    Finds the partitions of a table
+
+    :param table_name: logical table
+    :param path_to_database: name of the database to connect to
+    :return: (start timestamp, end timestamp, partition name) for each partition, oldest first
+    """
+
+    pattern = re.compile(rf"^{re.escape(table_name)}_([{''.join(period_days)}])(\d{{8}})$")
+    names = database.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND substr(name, 1, ?) = ?",
+                             (len(table_name) + 1, table_name + "_"), database.ResultCount.ALL, path_to_database)
+
+    partitions = []
+    for (name,) in names or []:
+
+        match = pattern.match(name)
+        if match is not None:
+            start = datetime.strptime(match.group(2), "%Y%m%d").date()
+            end = start + timedelta(days=period_days[match.group(1)])
+            partitions.append((day_to_timestamp(start), day_to_timestamp(end), name))
+
+    return sorted(partitions)
+
+
+def get_table_type(table_name: str, path_to_database: str = database.path_to_database):
+    """
+    :return: 'table', 'view' or None if nothing has the name
+    """
+
+    result = database.execute("SELECT type FROM sqlite_master WHERE name = ?", (table_name,),
+                              database.ResultCount.ONE, path_to_database)
+
+    return None if result is None else result[0]
+
+
+def rebuild_view(table_name: str, columns: list, path_to_database: str = database.path_to_database,
+                 drop_tables: tuple = ()) -> None:
+    """
+    Replaces the view of a partitioned table with one that reads every partition and the legacy table. Done in one
+    transaction so a reader never finds the view missing or pointing at a dropped table. Hold the write lock of the
+    database while calling this.
+
+    :param table_name: logical table
+    :param columns: columns of the view. A table without one of them reads it as NULL.
+    :param path_to_database: name of the database to connect to
+    :param drop_tables: partitions to drop in the same transaction
+    :return: None
+    """
+
+    connection = get_connection_manager(path_to_database).get_writer()
+
+    sources = [name for start, end, name in get_partitions(table_name, path_to_database)]
+    legacy_table_name = get_legacy_table_name(table_name)
+    if get_table_type(legacy_table_name, path_to_database) == "table":
+        sources.insert(0, legacy_table_name)
+
+    sources = [source for source in sources if source not in drop_tables]
+
+    selects = []
+    for source in sources:
+
+        source_columns = [row[1] for row in connection.execute(f"PRAGMA table_info({source})").fetchall()]
+        selects.append("SELECT " + ", ".join(column if column in source_columns else f"NULL AS {column}"
+                                             for column in columns) + f" FROM {source}")
+
+    # A view has to select from something. With no partitions yet it is an empty select of the columns.
+    if len(selects) == 0:
+        selects.append("SELECT " + ", ".join(f"NULL AS {column}" for column in columns) + " WHERE 0")
+
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute(f"DROP VIEW IF EXISTS {table_name}")
+        for name in drop_tables:
+            connection.execute(f"DROP TABLE {name}")
+
+        connection.execute(f"CREATE VIEW {table_name} AS " + " UNION ALL ".join(selects))
+        connection.commit()
+
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def get_view_columns(table_name: str, path_to_database: str = database.path_to_database) -> list:
+
+    column_info = database.execute(f"PRAGMA table_info({table_name})", result_count=database.ResultCount.ALL,
+                                   path_to_database=path_to_database)
+
+    return [column[1] for column in column_info or []]
+
+
+def drop_partitions_before(table_name: str, oldest_timestamp: int, path_to_database: str = database.path_to_database,
+                           archive_directory: str = None, timestamp_column: str = "timestamp", batch_size: int = 500,
+                           max_lock_seconds: float = 0.005, batch_pause: float = 0.05) -> int:
+    """
+    Drops the partitions that only hold rows older than a time. Rows of the legacy table are deleted in batches and the
+    table is dropped once it is empty.
+
+    :param table_name: logical table
+    :param oldest_timestamp: rows before this time (seconds since epoch) are removed
+    :param path_to_database: name of the database to connect to
+    :param archive_directory: write the rows to archive files before dropping them (None to not archive)
+    :param timestamp_column: column holding the time of each row in seconds since epoch
+    :param batch_size: max number of legacy rows to delete in each transaction
+    :param max_lock_seconds: target for how long each legacy delete holds the write lock
+    :param batch_pause: seconds to wait between legacy deletes
+    :return: number of rows removed
+    """
+
+    log.getLogger().debug(f"STARTING drop_partitions_before '{table_name}'")
+
+    manager = get_connection_manager(path_to_database)
+    removed_count = 0
+
+    legacy_table_name = get_legacy_table_name(table_name)
+    if get_table_type(legacy_table_name, path_to_database) == "table":
+
+        if archive_directory is not None:
+            archive.archive_rows(legacy_table_name, table_name, 0, oldest_timestamp, archive_directory,
+                                 path_to_database, timestamp_column)
+
+        removed_count += database.delete_rows_before(legacy_table_name, oldest_timestamp, path_to_database,
+                                                     timestamp_column, batch_size, max_lock_seconds, batch_pause)
+
+        # Rows without a timestamp can not age out. They are kept until the table is empty.
+        remaining = database.execute(f"SELECT count(*) FROM {legacy_table_name}",
+                                     result_count=database.ResultCount.ONE, path_to_database=path_to_database)
+        if remaining == (0,):
+
+            with manager.write_lock:
+                rebuild_view(table_name, get_view_columns(table_name, path_to_database), path_to_database,
+                             (legacy_table_name,))
+
+            log.getLogger().warning(f"Dropped the empty table '{legacy_table_name}'")
+
+    for start, end, name in get_partitions(table_name, path_to_database):
+
+        if end > oldest_timestamp:
+            break
+
+        if archive_directory is not None:
+            archive.archive_rows(name, table_name, start, end, archive_directory, path_to_database, timestamp_column)
+
+        with manager.write_lock:
+
+            connection = manager.get_writer()
+            removed_count += connection.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+
+            rebuild_view(table_name, get_view_columns(table_name, path_to_database), path_to_database, (name,))
+
+        log.getLogger().warning(f"Dropped partition '{name}'")
+
+    log.getLogger().debug(f"DONE drop_partitions_before '{table_name}'")
+
+    return removed_count
+
+
+class PartitionedTable:
+
+    def __init__(self, table_name: str, column_info: dict, can_be_null: bool, period: str = "day",
+                 path_to_database: str = database.path_to_database):
+        """
+        Writes the rows of a table to a partition for each period and keeps the view of the logical table up to date.
+        A table with the logical name that already exists is renamed to the legacy table.
+
+        :param table_name: logical table
+        :param column_info: name and data type for each column. A 'timestamp' INTEGER column is added if it is missing.
+        :param can_be_null: if the columns can be null
+        :param period: 'day' or 'week'
+        :param path_to_database: name of the database to connect to
+        """
+
+        if period not in periods:
+            raise ValueError(f"Partition period should be one of {list(periods)} not '{period}'")
+
+        self.table_name = table_name
+        self.can_be_null = can_be_null
+        self.period = period
+        self.path_to_database = path_to_database
+
+        # An 'id' column is the row id of its partition so lookups by id stay fast. Ids are handed out here so they keep
+        # counting up across partitions.
+        self.column_info = dict(column_info)
+        if "id" in self.column_info:
+            self.column_info["id"] = "INTEGER PRIMARY KEY"
+
+        if "timestamp" not in self.column_info:
+            self.column_info["timestamp"] = "INTEGER"
+
+        self.columns = list(self.column_info)
+        self.created_partitions = set()
+
+        manager = get_connection_manager(path_to_database)
+        with manager.write_lock:
+
+            legacy_table_name = get_legacy_table_name(table_name)
+            drop_tables = ()
+            if get_table_type(table_name, path_to_database) == "table":
+
+                database.init_timestamp_column(table_name, path_to_database)
+                connection = manager.get_writer()
+                connection.execute(f"ALTER TABLE {table_name} RENAME TO {legacy_table_name}")
+
+                # A table created just before being partitioned has nothing to keep
+                if connection.execute(f"SELECT count(*) FROM {legacy_table_name}").fetchone()[0] == 0:
+                    drop_tables = (legacy_table_name,)
+
+                else:
+                    log.getLogger().warning(f"Partitioning '{table_name}'. Existing rows are kept in "
+                                            f"'{legacy_table_name}'.")
+
+            rebuild_view(table_name, self.columns, path_to_database, drop_tables)
+
+        self.next_id = None
+        if "id" in self.column_info:
+            self.next_id = self._find_max_id() + 1
+
+    def _find_max_id(self) -> int:
+        """ Largest id in any partition or the legacy table. Read from each table so it uses their indexes. """
+
+        sources = [name for start, end, name in get_partitions(self.table_name, self.path_to_database)]
+        sources.append(get_legacy_table_name(self.table_name))
+
+        max_id = 0
+        for source in sources:
+
+            if get_table_type(source, self.path_to_database) == "table":
+                result = database.execute(f"SELECT max(id) FROM {source}", result_count=database.ResultCount.ONE,
+                                          path_to_database=self.path_to_database)
+                if result is not None and result[0] is not None:
+                    max_id = max(max_id, result[0])
+
+        return max_id
+
+    def get_partition(self, timestamp: float) -> str:
+        """
+        Gets the partition a row belongs in, creating it the first time
+
+        :param timestamp: time of the row in seconds since epoch
+        :return: name of the partition
+        """
+
+        name = get_partition_name(self.table_name, self.period, get_period_start(timestamp, self.period))
+        if name in self.created_partitions:
+            return name
+
+        manager = get_connection_manager(self.path_to_database)
+        with manager.write_lock:
+
+            if get_table_type(name, self.path_to_database) is None:
+
+                database.create_table(name, self.column_info, self.can_be_null, self.path_to_database)
+                database.execute(f"CREATE INDEX IF NOT EXISTS {name}_timestamp ON {name} (timestamp)",
+                                 path_to_database=self.path_to_database)
+                rebuild_view(self.table_name, self.columns, self.path_to_database)
+                log.getLogger().warning(f"Created partition '{name}'")
+
+        self.created_partitions.add(name)
+
+        return name
+
+    def insert(self, data: dict) -> None:
+        """
+        Inserts a row in the partition for its 'timestamp'. Sent to the writer thread if one is running.
+
+        :param data: column name/value. Must have a 'timestamp'.
+        :return: None
+        """
+
+        partition = self.get_partition(data["timestamp"])
+
+        if self.next_id is not None and data.get("id") is None:
+            data = dict(data, id=self.next_id)
+            self.next_id += 1
+
+        database.insert_data(partition, data, self.path_to_database)
+
+    def get_sensor_reading(self, columns: list):
+        """
+        Same result as database.get_sensor_reading() but only reads the newest partition that has rows. Sorting the view
+        would read every partition.
+
+        :param columns: columns to get ex. ["timestamp", "water_temp"]
+        :return: the values of the columns for the newest row or None if there are no rows
+        """
+
+        sources = [name for start, end, name in reversed(get_partitions(self.table_name, self.path_to_database))]
+        if get_table_type(get_legacy_table_name(self.table_name), self.path_to_database) == "table":
+            sources.append(get_legacy_table_name(self.table_name))
+
+        for source in sources:
+
+            result = database.get_sensor_reading(source, columns, self.path_to_database)
+            if result is not None:
+                return result
+
+        return None
+
+    def get_sensor_readings_between(self, columns: list, start_timestamp: int, end_timestamp: int) -> list:
+        """
+        Same result as database.get_sensor_readings_between() but only reads the partitions that overlap the range
+
+        :param columns: columns to get ex. ["timestamp", "water_temp"]
+        :param start_timestamp: seconds since epoch of the first row to include
+        :param end_timestamp: seconds since epoch of the last row to include
+        :return: the rows in the range, oldest first
+        """
+
+        sources = [name for start, end, name in get_partitions(self.table_name, self.path_to_database)
+                   if start <= end_timestamp and end > start_timestamp]
+        if get_table_type(get_legacy_table_name(self.table_name), self.path_to_database) == "table":
+            sources.insert(0, get_legacy_table_name(self.table_name))
+
+        rows = []
+        for source in sources:
+            rows.extend(database.get_sensor_readings_between(source, columns, start_timestamp, end_timestamp,
+                                                             self.path_to_database) or [])
+
+        return rows
@@ -0,0 +1,279 @@
+"""
+Per-minute, per-hour and per-day summaries (min, max, mean, count and last value) of the numeric columns of a sensor
+table. They are updated as each reading is stored instead of being computed from the raw rows when they are needed, so
+long range queries and graphs read a few hundred summary rows instead of scanning the raw table, and the history is kept
+after the raw rows are purged.
+
+Each resolution has its own table named after the sensor table ex. 'AC_webapp_sensordata_hour' with one row for each
+bucket and column:
+    bucket          start of the minute/hour/day in seconds since epoch (days start at local midnight)
+    column_name     sensor column ex. 'water_temp'
+    min_value, max_value, sum_value, count_value, last_value, last_timestamp
+
+The mean is sum_value / count_value. Sums and counts are stored instead of the mean so a new reading, or a summary of
+many readings, can be merged into a bucket with one UPSERT.
+"""
+
+import logging as log
+import time
+
+from framework.database import database
+from framework.database.connection import get_connection_manager
+from framework.database.writer import get_database_writer
+
+# Resolution name/bucket length in seconds
+resolutions = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Start of a bucket calculated inside sqlite. Matches get_bucket().
+bucket_expressions = {"minute": "timestamp - timestamp % 60",
+                      "hour": "timestamp - timestamp % 3600",
+                      "day": "CAST(strftime('%s', timestamp, 'unixepoch', 'localtime', 'start of day', 'utc') AS INTEGER)"}
+
+# Merges a new summary into the one already stored for its bucket. Every expression on the right uses the stored row
+# as it was before the update.
+merge_query = "ON CONFLICT (bucket, column_name) DO UPDATE SET " \
+              "min_value = min(min_value, excluded.min_value), " \
+              "max_value = max(max_value, excluded.max_value), " \
+              "sum_value = sum_value + excluded.sum_value, " \
+              "count_value = count_value + excluded.count_value, " \
+              "last_value = CASE WHEN excluded.last_timestamp >= last_timestamp " \
+              "THEN excluded.last_value ELSE last_value END, " \
+              "last_timestamp = max(last_timestamp, excluded.last_timestamp)"
+
+# Rows of raw readings summarised in each transaction while back filling
+default_backfill_batch_size = 5000
+
+
+def get_rollup_table_name(table_name: str, resolution: str) -> str:
+    """
+    :param table_name: sensor table ex. 'AC_webapp_sensordata'
+    :param resolution: 'minute', 'hour' or 'day'
+    :return: name of the summary table ex. 'AC_webapp_sensordata_hour'
+    """
+
+    if resolution not in resolutions:
+        raise ValueError(f"Resolution should be one of {list(resolutions)} not '{resolution}'")
+
+    return f"{table_name}_{resolution}"
+
+
+def get_bucket(timestamp: float, resolution: str) -> int:
+    """
+    Finds the bucket a reading belongs to
+
+    :param timestamp: time of the reading in seconds since epoch
+    :param resolution: 'minute', 'hour' or 'day'
+    :return: start of the bucket in seconds since epoch
+    """
+
+    timestamp = int(timestamp)
+    if resolution == "day":
+
+        # Days follow the local clock so a day of readings matches the day shown by the web app
+        local_time = time.localtime(timestamp)
+        return int(time.mktime((local_time.tm_year, local_time.tm_mon, local_time.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+    return timestamp - timestamp % resolutions[resolution]
+
+
+def get_numeric_columns(column_info: dict) -> list:
+    """
+    :param column_info: column name/data type of a sensor table ex. {"date_time": "TEXT", "water_temp": "REAL"}
+    :return: the columns that can be summarised ex. ["water_temp"]
+    """
+
+    return [column for column, data_type in column_info.items()
+            if data_type in ("REAL", "INTEGER") and column != "timestamp"]
+
+
+def init_rollup_tables(table_name: str, columns: list, path_to_database: str = database.path_to_database,
+                       batch_size: int = default_backfill_batch_size) -> None:
+    """
+    Creates the summary tables of a sensor table. The first time they are created the rows already in the sensor table
+    are summarised into them, in batches so the web app is not locked out while a large table is back filled. Safe to
+    call every time the table is opened. A back fill that was interrupted continues where it stopped.
+
+    :param table_name: sensor table to summarise
+    :param columns: numeric columns to summarise
+    :param path_to_database: name of the database to connect to
+    :param batch_size: number of sensor rows to summarise in each transaction
+    :return: None
+    """
+
+    log.getLogger().debug(f"STARTING init_rollup_tables '{table_name}'")
+
+    manager = get_connection_manager(path_to_database)
+    with manager.write_lock:
+
+        connection = manager.get_writer()
+        for resolution in resolutions:
+
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {get_rollup_table_name(table_name, resolution)} ("
+                               f"bucket INTEGER NOT NULL, column_name TEXT NOT NULL, "
+                               f"min_value REAL, max_value REAL, sum_value REAL, count_value INTEGER, "
+                               f"last_value REAL, last_timestamp INTEGER, "
+                               f"PRIMARY KEY (bucket, column_name)) WITHOUT ROWID")
+
+        # Rows up to end_rowid were stored before the summaries existed. Rows after it are summarised as they arrive.
+        connection.execute("CREATE TABLE IF NOT EXISTS rollup_backfill "
+                           "(table_name TEXT PRIMARY KEY, last_rowid INTEGER, end_rowid INTEGER)")
+        connection.execute(f"INSERT OR IGNORE INTO rollup_backfill (table_name, last_rowid, end_rowid) "
+                           f"SELECT ?, 0, coalesce(max(rowid), 0) FROM {table_name}", (table_name,))
+        connection.commit()
+
+        last_rowid, end_rowid = connection.execute("SELECT last_rowid, end_rowid FROM rollup_backfill "
+                                                   "WHERE table_name = ?", (table_name,)).fetchone()
+
+    if last_rowid < end_rowid:
+        backfill_rollups(table_name, columns, last_rowid, end_rowid, path_to_database, batch_size)
+
+    log.getLogger().debug(f"DONE init_rollup_tables '{table_name}'")
+
+
+def build_backfill_query(table_name: str, column: str, resolution: str) -> str:
+    """
+    Summarises a range of sensor rows (rowid > ? AND rowid <= ?) and merges them into a summary table. The last value of
+    each bucket is found with a window function because a bare column next to both min() and max() is not defined.
+
+    :param table_name: sensor table
+    :param column: column to summarise
+    :param resolution: 'minute', 'hour' or 'day'
+    :return: the query
+    """
+
+    return f"INSERT INTO {get_rollup_table_name(table_name, resolution)} " \
+           f"(bucket, column_name, min_value, max_value, sum_value, count_value, last_value, last_timestamp) " \
+           f"SELECT bucket, '{column}', min(value), max(value), sum(value), count(value), last, max(timestamp) FROM (" \
+           f"SELECT {bucket_expressions[resolution]} AS bucket, {column} AS value, timestamp, " \
+           f"last_value({column}) OVER (PARTITION BY {bucket_expressions[resolution]} ORDER BY timestamp " \
+           f"ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS last " \
+           f"FROM {table_name} WHERE rowid > ? AND rowid <= ? AND timestamp IS NOT NULL AND {column} IS NOT NULL) " \
+           f"WHERE true GROUP BY bucket {merge_query}"
+
+
+def backfill_rollups(table_name: str, columns: list, last_rowid: int, end_rowid: int,
+                     path_to_database: str = database.path_to_database,
+                     batch_size: int = default_backfill_batch_size) -> None:
+    """
+    Summarises the sensor rows that were stored before the summary tables existed. Each batch and the progress are
+    committed together so an interrupted back fill never counts a row twice.
+
+    :param table_name: sensor table
+    :param columns: numeric columns to summarise
+    :param last_rowid: rowid of the last row already summarised
+    :param end_rowid: rowid of the last row to summarise
+    :param path_to_database: name of the database to connect to
+    :param batch_size: number of sensor rows to summarise in each transaction
+    :return: None
+    """
+
+    log.getLogger().warning(f"Summarising rows {last_rowid + 1} to {end_rowid} of '{table_name}'")
+
+    queries = [build_backfill_query(table_name, column, resolution) for resolution in resolutions for column in columns]
+    manager = get_connection_manager(path_to_database)
+    while last_rowid < end_rowid:
+
+        batch_end = min(last_rowid + batch_size, end_rowid)
+        with manager.write_lock:
+
+            connection = manager.get_writer()
+            try:
+                for query in queries:
+                    connection.execute(query, (last_rowid, batch_end)).close()
+
+                connection.execute("UPDATE rollup_backfill SET last_rowid = ? WHERE table_name = ?",
+                                   (batch_end, table_name)).close()
+                connection.commit()
+
+            except Exception:
+                connection.rollback()
+                raise
+
+        last_rowid = batch_end
+
+    log.getLogger().warning(f"DONE summarising the rows of '{table_name}'")
+
+
+def build_update_query(table_name: str, resolution: str) -> str:
+    """
+    :param table_name: sensor table
+    :param resolution: 'minute', 'hour' or 'day'
+    :return: UPSERT that merges one reading into its bucket
+    """
+
+    return f"INSERT INTO {get_rollup_table_name(table_name, resolution)} " \
+           f"(bucket, column_name, min_value, max_value, sum_value, count_value, last_value, last_timestamp) " \
+           f"VALUES (?, ?, ?, ?, ?, 1, ?, ?) {merge_query}"
+
+
+def build_update_rows(values: dict, columns: list, timestamp: float, resolution: str) -> list:
+    """
+    :param values: column name/value of one reading. Values can be text ex. '70.5'.
+    :param columns: numeric columns to summarise
+    :param timestamp: time of the reading in seconds since epoch
+    :param resolution: 'minute', 'hour' or 'day'
+    :return: the parameters of the update query for each column of the reading that has a number
+    """
+
+    bucket = get_bucket(timestamp, resolution)
+    rows = []
+    for column in columns:
+
+        try:
+            value = float(values[column])
+
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        rows.append((bucket, column, value, value, value, value, int(timestamp)))
+
+    return rows
+
+
+def update_rollups(table_name: str, values: dict, timestamp: float, columns: list,
+                   path_to_database: str = database.path_to_database) -> None:
+    """
+    Merges a new reading into the minute, hour and day summaries. Sent to the writer thread if one is running so the
+    updates are committed in the same transaction as the reading.
+
+    :param table_name: sensor table the reading was stored in
+    :param values: column name/value of the reading
+    :param timestamp: time of the reading in seconds since epoch
+    :param columns: numeric columns to summarise
+    :param path_to_database: name of the database to connect to
+    :return: None
+    """
+
+    writer = get_database_writer(path_to_database)
+    for resolution in resolutions:
+
+        query = build_update_query(table_name, resolution)
+        rows = build_update_rows(values, columns, timestamp, resolution)
+        if writer is not None:
+            writer.write_many(query, rows)
+
+        else:
+            database.execute_many(query, rows, path_to_database)
+
+
+def get_rollups(table_name: str, resolution: str, columns: list, start_timestamp: int, end_timestamp: int,
+                path_to_database: str = database.path_to_database) -> list:
+    """
+    Gets the summaries of some columns over a time range, oldest first
+
+    :param table_name: sensor table
+    :param resolution: 'minute', 'hour' or 'day'
+    :param columns: columns to get ex. ["water_temp"]
+    :param start_timestamp: seconds since epoch of the first bucket to include
+    :param end_timestamp: seconds since epoch of the last bucket to include
+    :param path_to_database: name of the database to connect to
+    :return: rows of (bucket, column_name, min, max, mean, count, last)
+    """
+
+    query = f"SELECT bucket, column_name, min_value, max_value, sum_value / count_value, count_value, last_value " \
+            f"FROM {get_rollup_table_name(table_name, resolution)} " \
+            f"WHERE bucket BETWEEN ? AND ? AND column_name IN ({', '.join('?' for column in columns)}) " \
+            f"ORDER BY bucket, column_name"
+
+    return database.execute(query, (start_timestamp, end_timestamp, *columns), database.ResultCount.ALL,
+                            path_to_database)
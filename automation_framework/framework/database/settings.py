@@ -0,0 +1,181 @@
+"""
+Settings changed in the web app are stored in a settings table, one row per setting. Instead of each object running its
+own query for each setting it uses, the settings service loads the whole table with one query and keeps it in memory.
+
+Checking for changes is cheap. 'PRAGMA data_version' returns a number that changes when another connection commits to
+the database. The framework's own writer commits sensor readings every few seconds, so a new data_version usually does
+not mean the settings changed. When it changes the service asks sqlite for a fingerprint of the table (every name and
+value quoted and joined into one string) and the table is only read again if the fingerprint is different. When it is
+read, only the objects that use a setting whose value changed are told about it, and the values are converted to their
+type first.
+"""
+
+import logging as log
+import sqlite3
+
+from framework.database import database
+from framework.io.actions import action
+from framework.io.io import Io, IoType
+
+
+class SettingsService(Io):
+
+    def __init__(self, name: str, actions: dict, table_name: str, path_to_database: str = database.path_to_database):
+        """
+        Keeps a copy of the settings table and pushes changed settings to the objects that use them.
+
+        :param name: name of the service
+        :param actions: the method names and the intervals to execute them ex. {"check_for_changes": 5}
+        :param table_name: table the web app stores the settings in. It must have 'Setting_name' and 'Value' columns.
+        :param path_to_database: database the table is in
+        """
+
+        super().__init__(name, IoType.MANGER, actions, [])
+
+        self.table_name = table_name
+        self.path_to_database = path_to_database
+
+        # data_version is only meaningful for one connection so the service keeps its own open
+        self.connection = None
+        self.data_version = None
+        self.fingerprint = None
+
+        # Number of times the table was read, for testing how often the fingerprint saves a read
+        self.load_count = 0
+
+        self.settings = {}
+        self.subscribers = []
+
+    def subscribe(self, io: Io) -> None:
+        """
+        Starts sending changes of the settings in io.database_settings to io.apply_settings(). Settings that were already
+        loaded are sent right away.
+
+        :param io: input, output or manager that uses settings from the database
+        :return: None
+        """
+
+        if len(io.database_settings) == 0:
+            return
+
+        self.subscribers.append(io)
+
+        changed = {setting_name: value for setting_name, value in self.settings.items()
+                   if setting_name in io.database_settings}
+        self._push(io, changed)
+
+    def unsubscribe(self, io: Io) -> None:
+        """
+        Stops sending changed settings to an object
+
+        :param io: an object passed to subscribe()
+        :return: None
+        """
+
+        self.subscribers = [subscriber for subscriber in self.subscribers if subscriber is not io]
+
+    def get(self, setting_name: str, default=None):
+        """
+        Gets the value of a setting from the last time the table was read
+
+        :param setting_name: value of the 'Setting_name' column
+        :param default: returned if the setting is not in the table
+        :return: the stored value (not converted)
+        """
+
+        return self.settings.get(setting_name, default)
+
+    def _connect(self) -> sqlite3.Connection:
+
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path_to_database)
+
+        return self.connection
+
+    def load(self) -> dict:
+        """
+        Reads the settings table if it changed since the last call
+
+        :return: setting name/value of the settings that changed. Empty if nothing changed.
+        """
+
+        connection = self._connect()
+
+        data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return {}
+
+        # One row with one string, built by sqlite. quote() keeps NULLs and the type of each value.
+        fingerprint = connection.execute(f"SELECT group_concat(quote(Setting_name) || '=' || quote(Value), ',') "
+                                         f"FROM (SELECT Setting_name, Value FROM {self.table_name} ORDER BY rowid)"
+                                         ).fetchone()[0]
+        self.data_version = data_version
+        if fingerprint == self.fingerprint and self.load_count > 0:
+            return {}
+
+        rows = connection.execute(f"SELECT Setting_name, Value FROM {self.table_name}").fetchall()
+        self.fingerprint = fingerprint
+        self.load_count += 1
+
+        settings = dict(rows)
+        changed = {setting_name: value for setting_name, value in settings.items()
+                   if setting_name not in self.settings or self.settings[setting_name] != value}
+        self.settings = settings
+
+        return changed
+
+    @action(interval=5)
+    def check_for_changes(self) -> None:
+        """
+        Reads the settings table if the database changed and sends the changed settings to the objects using them
+
+        :return: None
+        """
+
+        try:
+            changed = self.load()
+
+        except sqlite3.Error as ex:
+            log.getLogger().critical(f"FAILED to read the settings from '{self.table_name}'. {ex}")
+            return
+
+        if len(changed) == 0:
+            return
+
+        log.getLogger().warning(f"Settings changed: {', '.join(changed.keys())}")
+
+        for io in self.subscribers:
+            self._push(io, changed)
+
+    @staticmethod
+    def _push(io: Io, changed: dict) -> None:
+        """
+        Converts the settings an object uses to their type and passes them to it
+
+        :param io: the object to update
+        :param changed: setting name/stored value of every changed setting
+        :return: None
+        """
+
+        settings = {}
+        for setting_name, value in changed.items():
+
+            convert = io.database_settings.get(setting_name)
+            if convert is None:
+                continue
+
+            try:
+                settings[setting_name] = convert(value)
+
+            except (TypeError, ValueError):
+                log.getLogger().critical(f"FAILED to use setting '{setting_name}' = {value!r} for '{io.name}'")
+
+        if len(settings) > 0:
+            io.apply_settings(settings)
+
+    def close(self) -> None:
+        """ Closes the connection to the database """
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,451 @@
+"""
+One thread that does every write to a database. Callers put their statement in a bounded queue and return right away.
+The writer thread takes the statements off the queue in groups and commits each group as one transaction, so a burst
+of sensor readings costs one fsync instead of one for each row (less waiting and less wear on the SD card).
+
+When the queue is full (the disk or a lock held by the web app is slowing the writer down) the backpressure policy
+decides what happens:
+    block        the caller waits for room in the queue. Nothing is lost.
+    drop_oldest  the oldest queued write is dropped to make room. The caller never waits.
+    aggregate    writes with the same key (ex. the state of one output) replace each other while they are queued, so
+                 only the latest value is written. If the queue is still full the oldest write is dropped.
+
+A group that fails because the database is locked is retried. With block it is retried until the lock is released.
+With the other policies it goes back in the queue after max_retries, where it counts against max_queue_size.
+"""
+
+import logging as log
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from enum import Enum
+
+from framework.database.connection import get_connection_manager
+
+# Longest wait (in seconds) between retries of a locked group
+max_retry_delay = 1
+
+
+class Backpressure(Enum):
+
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    AGGREGATE = "aggregate"
+
+
+class Write:
+
+    __slots__ = ("query", "parameters", "key")
+
+    def __init__(self, query: str, parameters: tuple, key=None):
+        """
+        A statement waiting in the queue
+
+        :param query: sql statement with ? placeholders
+        :param parameters: values for the placeholders
+        :param key: writes with the same key replace each other when the policy is aggregate (None to never replace)
+        """
+
+        self.query = query
+        self.parameters = parameters
+        self.key = key
+
+
+class DatabaseWriter:
+
+    def __init__(self, path_to_database: str, max_queue_size: int = 1000, batch_size: int = 100,
+                 flush_interval: float = 0.5, backpressure: Backpressure = Backpressure.BLOCK,
+                 max_retries: int = 10, retry_delay: float = 0.05):
+        """
+        Writer thread for one database. Call start() before using it.
+
+        :param path_to_database: database to write to
+        :param max_queue_size: max number of writes waiting in the queue
+        :param batch_size: a group is committed once it has this many writes...
+        :param flush_interval: ...or this many seconds after its first write was queued
+        :param backpressure: what to do when the queue is full. A Backpressure or its value ex. 'drop_oldest'
+        :param max_retries: times to retry a group that failed because the database was locked before putting it back
+            in the queue and waiting for the next group (block keeps retrying the group instead)
+        :param retry_delay: seconds to wait before the first retry. Doubles each retry up to max_retry_delay.
+        """
+
+        self.path_to_database = path_to_database
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backpressure = Backpressure(backpressure)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        self.queue = deque()
+        self.pending_keys = {}
+        self.condition = threading.Condition()
+        self.in_progress = 0
+        self.flushing = 0
+
+        self.thread = None
+        self.stopping = False
+        self.pid = os.getpid()
+
+        # Counters for logging and tests
+        self.queued_count = 0
+        self.written_count = 0
+        self.commit_count = 0
+        self.dropped_count = 0
+        self.aggregated_count = 0
+        self.retry_count = 0
+        self.failed_count = 0
+
+    def start(self) -> None:
+        """ Starts the writer thread and makes the database functions send their writes to it """
+
+        self.thread = threading.Thread(target=self._run, name="database-writer", daemon=True)
+        self.thread.start()
+
+        writers[self.path_to_database] = self
+        log.getLogger().warning(f"Database writer started for '{self.path_to_database}'")
+
+    def is_running(self) -> bool:
+        """
+        Checks if writes can be sent to the writer. The thread does not exist in a process forked after it started.
+
+        :return: if the writer thread is running in this process
+        """
+
+        return self.thread is not None and not self.stopping and self.pid == os.getpid()
+
+    def write(self, query: str, parameters: tuple = (), key=None) -> None:
+        """
+        Queues a statement to be written by the writer thread
+
+        :param query: sql statement with ? placeholders
+        :param parameters: values for the placeholders
+        :param key: identifies writes that can replace each other ex. ("output_states", "water_pump")
+        :return: None
+        """
+
+        with self.condition:
+
+            self.queued_count += 1
+
+            # The queued write has not run yet so it can just take the newer values
+            if self.backpressure == Backpressure.AGGREGATE and key is not None:
+
+                queued_write = self.pending_keys.get(key)
+                if queued_write is not None and queued_write.query == query:
+                    queued_write.parameters = parameters
+                    self.aggregated_count += 1
+                    return
+
+            while len(self.queue) >= self.max_queue_size:
+
+                if self.backpressure == Backpressure.BLOCK and threading.current_thread() is not self.thread:
+                    self.condition.wait()
+
+                else:
+                    self._drop_oldest()
+
+            queued_write = Write(query, parameters, key)
+            self.queue.append(queued_write)
+            if key is not None:
+                self.pending_keys[key] = queued_write
+
+            self.condition.notify_all()
+
+    def write_many(self, query: str, rows) -> None:
+        """
+        Queues one statement for each row of values. The rows are committed together unless they are spread over more
+        than one group.
+
+        :param query: sql statement with ? placeholders
+        :param rows: a tuple of values for each row
+        :return: None
+        """
+
+        for parameters in rows:
+            self.write(query, parameters)
+
+    def _drop_oldest(self) -> None:
+
+        dropped_write = self.queue.popleft()
+        self._forget_key(dropped_write)
+        self.dropped_count += 1
+
+        # Logged on the first drop and then every 100 so a slow disk does not also fill the log
+        if self.dropped_count % 100 == 1:
+            log.getLogger().critical(f"Database writer queue is full. {self.dropped_count} writes dropped so far.")
+
+    def _forget_key(self, queued_write: Write) -> None:
+
+        if queued_write.key is not None and self.pending_keys.get(queued_write.key) is queued_write:
+            del self.pending_keys[queued_write.key]
+
+    def _next_group(self) -> list:
+        """
+        Waits for a group of writes. A group is ready when it has batch_size writes, when flush_interval has passed
+        since the writer started waiting on it or when the writer is stopping.
+
+        :return: the writes to commit together (empty when the writer is stopped)
+        """
+
+        with self.condition:
+
+            while len(self.queue) == 0 and not self.stopping:
+                self.condition.wait()
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(self.queue) < self.batch_size and not self.stopping and self.flushing == 0:
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                self.condition.wait(remaining)
+
+            group = []
+            while len(self.queue) > 0 and len(group) < self.batch_size:
+
+                queued_write = self.queue.popleft()
+                self._forget_key(queued_write)
+                group.append(queued_write)
+
+            self.in_progress = len(group)
+
+            # Wakes callers blocked on a full queue
+            self.condition.notify_all()
+
+        return group
+
+    def _commit_group(self, group: list) -> None:
+        """
+        Writes a group in one transaction. A write that fails for any reason other than a lock is logged and skipped so
+        one bad row can not stop the rest. Lock errors roll back the group and raise.
+
+        :param group: writes to commit
+        :return: None
+        """
+
+        manager = get_connection_manager(self.path_to_database)
+        with manager.write_lock:
+
+            connection = manager.get_writer()
+            written_count = 0
+            failed_count = 0
+            try:
+                for queued_write in group:
+
+                    try:
+                        connection.execute(queued_write.query, queued_write.parameters).close()
+                        written_count += 1
+
+                    except sqlite3.OperationalError as ex:
+
+                        if is_lock_error(ex):
+                            raise
+
+                        failed_count += 1
+                        log.getLogger().critical(f"FAILED to write '{queued_write.query}'. {ex}")
+
+                    except sqlite3.Error as ex:
+                        failed_count += 1
+                        log.getLogger().critical(f"FAILED to write '{queued_write.query}'. {ex}")
+
+                connection.commit()
+
+            except Exception:
+                connection.rollback()
+                raise
+
+        self.written_count += written_count
+        self.failed_count += failed_count
+        self.commit_count += 1
+
+    def _write_group(self, group: list) -> None:
+        """
+        Commits a group, retrying while the database is locked. If it is still locked after max_retries the group goes
+        back to the front of the queue, unless the policy is block. Nothing can be dropped with block so the writer
+        keeps retrying the group (every max_retry_delay seconds) until it is committed or the writer is stopped.
+
+        :param group: writes to commit
+        :return: None
+        """
+
+        delay = self.retry_delay
+        try_count = 0
+        while True:
+
+            try:
+                self._commit_group(group)
+                return
+
+            except sqlite3.OperationalError as ex:
+
+                if not is_lock_error(ex):
+                    raise
+
+            if try_count >= self.max_retries:
+
+                if self.backpressure != Backpressure.BLOCK or self.stopping:
+                    break
+
+                if try_count == self.max_retries:
+                    log.getLogger().critical(f"Database still locked after {self.max_retries} retries. Retrying "
+                                             f"{len(group)} writes until it is unlocked.")
+
+            else:
+                log.getLogger().warning(f"Database locked while writing {len(group)} rows. Retrying in {delay:.2f}s.")
+
+            try_count += 1
+            self.retry_count += 1
+            time.sleep(delay)
+            delay = min(delay * 2, max_retry_delay)
+
+        log.getLogger().critical(f"Database still locked after {try_count} retries. "
+                                 f"{len(group)} writes put back in the queue.")
+        self._put_back(group)
+
+    def _put_back(self, group: list) -> None:
+        """
+        Puts a group that could not be committed back at the front of the queue. Callers may have filled the queue
+        while the group was being retried, so the backpressure policy is applied again. With aggregate a write whose key
+        was queued again since is dropped for the newer one. With drop_oldest and aggregate the oldest writes are
+        dropped until the queue fits in max_queue_size. With block the group is only put back when the writer is
+        stopping, so it is kept even if the queue goes over its size.
+
+        :param group: writes that were taken off the queue
+        :return: None
+        """
+
+        with self.condition:
+
+            for queued_write in reversed(group):
+
+                if self.backpressure == Backpressure.AGGREGATE and queued_write.key is not None:
+
+                    newer_write = self.pending_keys.get(queued_write.key)
+                    if newer_write is not None and newer_write.query == queued_write.query:
+                        self.aggregated_count += 1
+                        continue
+
+                self.queue.appendleft(queued_write)
+                if queued_write.key is not None and queued_write.key not in self.pending_keys:
+                    self.pending_keys[queued_write.key] = queued_write
+
+            if self.backpressure != Backpressure.BLOCK:
+                while len(self.queue) > self.max_queue_size:
+                    self._drop_oldest()
+
+    def _run(self) -> None:
+
+        while True:
+
+            group = self._next_group()
+            if len(group) == 0 and self.stopping:
+                break
+
+            try:
+                self._write_group(group)
+
+            except Exception as ex:
+                self.failed_count += len(group)
+                log.getLogger().critical(f"FAILED to write {len(group)} rows to '{self.path_to_database}'. {ex}")
+
+            with self.condition:
+                self.in_progress = 0
+                self.condition.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every queued write has been committed
+
+        :param timeout: max seconds to wait (None to wait forever)
+        :return: if the queue was emptied before the timeout
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+
+            # Commit what is queued now instead of waiting for flush_interval
+            self.flushing += 1
+            self.condition.notify_all()
+
+            try:
+                while len(self.queue) > 0 or self.in_progress > 0:
+
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+
+                    self.condition.wait(remaining)
+
+            finally:
+                self.flushing -= 1
+
+        return True
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Writes everything still queued then stops the thread. Writes after this go straight to the database.
+
+        :param timeout: max seconds to wait for the queue to be written
+        :return: None
+        """
+
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+        unwritten_count = 0
+        if self.thread is not None:
+
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+
+                # Most likely the database is still locked. Writes after this go straight to the database, so the ones
+                # still queued are only written if the thread gets to them before the process exits.
+                with self.condition:
+                    unwritten_count = len(self.queue) + self.in_progress
+
+                log.getLogger().critical(f"Database writer did not finish within {timeout} seconds. {unwritten_count} "
+                                         f"writes to '{self.path_to_database}' were not written.")
+
+        if writers.get(self.path_to_database) is self:
+            del writers[self.path_to_database]
+
+        log.getLogger().warning(f"Database writer stopped. written: {self.written_count} commits: {self.commit_count} "
+                                f"dropped: {self.dropped_count} aggregated: {self.aggregated_count} "
+                                f"retries: {self.retry_count} failed: {self.failed_count} "
+                                f"not written: {unwritten_count}")
+
+
+def is_lock_error(ex: sqlite3.OperationalError) -> bool:
+    """
+    Checks if an error was caused by another connection holding a lock
+
+    :param ex: the error
+    :return: True for 'database is locked' and 'database is busy' errors
+    """
+
+    message = str(ex).lower()
+    return "locked" in message or "busy" in message
+
+
+# The running writer for each database. Path/DatabaseWriter.
+writers = {}
+
+
+def get_database_writer(path_to_database: str):
+    """
+    Gets the writer thread of a database if one is running in this process
+
+    :param path_to_database: database to write to
+    :return: DatabaseWriter or None if writes should go straight to the database
+    """
+
+    writer = writers.get(path_to_database)
+    if writer is None or not writer.is_running():
+        return None
+
+    return writer
@@ -0,0 +1,151 @@
+"""
+Declarative registry of the methods that can be scheduled as actions. A method is marked with the @action decorator and
+each Io class compiles the marked methods into a registry one time when the class is defined. Objects then build a flat
+dispatch table (one slot per action in the json file) when they are created so checking and running actions does not
+need to look anything up.
+
+ex.
+    @action(interval=5, blocking=True)
+    def get_sensor_values(self):
+        ...
+"""
+
+from framework.time.instrumentation import ActionStats, instrumentation
+from framework.time.timer import Timer
+
+
+class ActionInfo:
+
+    __slots__ = ("interval", "blocking", "timeout")
+
+    def __init__(self, interval, blocking: bool, timeout):
+        """
+        Defaults for an action. Each of these can be changed in the json file.
+
+        :param interval: default number of seconds between each call
+        :param blocking: if the action does blocking io and should be run off of the main thread
+        :param timeout: default number of seconds a blocking action is allowed to run
+        """
+
+        self.interval = interval
+        self.blocking = blocking
+        self.timeout = timeout
+
+
+class ActionSlot:
+
+    __slots__ = ("name", "method", "timer", "blocking", "timeout", "stats")
+
+    def __init__(self, name: str, method, timer: Timer, blocking: bool, timeout, stats: ActionStats):
+        """
+        One entry in the dispatch table of an object.
+
+        :param name: name of the action (the method name)
+        :param method: the bound method to call
+        :param timer: timer that decides when the action is due
+        :param blocking: if the action should be run by the action executor
+        :param timeout: number of seconds a blocking action is allowed to run
+        :param stats: call count, run time and lateness of the action
+        """
+
+        self.name = name
+        self.method = method
+        self.timer = timer
+        self.blocking = blocking
+        self.timeout = timeout
+        self.stats = stats
+
+
+def action(interval=None, blocking: bool = False, timeout=None):
+    """
+    Decorator to mark a method as an action that can be listed in the 'actions' field of a json file.
+
+    :param interval: default number of seconds between each call (used when the json file does not give one)
+    :param blocking: if the action does blocking io (serial, http, smtp...)
+    :param timeout: default number of seconds a blocking action is allowed to run
+    :return: the decorator
+    """
+
+    def decorator(method):
+        method.action_info = ActionInfo(interval, blocking, timeout)
+        return method
+
+    return decorator
+
+
+def compile_action_registry(cls) -> dict:
+    """
+    Finds every method marked with @action in the class and its parent classes. A method that overrides an action
+    without the decorator is still an action and keeps the defaults of the parent.
+
+    :param cls: the class to compile
+    :return: action name/ActionInfo
+    """
+
+    registry = {}
+    for klass in reversed(cls.__mro__):
+        for name, member in vars(klass).items():
+
+            action_info = getattr(member, "action_info", None)
+            if isinstance(action_info, ActionInfo):
+                registry[name] = action_info
+
+    return registry
+
+
+def validate_action_names(cls, actions: dict, source: str = None) -> None:
+    """
+    Makes sure each action in a json config is a registered action of the class.
+
+    :param cls: class the config is for
+    :param actions: the 'actions' field from the json file
+    :param source: where the config came from (used in the error message)
+    :return: None
+    """
+
+    registry = cls.action_registry
+    for action_name in actions.keys():
+
+        if action_name not in registry:
+
+            location = f" in '{source}'" if source is not None else ""
+            raise ValueError(f"'{action_name}'{location} is not an action of '{cls.__name__}'. "
+                             f"Valid actions are: {sorted(registry.keys())}")
+
+
+def build_slot(io, action_name: str, config) -> ActionSlot:
+    """
+    Creates the dispatch slot for one action using the json config and the defaults from the decorator.
+
+    :param io: the object the action belongs to
+    :param action_name: name of the action
+    :param config: value from the json 'actions' field. A number of seconds, a dictionary or null to use the default
+    :return: ActionSlot
+    """
+
+    action_info = io.action_registry[action_name]
+
+    if config is None:
+        config = action_info.interval
+
+    if isinstance(config, dict):
+
+        blocking = config.get("blocking", action_info.blocking)
+        timeout = config.get("timeout", action_info.timeout)
+        if "interval" not in config:
+            config = dict(config, interval=action_info.interval)
+
+    else:
+        blocking = action_info.blocking
+        timeout = action_info.timeout
+
+    interval = config["interval"] if isinstance(config, dict) else config
+    if interval is None:
+        raise ValueError(f"Action '{action_name}' of '{io.name}' does not have an interval in the json file or a "
+                         f"default interval")
+
+    full_name = f"{io.name}:{action_name}"
+    timer = Timer.from_config(full_name, config)
+
+    return ActionSlot(action_name, getattr(io, action_name), timer, blocking, timeout,
+                      instrumentation.register(full_name))
@@ -0,0 +1,172 @@
+"""
+Runs a multi-sensor in its own process. Serial reads, database writes and alarm emails happen in the worker process so
+garbage collection pauses, serial stalls and sqlite lock waits can not delay the process toggling the relays. The latest
+readings are published to the gpio process through SharedReadings. The gpio process checks the worker with the
+check_process action and restarts it if it dies.
+"""
+
+import logging as log
+import multiprocessing
+import os
+import signal
+import sys
+
+from framework.io.actions import action
+from framework.io.io import Io, IoType
+
+
+def numeric_columns(database_column_info: dict) -> list:
+    """
+    Finds the columns of a multi-sensor that hold numbers. These are the columns published to shared memory.
+
+    :param database_column_info: column name/data type from the multi-sensor json file
+    :return: names of the REAL and INTEGER columns. The timestamp has its own place in the segment.
+    """
+
+    return [column for column, data_type in database_column_info.items()
+            if data_type in ("REAL", "INTEGER") and column != "timestamp"]
+
+
+def _run_ingest(file_name: str, shared_memory_name: str, columns: list) -> None:
+    """
+    Entry point of the worker process. Creates the multi-sensor from its json file and runs its actions until the
+    process is stopped.
+
+    :param file_name: name of the multi-sensor json file
+    :param shared_memory_name: name of the shared memory segment created by the parent process
+    :param columns: columns stored in the segment
+    :return: None
+    """
+
+    # Imported here so the gpio process does not need to load the serial and sensor code
+    import framework.json_loader as json
+    from framework.io.input.shared_readings import SharedReadings
+    from framework.time.scheduler import Scheduler
+
+    log.getLogger().warning(f"STARTING ingest process for '{file_name}' pid: {os.getpid()}")
+
+    # IngestProcess.stop() sends SIGTERM. Exiting through SystemExit runs the finally block below so the serial reader
+    # and the rfcomm process are stopped instead of being left behind.
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+
+    # The writer thread of the parent process does not exist after the fork so the worker starts its own
+    database_writer = json.create_database_writer("database_writer.json")
+    database_writer.start()
+
+    shared_readings = SharedReadings(shared_memory_name, columns)
+    multi_sensor = json.create_multi_sensor(file_name)
+    multi_sensor.set_shared_readings(shared_readings)
+
+    try:
+        Scheduler([multi_sensor]).run()
+
+    finally:
+        multi_sensor.close_serial_connection()
+        shared_readings.close()
+        database_writer.stop()
+
+
+class IngestProcess(Io):
+
+    def __init__(self, file_name: str, database_column_info: dict, shared_memory_name: str = None,
+                 actions: dict = None):
+        """
+        Worker process for a multi-sensor. The shared memory segment is created here, in the gpio process, so it exists
+        before any output tries to read from it.
+
+        :param file_name: name of the multi-sensor json file
+        :param database_column_info: column name/data type from the multi-sensor json file
+        :param shared_memory_name: name of the shared memory segment (default is based on the json file name)
+        :param actions: the method names and the intervals to execute them (default checks the worker every 10 seconds)
+        """
+
+        from framework.io.input.shared_readings import SharedReadings
+
+        if shared_memory_name is None:
+            shared_memory_name = "ingest_" + os.path.splitext(os.path.basename(file_name))[0]
+
+        if actions is None:
+            actions = {"check_process": None}
+
+        super().__init__(f"ingest-{file_name}", IoType.INPUT, actions, [])
+
+        self.file_name = file_name
+        self.shared_memory_name = shared_memory_name
+        self.columns = numeric_columns(database_column_info)
+
+        try:
+            self.shared_readings = SharedReadings(shared_memory_name, self.columns, create=True)
+
+        except FileExistsError:
+
+            # Left over from a controller that was killed before it could remove it
+            log.getLogger().warning(f"Removing the shared memory segment '{shared_memory_name}' left by an earlier run")
+            SharedReadings(shared_memory_name, self.columns).shared_memory.unlink()
+            self.shared_readings = SharedReadings(shared_memory_name, self.columns, create=True)
+
+        self.process = self.create_process()
+        self.restart_count = 0
+        self.stopped = False
+
+    def create_process(self) -> multiprocessing.Process:
+        """
+        A process object can only be started one time so a new one is created for each start
+
+        :return: the worker process, not started
+        """
+
+        return multiprocessing.Process(target=_run_ingest, name=f"ingest-{self.file_name}", daemon=True,
+                                       args=(self.file_name, self.shared_memory_name, self.columns))
+
+    def start(self) -> None:
+        """ Starts the worker process """
+
+        self.process.start()
+        log.getLogger().warning(f"Ingest process for '{self.file_name}' started with pid {self.process.pid}")
+
+    def is_alive(self) -> bool:
+        """
+        Checks if the worker process is still running
+
+        :return: if the process is running
+        """
+
+        return self.process.is_alive()
+
+    @action(interval=10)
+    def check_process(self) -> None:
+        """
+        Restarts the worker process if it died. The readings it left in shared memory are cleared first so the outputs
+        do not keep using them.
+
+        :return: None
+        """
+
+        if self.stopped or self.process.is_alive():
+            return
+
+        self.restart_count += 1
+        log.getLogger().critical(f"FAILED ingest process for '{self.file_name}' exited with code "
+                                 f"{self.process.exitcode}. Restarting it (restart {self.restart_count})")
+
+        self.shared_readings.clear()
+        self.process = self.create_process()
+        self.start()
+
+    def stop(self) -> None:
+        """ Stops the worker process and removes the shared memory segment """
+
+        if self.stopped:
+            return
+
+        self.stopped = True
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join(1)
+
+        self.shared_readings.close()
+        self.shared_readings.unlink()
@@ -0,0 +1,160 @@
+"""
+The newest reading of each sensor table kept in memory. MultiSensor publishes each reading when it stores it, and
+outputs and alarm checks read it from here instead of querying the database for a row that was just written by the
+same process. A read is a dictionary lookup.
+
+Until a reading has been published in this process (right after a restart, or when the sensor runs somewhere else) the
+newest row is read from the database instead, at most once every refresh_interval seconds.
+"""
+
+import logging as log
+import threading
+import time
+from datetime import datetime
+
+from framework.database import database
+
+
+class LatestReadings:
+
+    def __init__(self, table_name: str, path_to_database: str = database.path_to_database, refresh_interval: float = 5):
+        """
+        Latest reading of one sensor table
+
+        :param table_name: table the sensor stores its readings in
+        :param path_to_database: database the table is in. Used until a reading is published.
+        :param refresh_interval: min seconds between database reads while nothing has been published
+        """
+
+        self.table_name = table_name
+        self.path_to_database = path_to_database
+        self.refresh_interval = refresh_interval
+
+        # (timestamp, column name/value) replaced as a whole on each publish, so a reader running on another thread
+        # always gets a timestamp and values from the same reading without a lock
+        self.reading = None
+        self.published = False
+
+        # Blocking actions of the same sensor run on different threads (ex. get_sensor_values publishing while
+        # alarm_check loads from the database). Writes take the lock so a row loaded from the database never replaces
+        # a newer published reading.
+        self.lock = threading.Lock()
+        self.next_refresh = 0
+
+    def publish(self, values: dict, timestamp: float) -> None:
+        """
+        Stores a new reading. Called by the sensor each time it gets one.
+
+        :param values: column name/value for the reading
+        :param timestamp: time of the reading in seconds since epoch
+        :return: None
+        """
+
+        reading_values = {}
+        for column, value in values.items():
+
+            # Values parsed from the serial line are text. They are converted once here instead of on every read.
+            if isinstance(value, str):
+                try:
+                    value = float(value)
+
+                except ValueError:
+                    pass
+
+            reading_values[column] = value
+
+        with self.lock:
+            self.reading = (timestamp, reading_values)
+            self.published = True
+
+    def _load_from_database(self) -> None:
+        """ Reads the newest row of the table. Used while nothing has been published in this process. """
+
+        now = time.monotonic()
+        if now < self.next_refresh:
+            return
+
+        self.next_refresh = now + self.refresh_interval
+
+        column_info = database.execute(f"PRAGMA table_info({self.table_name})", result_count=database.ResultCount.ALL,
+                                       path_to_database=self.path_to_database)
+        row = database.select_data(self.table_name, database.ResultCount.ONE, order_by="ORDER BY timestamp DESC LIMIT 1",
+                                   path_to_database=self.path_to_database)
+
+        if column_info is None or row is None:
+            return
+
+        values = dict(zip([column[1] for column in column_info], row))
+        if values.get("timestamp") is None:
+            return
+
+        with self.lock:
+
+            # A reading may have been published while the database was being read
+            if self.published:
+                return
+
+            self.reading = (values["timestamp"], values)
+
+        log.getLogger().debug(f"Loaded the latest reading of '{self.table_name}' from the database")
+
+    def read(self):
+        """
+        Gets the latest reading
+
+        :return: (timestamp, column name/value) or None if there is no reading
+        """
+
+        if not self.published:
+            self._load_from_database()
+
+        return self.reading
+
+    def get_sensor_reading(self, columns: list):
+        """
+        Same result as database.get_sensor_reading(). The 'timestamp' and 'date_time' columns are filled in from the
+        time of the reading.
+
+        :param columns: columns to get ex. ["timestamp", "water_temp"]
+        :return: a list with the values of the columns or None if there is no reading
+        """
+
+        reading = self.read()
+        if reading is None:
+            return None
+
+        timestamp, values = reading
+        result = []
+        for column in columns:
+
+            if column == "timestamp":
+                result.append(timestamp)
+
+            elif column == "date_time":
+                result.append(datetime.fromtimestamp(timestamp).strftime("%m/%d/%Y %H:%M:%S"))
+
+            else:
+                result.append(values.get(column))
+
+        return result
+
+
+# One store for each sensor table so every output reading a table shares the one its sensor publishes to
+stores = {}
+
+
+def get_latest_readings(table_name: str, path_to_database: str = database.path_to_database) -> LatestReadings:
+    """
+    Gets the latest reading store for a sensor table, creating it the first time
+
+    :param table_name: table the sensor stores its readings in
+    :param path_to_database: database the table is in
+    :return: LatestReadings
+    """
+
+    key = (path_to_database, table_name)
+    store = stores.get(key)
+    if store is None:
+        store = stores.setdefault(key, LatestReadings(table_name, path_to_database))
+
+    return store
@@ -0,0 +1,421 @@
+"""
+Reads many sensor boards on one thread. The port of every board is opened non blocking and registered with a selector
+(epoll on linux), so the thread sleeps until one of them has data and only reads that one. Each board has its own
+labels, frame splitter and table. Adding a board costs one file descriptor, not a thread or a poll.
+
+Boards are found by a path pattern ex. '/dev/serial/by-id/usb-Arduino*_75735-if00' or '/dev/rfcomm1'. The patterns are
+checked every time scan_devices() runs, a board that appears is opened and one that is unplugged is closed when its
+port reports an error or a hang up, then opened again when it comes back. A bluetooth board that goes out of range does
+not always hang up its rfcomm port, so a board that sends nothing for stale_timeout seconds is closed and opened again
+by the same scan.
+"""
+
+import errno
+import glob
+import logging as log
+import os
+import selectors
+import termios
+import threading
+import time
+import tty
+from collections import OrderedDict
+
+from framework.database import database
+from framework.io.actions import action
+from framework.io.io import Io, IoType
+from framework.io.input.sensors.label_matcher import LabelMatcher
+from framework.io.input.sensors.sensor_table import SensorTable
+from framework.io.input.sensors.serial_reader import FrameSplitter, ReadingBuffer
+
+
+def configure_port(file_descriptor: int, baudrate: int) -> None:
+    """
+    Puts a serial port in raw mode (no line editing, echo or translated line endings) at a baud rate
+
+    :param file_descriptor: the open port
+    :param baudrate: communication rate ex. 9600
+    :return: None
+    """
+
+    tty.setraw(file_descriptor)
+    attributes = termios.tcgetattr(file_descriptor)
+    attributes[2] |= termios.CLOCAL | termios.CREAD
+    attributes[4] = attributes[5] = getattr(termios, f"B{baudrate}")
+    termios.tcsetattr(file_descriptor, termios.TCSANOW, attributes)
+
+
+class SensorDevice:
+    """
+    One sensor board of the IngestEngine
+    """
+
+    def __init__(self, name: str, path_pattern: str, baudrate: int, table: SensorTable, label_matcher: LabelMatcher,
+                 reading_buffer_size: int = 1024, stale_timeout: float = 30):
+        """
+        :param name: name of the board, used for the logs
+        :param path_pattern: glob pattern of the board's port. The first match, in sorted order, is used.
+        :param baudrate: communication rate of the port
+        :param table: table the readings are stored in
+        :param label_matcher: finds the columns of the labels sent by the board
+        :param reading_buffer_size: max number of readings held between calls of store_readings
+        :param stale_timeout: seconds without any data before the port is closed and opened again
+        """
+
+        self.name = name
+        self.path_pattern = path_pattern
+        self.baudrate = baudrate
+        self.table = table
+        self.label_matcher = label_matcher
+        self.stale_timeout = stale_timeout
+
+        self.readings = ReadingBuffer(reading_buffer_size)
+        self.splitter = FrameSplitter(name, label_matcher.parse, self.readings, parse_frame=self.validate_frame_data)
+
+        # Set while the port is open
+        self.path = None
+        self.file_descriptor = None
+        self.connect_count = 0
+
+        # Monotonic time the port was opened or last had data
+        self.last_data_time = 0.0
+
+    def validate_frame_data(self, frame_values: dict) -> dict:
+        """
+        :param frame_values: field name/value decoded from a binary frame
+        :return: the values that have a column in the board's table
+        """
+
+        return {column: value for column, value in frame_values.items() if column in self.table.column_info}
+
+
+class IngestEngine(Io):
+
+    def __init__(self, name: str, actions: OrderedDict, devices: dict, reading_buffer_size: int = 1024,
+                 path_to_database: str = database.path_to_database, stale_timeout: float = 30):
+        """
+        Reads the sensor boards of several tanks on one thread and stores each board's readings in its own table.
+
+        :param name: name of the engine
+        :param actions: the method names and the intervals to execute them ex. {"store_readings": 5}
+        :param devices: board name/settings.
+            'path' glob pattern of the board's port
+            'baudrate' optional, communication rate (default 9600)
+            'database_table_name' table to store the board's readings in
+            'database_column_info' column name and data type for each column
+            'label_aliases' optional, labels the board sends that are not a column name/the column
+            'partition_period' optional, 'day' or 'week' to split the table
+            'stale_timeout' optional, seconds without data before the port is opened again (default stale_timeout)
+            ex. {"tank_1": {"path": "/dev/serial/by-id/usb-Arduino*-if00", "database_table_name": "tank_1_sensors",
+            "database_column_info": {"date_time": "TEXT", "water_temp": "REAL"}}}
+        :param reading_buffer_size: max number of readings held for each board between calls of store_readings
+        :param path_to_database: database to store the readings in
+        :param stale_timeout: seconds a board can go without sending anything before its port is opened again
+        """
+
+        log.getLogger().debug(f"STARTING to create an ingest engine named {name}")
+
+        super().__init__(name, IoType.INPUT, actions, [])
+
+        # Kept to tell if a reloaded json file changed the boards
+        self.device_settings = devices
+        self.reading_buffer_size = reading_buffer_size
+        self.stale_timeout = stale_timeout
+
+        self.devices = []
+        for device_name, settings in devices.items():
+
+            column_info = settings["database_column_info"]
+            table = SensorTable(settings["database_table_name"], column_info, settings.get("partition_period"),
+                                path_to_database)
+            self.devices.append(SensorDevice(device_name, settings["path"], settings.get("baudrate", 9600), table,
+                                             LabelMatcher(column_info, settings.get("label_aliases")),
+                                             reading_buffer_size, settings.get("stale_timeout", stale_timeout)))
+
+        # Ports are only opened, read and closed by the engine thread. Other threads ask it to scan or stop by writing
+        # to the wake up pipe, which is registered with the selector like a port.
+        self.selector = selectors.DefaultSelector()
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ, None)
+
+        self.running = False
+        self.thread = threading.Thread(target=self.run, name=f"ingest-engine-{name}", daemon=True)
+
+        log.getLogger().debug(f"DONE creating an ingest engine named {name}")
+
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file. Only the actions and the stale timeout can be changed while running. The ports,
+        splitters and tables of the boards belong to the engine thread, so a change to 'devices' or
+        'reading_buffer_size' is rejected and the engine keeps its old settings until the controller is restarted.
+
+        :param data: the new contents of the json file
+        :return: if the object needs to be rescheduled
+        """
+
+        if data.get("devices") != self.device_settings or \
+                data.get("reading_buffer_size", 1024) != self.reading_buffer_size:
+            raise ValueError(f"The boards of '{self.name}' can not be changed while it is running. Restart the "
+                             f"controller to use the new 'devices' and 'reading_buffer_size'")
+
+        rescheduled = super().apply_config(data)
+
+        self.stale_timeout = data.get("stale_timeout", 30)
+        for device in self.devices:
+            device.stale_timeout = self.device_settings[device.name].get("stale_timeout", self.stale_timeout)
+
+        return rescheduled
+
+    def start(self) -> None:
+        """ Starts the engine thread. The ports are opened by its first scan. """
+
+        self.running = True
+        self.thread.start()
+        self.wake()
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stops the engine thread and closes every port
+
+        :param timeout: seconds to wait for the thread to end
+        :return: None
+        """
+
+        self.running = False
+        self.wake()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+        self.selector.close()
+        os.close(self.wake_read)
+        os.close(self.wake_write)
+
+    def wake(self) -> None:
+        """ Makes the engine thread check if it should scan for boards or stop """
+
+        try:
+            os.write(self.wake_write, b"\0")
+
+        except BlockingIOError:
+            # The pipe is full so the thread will wake up anyway
+            pass
+
+    def run(self) -> None:
+        """ Waits for data from any board and reads it until stop() is called """
+
+        log.getLogger().warning(f"STARTING ingest engine '{self.name}' with {len(self.devices)} boards")
+
+        while self.running:
+
+            try:
+                events = self.selector.select()
+
+            except (OSError, ValueError) as ex:
+
+                # Should not happen since ports are only closed by this thread. Wait a moment so a broken selector does
+                # not fill the log.
+                log.getLogger().critical(f"FAILED ingest engine '{self.name}' could not wait for data. {ex}")
+                time.sleep(1)
+                continue
+
+            for key, event_mask in events:
+
+                # One board (or one scan) failing must not stop the thread that reads every board
+                try:
+                    self.handle_event(key.data)
+
+                except Exception as ex:
+
+                    if key.data is None:
+                        log.getLogger().critical(f"FAILED ingest engine '{self.name}' scan raised: {ex}")
+
+                    else:
+                        log.getLogger().critical(f"FAILED ingest engine '{self.name}' reading '{key.data.name}' "
+                                                 f"raised: {ex}")
+                        self.close_device(key.data, "error while reading")
+
+        for device in self.devices:
+            self.close_device(device)
+
+        log.getLogger().warning(f"DONE ingest engine '{self.name}'")
+
+    def handle_event(self, device) -> None:
+        """
+        Handles one ready file descriptor of the selector
+
+        :param device: the board with data or None for the wake up pipe
+        :return: None
+        """
+
+        if device is None:
+
+            # Woken up by another thread. Empty the pipe so it does not wake the thread again.
+            try:
+                while os.read(self.wake_read, 512):
+                    pass
+
+            except BlockingIOError:
+                pass
+
+            if self.running:
+                self.scan()
+
+        else:
+            self.read_device(device)
+
+    def read_device(self, device: SensorDevice) -> None:
+        """
+        Reads the bytes waiting on a board's port and parses the complete lines and frames
+
+        :param device: the board with data
+        :return: None
+        """
+
+        # Closed by a scan earlier in the same wake up
+        if device.file_descriptor is None:
+            return
+
+        try:
+            count = os.readv(device.file_descriptor, [device.splitter.get_free_space()])
+
+        except BlockingIOError:
+            return
+
+        except OSError as ex:
+
+            # EIO or ENODEV when a usb board is unplugged
+            self.close_device(device, f"error {errno.errorcode.get(ex.errno, ex.errno)}")
+            return
+
+        if count == 0:
+            self.close_device(device, "hang up")
+            return
+
+        device.last_data_time = time.monotonic()
+        device.splitter.split_frames(count, time.time())
+
+    def scan(self) -> None:
+        """
+        Opens the boards whose port appeared, closes the ones whose port is gone and opens the ones that stopped sending
+        data again
+        """
+
+        now = time.monotonic()
+        for device in self.devices:
+
+            paths = sorted(glob.glob(device.path_pattern))
+            if device.file_descriptor is not None and device.path not in paths:
+                self.close_device(device, "removed")
+
+            elif device.file_descriptor is not None and now - device.last_data_time > device.stale_timeout:
+                self.close_device(device, f"no data for {device.stale_timeout} seconds")
+
+            if device.file_descriptor is None and len(paths) > 0:
+                self.open_device(device, paths[0])
+
+    def open_device(self, device: SensorDevice, path: str) -> None:
+        """
+        Opens a board's port and registers it with the selector
+
+        :param device: the board
+        :param path: path of its port
+        :return: None
+        """
+
+        try:
+            file_descriptor = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+
+        except OSError as ex:
+            log.getLogger().warning(f"Ingest engine '{self.name}' could not open '{path}' for '{device.name}': {ex}")
+            return
+
+        try:
+            configure_port(file_descriptor, device.baudrate)
+
+        except (termios.error, AttributeError) as ex:
+            os.close(file_descriptor)
+            log.getLogger().warning(f"Ingest engine '{self.name}' could not set up '{path}' for '{device.name}': {ex}")
+            return
+
+        try:
+            self.selector.register(file_descriptor, selectors.EVENT_READ, device)
+
+        except (OSError, ValueError) as ex:
+            os.close(file_descriptor)
+            log.getLogger().critical(f"FAILED ingest engine '{self.name}' could not watch '{path}' for "
+                                     f"'{device.name}': {ex}")
+            return
+
+        device.path = path
+        device.file_descriptor = file_descriptor
+        device.connect_count += 1
+        device.last_data_time = time.monotonic()
+
+        log.getLogger().warning(f"Ingest engine '{self.name}' opened '{path}' for '{device.name}' "
+                                f"(connection {device.connect_count})")
+
+    def close_device(self, device: SensorDevice, reason: str = "stopped") -> None:
+        """
+        Unregisters and closes a board's port. The board is opened again by the next scan that finds its port.
+
+        :param device: the board
+        :param reason: why the port is closed, for the logs
+        :return: None
+        """
+
+        if device.file_descriptor is None:
+            return
+
+        # The port is closed even if the selector no longer knew about it
+        try:
+            self.selector.unregister(device.file_descriptor)
+
+        except (KeyError, ValueError) as ex:
+            log.getLogger().critical(f"FAILED ingest engine '{self.name}' was not watching '{device.path}' for "
+                                     f"'{device.name}': {ex}")
+
+        try:
+            os.close(device.file_descriptor)
+
+        except OSError as ex:
+            log.getLogger().critical(f"FAILED ingest engine '{self.name}' could not close '{device.path}' for "
+                                     f"'{device.name}': {ex}")
+
+        log.getLogger().warning(f"Ingest engine '{self.name}' closed '{device.path}' for '{device.name}': {reason}")
+
+        device.file_descriptor = None
+        device.path = None
+
+    @action(interval=5)
+    def scan_devices(self) -> None:
+        """
+        Looks for boards that were plugged in or unplugged.
+
+        :return: None
+        """
+
+        self.wake()
+
+    @action(interval=5, blocking=True, timeout=10)
+    def store_readings(self) -> None:
+        """
+        Stores the readings received from every board since the last call.
+
+        :return: None
+        """
+
+        log.getLogger().debug(f"STARTING store_readings {self.name}")
+
+        for device in self.devices:
+            for arrival_time, sensor_values in device.readings.pop_all():
+
+                try:
+                    device.table.store(sensor_values, arrival_time)
+
+                except Exception as ex:
+                    log.getLogger().critical(f"FAILED ingest engine '{self.name}' could not store a reading from "
+                                             f"'{device.name}'. Exception: {ex}")
+
+        log.getLogger().debug(f"DONE store_readings {self.name}")
@@ -0,0 +1,132 @@
+"""
+Matches the labels in a line of text from a multi-sensor to the columns of its table. Bytes are sometimes lost or
+mangled on the serial link so a label one edit (a letter added, removed or changed) away from a column still matches.
+
+Every label one edit away from a column is found with lookups in dicts built once from the column names:
+    labels          the column names (finds the same label, and a label with an added letter once that letter is
+                    removed from it)
+    deletions       the column names with each letter removed (finds a label with a removed letter)
+    substitutions   the column names with each letter removed, keyed with the position of the removed letter (finds a
+                    label with a changed letter once the letter in the same position is removed from it)
+so parsing a line costs a few dict lookups for each label instead of comparing each label to every column.
+"""
+
+import re
+
+# 'label: value' or 'label:value'. Labels can have spaces ex. 'Water Temp: 70.5 Air Temp: 68.0'.
+label_value_pattern = re.compile(r"([^:\s][^:]*?)\s*:\s*([^\s:]*)")
+
+# Data type of a column/function that checks and converts a value. Other columns can not be sent by the sensor.
+converters = {"REAL": float, "INTEGER": int}
+
+
+def normalize_label(label: str) -> str:
+    """
+    :param label: a label as sent by the sensor or a column name ex. 'Water Temp'
+    :return: the label in the form used by the index ex. 'water_temp'
+    """
+
+    return label.strip().casefold().replace(" ", "_")
+
+
+class LabelMatcher:
+
+    def __init__(self, column_info: dict, aliases: dict = None):
+        """
+        Builds the index of every label one edit away from the numeric columns of a table
+
+        :param column_info: column name/data type ex. {"date_time": "TEXT", "water_temp": "REAL"}
+        :param aliases: other labels the sensor uses for a column ex. {"Ph": "water_pH"}
+        """
+
+        self.column_info = column_info
+        self.aliases = aliases if aliases is not None else {}
+
+        # Label/the (column, converter) it matches. Variants one edit away from more than one column map to None.
+        self.labels = {}
+        self.deletions = {}
+        self.substitutions = {}
+
+        names = {column: column for column in column_info}
+        names.update({alias: column for alias, column in self.aliases.items() if column in column_info})
+
+        for name, column in names.items():
+
+            if column_info[column] in converters:
+                self.labels[normalize_label(name)] = (column, converters[column_info[column]])
+
+        for label, match in self.labels.items():
+            for index in range(len(label)):
+
+                deleted = label[:index] + label[index + 1:]
+                self._add(self.deletions, deleted, match)
+                self._add(self.substitutions, (deleted, index), match)
+
+    @staticmethod
+    def _add(index: dict, key, match: tuple) -> None:
+        """ Adds a one edit variant, marking it as ambiguous if it already matches another column """
+
+        if key not in index:
+            index[key] = match
+
+        elif index[key] is not None and index[key][0] != match[0]:
+            index[key] = None
+
+    def match(self, label: str):
+        """
+        Finds the column of a label
+
+        :param label: label sent by the sensor ex. 'Watr Temp'
+        :return: (column name, converter) or None if no column, or more than one column, is one edit away
+        """
+
+        label = normalize_label(label)
+        if label in self.labels:
+            return self.labels[label]
+
+        # One letter removed from the label
+        if label in self.deletions and self.deletions[label] is None:
+            return None
+
+        result = self.deletions.get(label)
+
+        # One letter added to the label or one letter of the label changed
+        for index in range(len(label)):
+
+            deleted = label[:index] + label[index + 1:]
+            for key, index_of_variants in ((deleted, self.labels), ((deleted, index), self.substitutions)):
+
+                if key not in index_of_variants:
+                    continue
+
+                match = index_of_variants[key]
+                if match is None or (result is not None and result[0] != match[0]):
+                    return None
+
+                result = match
+
+        return result
+
+    def parse(self, line: str) -> dict:
+        """
+        Finds the values of the columns in a line of text
+
+        :param line: line sent by the sensor ex. 'TDS: 310.5 Ph: 7.1 Water Temp: 70.5'
+        :return: column name/value converted to the column's data type. Values that can not be converted are left out.
+        """
+
+        values = {}
+        for label, value in label_value_pattern.findall(line):
+
+            match = self.match(label)
+            if match is not None and value != "":
+
+                column, converter = match
+                try:
+                    values[column] = converter(value)
+
+                except ValueError:
+                    # Data must be bad since it cannot be converted to the correct datatype
+                    pass
+
+        return values
@@ -1,27 +1,30 @@
-from datetime import datetime
 from collections import OrderedDict
 import time
-from subprocess import Popen, PIPE
 
 import logging as log
-from serial import Serial
 
 from framework.managers.email import EmailReasons, EmailController
+from framework.io.actions import action
 from framework.io.io import Io, IoType
-from framework.database import database
+from framework.io.input.sensors.label_matcher import LabelMatcher
+from framework.io.input.sensors.sensor_connection import SensorConnection
+from framework.io.input.sensors.sensor_table import SensorTable
+from framework.io.input.sensors.serial_reader import ReadingBuffer
+from framework.time.instrumentation import instrumentation
 
 
 class MultiSensor(Io):
 
     def __init__(self, name: str, actions: OrderedDict, database_table_name: str,
                  database_column_info: dict, serial_connection_name: str, alarm_values: dict,
-                 sensor_mac_address: str = None, baudrate: int = 9600, timeout: int = 30, no_readings_limit: int = 5):
+                 sensor_mac_address: str = None, baudrate: int = 9600, timeout: int = 30, no_readings_limit: int = 5,
+                 partition_period: str = None, reading_buffer_size: int = 1024, label_aliases: dict = None):
         """
         Used to represent a sensor that provides multiple values such as temperature, humidity, light level and or co2
         level. All data is sent over a serial connection.
 
-        * If the connection to the sensor is lost 0 bytes will constantly be returned. If this value is reached the
-            connection is assumed to be lost so try to restart it.
+        * If no valid readings are received for no_readings_limit calls of get_sensor_values the connection is assumed
+            to be lost so it is restarted, waiting longer after each failure in a row (see SensorConnection).
 
         :param name: name of the sensor
         :param actions: the method names and the intervals to execute them ex. {"find_state": 5}
@@ -32,8 +35,11 @@ class MultiSensor(Io):
         :param alarm_values: max and min values to send alert notifications at
         :param sensor_mac_address: MAC address of the bluetooth module on the sensor
         :param baudrate: communication rate for the serial connection
-        :param timeout:
+        :param timeout: read timeout of the serial connection in seconds
         :param no_readings_limit: max number of times to not get any data from the sensor *
+        :param partition_period: 'day' or 'week' to store the readings in a table for each period (None for one table)
+        :param reading_buffer_size: max number of readings held between calls of get_sensor_values
+        :param label_aliases: labels the sensor sends that are not a column name/the column ex. {"Ph": "water_pH"}
         """
 
         log.getLogger().debug(f"STARTING to create a multi-sensor named {name}")
@@ -45,270 +51,147 @@ class MultiSensor(Io):
         self.serial_connection_name = serial_connection_name
         self.baudrate = baudrate
         self.timeout = timeout
-        self.serial_connection = None
         self.sensor_mac_address = sensor_mac_address
-        self.serial_port_process = None
-
-        self.bytes_in_waiting = 0
-        self.no_bytes_count = 0
         self.no_readings_limit = no_readings_limit
 
+        # A thread reads the connection and keeps the parsed readings until get_sensor_values stores them
+        self.readings = ReadingBuffer(reading_buffer_size)
+
         self.database_table_name = database_table_name
         self.database_column_info = database_column_info
-        database.init_database(database_table_name, database_column_info, True)
 
-        # Create the serial connection
-        self.start_serial_connection()
+        # Finds the column of each label in a line of text from the sensor
+        self.label_matcher = LabelMatcher(database_column_info, label_aliases)
+
+        # Readings are stored in the table, its summaries and the newest one is kept in memory for the alarm checks
+        self.sensor_table = SensorTable(database_table_name, database_column_info, partition_period)
+        self.latest_readings = self.sensor_table.latest_readings
+
+        # Opened by check_serial_connection. Connecting never blocks the scheduler.
+        self.connection = SensorConnection(name, serial_connection_name, baudrate, self.validate_sensor_data,
+                                           self.readings, self.validate_frame_data, sensor_mac_address, timeout,
+                                           stale_timeout=self.get_stale_timeout())
+
+        # The state, failures and rfcomm restarts of the connection are written with the action stats on SIGUSR1
+        instrumentation.register_health(f"{name}:connection", self.connection.get_metrics)
 
         self.sensor_reading_is_valid = None
         self.alarm_values = alarm_values
 
-        self.serial_connection_restart_count = 0
+        # Set when the sensor runs in its own ingest process
+        self.shared_readings = None
 
         log.getLogger().debug(f"DONE creating a multi-sensor named {self.name}")
 
     # Methods for handling the serial connection
-    def start_serial_connection(self) -> None:
+    def get_stale_timeout(self) -> float:
         """
-        Starts a serial connection to a multi-sensor.
-
-        :return: None
+        :return: seconds without a valid reading before the connection is restarted
         """
 
-        log.getLogger().warning(f"STARTING start_serial_connection {self.name}")
+        timer = self.timers.get("get_sensor_values")
+        interval = timer.interval if timer is not None else 5
 
-        if self.sensor_mac_address is not None:
-
-            connect_to_bluetooth = ['sudo', 'rfcomm', 'connect', 'hci0', self.sensor_mac_address]
-            self.serial_port_process = Popen(connect_to_bluetooth, stdout=PIPE, stdin=PIPE, stderr=PIPE)
-
-        else:
-            self.serial_port_process = None
-
-        try:
-
-            self.serial_connection = Serial(self.serial_connection_name, baudrate=self.baudrate, timeout=self.timeout)
-            self.serial_connection.read()
-            self.timers["check_serial_connection"].interval = 5
-            time.sleep(1)
-
-            self.serial_connection_restart_count += 1
-            if self.serial_connection_restart_count > 1:
-                log.getLogger().warning(f"Serial connection restarted count = {self.serial_connection_restart_count}")
-
-        except:
-
-            self.serial_connection = None
-            self.timers["check_serial_connection"].interval = 3
-            log.getLogger().warning(f"{self.name} failed to connect to {self.serial_connection_name}")
-
-        log.getLogger().warning(f"DONE start_serial_connection {self.name}")
+        return self.no_readings_limit * interval
 
     def close_serial_connection(self) -> None:
         """
-        Closes the serial connection.
+        Closes the serial connection and stops the rfcomm process.
 
         :return: None
         """
 
-        if self.serial_connection is not None:
-            self.serial_connection.close()
-            self.serial_connection = None
+        self.connection.close()
+        log.getLogger().warning(f"Multi-sensor '{self.name}' connection closed. {self.connection.get_metrics()}")
 
     def restart_connection(self):
         """
-        Closes then re-opens the serial connection.
+        Closes the serial connection. It is opened again by the next check_serial_connection.
 
         :return: None
         """
 
-        self.close_serial_connection()
-        self.start_serial_connection()
+        self.connection.reset()
 
+    @action(interval=5, blocking=True, timeout=10)
     def get_sensor_values(self):
         """
-        Gets the sensor values over the serial connection.
+        Stores the readings received by the serial reader thread since the last call.
 
         :return: None
         """
 
         log.getLogger().debug(f"STARTING get_sensor_values {self.name}")
-        try:
-            # Make sure the connection object has been created
-            if self.serial_connection is not None:
-
-                # Check to see if there are bytes in waiting
-                self.bytes_in_waiting = self.serial_connection.in_waiting
-                if self.bytes_in_waiting > 0:
 
-                    # Read the bytes from the serial connection, decode them to utf-8 and lastly remove
-                    # the trailing values (the new line termination) for formatting purposes.
-                    line = self.serial_connection.readline().decode("utf-8").rstrip()
-                    self.serial_connection.flush()
+        for arrival_time, sensor_values in self.readings.pop_all():
 
-                    # Sometimes some random characters get received on the first read so ignore them
-                    self.sensor_values = self.validate_sensor_data(line)
-                    if len(self.sensor_values) > 0:
+            try:
+                self.store_sensor_values(sensor_values, arrival_time)
 
-                        # Data comes in as a string containing key/value pairs with spaces separating each value.
-                        # Convert this to a dictionary to be inserted into the database.
-                        # EX: "lights:304 co2:1000"
-                        self.sensor_values['date_time'] = datetime.now().strftime("%m/%d/%Y %H:%M:%S")
+            except:
+                print("Exception thrown when getting values")
+                log.getLogger().critical(f"FAILED multi-sensor '{self.name}' encountered an"
+                                         f" error when executing 'get_sensor_values()'")
 
-                        # Add the date and time to the columns
-                        database.insert_data(self.database_table_name, self.sensor_values)
-                        print(self.sensor_values)
+        log.getLogger().debug(f"DONE get_sensor_values {self.name}")
 
-                else:
+    def store_sensor_values(self, sensor_values: dict, arrival_time: float) -> None:
+        """
+        Stores one reading in the database and publishes it as the latest reading.
 
-                    # There were not bytes in waiting
-                    # Reset the timer
-                    print("No bytes found. Setting previous seconds back.")
-                    self.timers["get_sensor_value"].previous_seconds -= self.timers["get_sensor_value"] + 2
-                    pass
+        :param sensor_values: the validated values ex. {"water_temp": 70.5}
+        :param arrival_time: seconds since epoch the reading was received at
+        :return: None
+        """
 
-        except:
-            print("Exception thrown when getting values")
-            log.getLogger().critical(f"FAILED multi-sensor '{self.name}' encountered an"
-                                     f" error when executing 'get_sensor_values()'")
+        self.sensor_values = self.sensor_table.store(sensor_values, arrival_time)
+        log.getLogger().debug(f"Multi-sensor '{self.name}' stored {self.sensor_values}")
 
-        log.getLogger().debug(f"DONE get_sensor_values {self.name}")
+        if self.shared_readings is not None:
+            self.shared_readings.publish(self.sensor_values, arrival_time)
 
     def validate_sensor_data(self, sensor_readings: str):
         """
         Check that the bytes received over the serial connection are valid. Sometimes some bytes are lost or mangled.
         If the sensor name from the string is only 1 letter off use the correct string in the return dict.
 
-        :param sensor_readings: the string sent from the multi sensor ("sensor_name:value sensor2_nameLvalue")
+        :param sensor_readings: the string sent from the multi sensor ("sensor_name:value Sensor Name2: value")
         :return: a dict with the validate labels and values {"sensor_name": value}
         """
 
         log.getLogger().debug(f"STARTING validate_sensor_reading {self.name}")
 
-        sensor_data = {}
-        reading_pairs = sensor_readings.split(" ")
-
-        for reading_pair in reading_pairs:
-
-            key_value = reading_pair.split(":")
-            if len(key_value) != 2:
-                print("failed because pair did not have colon")
-                continue
-
-            sensor_name = key_value[0]
-            data = key_value[1]
-            for column_name in self.database_column_info.keys():
-
-                edit_distance = self.check_edit_distance(sensor_name, column_name)
-                if edit_distance <= 1 and data != "":
-
-                    try:
-
-                        if self.database_column_info[column_name] == "REAL":
-                            float(data)
-
-                        elif self.database_column_info[column_name] == "INTEGER":
-                            int(data)
-
-                        else:
-                            raise ValueError("Datatype should be 'REAL' for floats and 'INTEGERS' for integers")
-
-                        sensor_data[column_name] = data
-
-                    except ValueError:
-                        # Data must be bad since it cannot be converted to the correct datatype
-                        pass
+        sensor_data = self.label_matcher.parse(sensor_readings)
 
         log.getLogger().debug(f"DONE validate_sensor_reading {self.name}")
 
         return sensor_data
 
-    @staticmethod
-    def check_edit_distance(string1, string2) -> int:
+    def validate_frame_data(self, frame_values: dict) -> dict:
         """
-        Taken from www.tutorialspoint.com. Also known as the levinsthein distance. Counts the number
-         of difference between string1 and string2.
-
-        ex.
+        Keeps the values of a binary frame that have a column in the database. Frames are checked with a CRC so the
+        labels and values do not need to be validated like the text format.
 
-        wake
-        wakes
-        Distance is 1. Add 1 letter 's' to the end of the word.
-
-
-        dog
-        cat
-        Distance is 3. Change 3 letters of dog to 'c', 'a' and 't'
-
-        :param string1:
-        :param string2:
-        :return: the difference or distance between the two strings
+        :param frame_values: field name/value decoded from the frame ex. {"tds": 310.5}
+        :return: a dict with the values that can be stored {"column_name": value}
         """
 
-        # Find lengths of given strings
-        m = len(string1)
-        n = len(string2)
-
-        count = 0  # Count of isEditDistanceOne
-
-        i = 0
-        j = 0
-        while i < m and j < n:
-            # If current characters dont match
-            if string1[i] != string2[j]:
-
-                # If length of one string is
-                # more, then only possible edit
-                # is to remove a character
-                if m > n:
-                    i += 1
-                elif m < n:
-                    j += 1
-                else:  # If lengths of both strings is same
-                    i += 1
-                    j += 1
-
-                # Increment count of edits
-                count += 1
-
-            else:  # if current characters match
-                i += 1
-                j += 1
-
-        # if last character is extra in any string
-        if i < m or j < n:
-            count += 1
-
-        return count
+        return {column: value for column, value in frame_values.items() if column in self.database_column_info}
 
+    @action(interval=1)
     def check_serial_connection(self):
         """
-        This method uses the number of bytes in waiting figure out if the connection is still active/healthy.
+        Moves the connection one step towards streaming readings, or restarts it if the readings stopped. Only does the
+        work of the current state so it never blocks.
 
         :return: None
         """
 
         log.getLogger().debug(f"STARTING check_serial_connection {self.name}")
 
-        # If no bytes are waiting there might be something wrong with the connection
-        if self.bytes_in_waiting == 0:
-
-            # Increment the counter
-            self.no_bytes_count += 1
-
-            # If the no bytes count reaches max no bytes count then restart the connection
-            if self.no_bytes_count >= self.no_readings_limit:
-
-                log.getLogger().warning(f"MultiSensor {self.name} did not find new readings after "
-                                         f"{self.no_readings_limit} cycles. Attempting to restart connection.")
-                print(f"MultiSensor {self.name} did not find new readings after "
-                      f"{self.no_readings_limit} cycles. Attempting to restart connection.")
-                self.restart_connection()
+        self.connection.advance()
 
-        else:
-            self.no_bytes_count = 0
-
-        log.getLogger().debug(f"DONE get_sensor_values {self.name}")
+        log.getLogger().debug(f"DONE check_serial_connection {self.name}")
 
     @staticmethod
     def string_to_dict(string: str) -> dict:
@@ -358,6 +241,7 @@ class MultiSensor(Io):
 
         return sensor_values
 
+    @action(interval=10, blocking=True, timeout=30)
     def alarm_check(self):
         """
         Check to see if any notifications should be sent because of high or low values.
@@ -384,7 +268,7 @@ class MultiSensor(Io):
 
         for key in self.alarm_values:
 
-            sensor_values = database.get_sensor_reading(self.database_name, self.database_table_name, ["date_time", key])
+            sensor_values = self.latest_readings.get_sensor_reading(["timestamp", key])
             if self.validate_sensor_reading(sensor_values):
 
                 sensor_value = sensor_values[1]
@@ -424,7 +308,7 @@ class MultiSensor(Io):
 
         for key in self.alarm_values:
 
-            sensor_values = database.get_sensor_reading(self.database_name, self.database_table_name, ["date_time", key])
+            sensor_values = self.latest_readings.get_sensor_reading(["timestamp", key])
             if self.validate_sensor_reading(sensor_values):
 
                 sensor_value = sensor_values[1]
@@ -462,13 +346,11 @@ class MultiSensor(Io):
         if sensor_values is None:
             return False
 
-        reading_timestamp = datetime.strptime(sensor_values[0], "%m/%d/%Y %H:%M:%S")
-        now = datetime.now()
-
+        # Format is [timestamp, sensor_value]. A reading from the last day is valid.
+        seconds_since_reading = time.time() - sensor_values[0]
         sensor_value = sensor_values[1]
 
-        time_since_last_reading = now - reading_timestamp
-        if sensor_value is not None and time_since_last_reading.days == 0:
+        if sensor_value is not None and 0 <= seconds_since_reading < 86400:
 
             result = True
 
@@ -479,6 +361,43 @@ class MultiSensor(Io):
 
         return result
 
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file. The serial connection is only restarted if one of its settings changed.
+
+        :param data: the new contents of the json file
+        :return: if the object needs to be rescheduled
+        """
+
+        rescheduled = super().apply_config(data)
+
+        self.alarm_values = data["alarm_values"]
+        self.no_readings_limit = data["no_readings_limit"]
+        self.label_matcher = LabelMatcher(self.database_column_info, data.get("label_aliases"))
+
+        self.connection.stale_timeout = self.get_stale_timeout()
+
+        connection_settings = (data["serial_connection_string"], data["mac_address"], data["buadrate"], data["timeout"])
+        if connection_settings != (self.serial_connection_name, self.sensor_mac_address, self.baudrate, self.timeout):
+
+            self.serial_connection_name, self.sensor_mac_address, self.baudrate, self.timeout = connection_settings
+            log.getLogger().warning(f"Serial settings for '{self.name}' changed. Restarting the connection.")
+
+            self.connection.set_port(self.serial_connection_name, self.baudrate, self.timeout, self.sensor_mac_address)
+
+        return rescheduled
+
+    def set_shared_readings(self, shared_readings) -> None:
+        """
+        Gives a reference to the shared memory segment the latest readings are published to. Used when the sensor runs
+        in its own ingest process.
+
+        :param shared_readings: the SharedReadings object
+        :return: None
+        """
+
+        self.shared_readings = shared_readings
+
     def set_email_controller(self, email_controller: EmailController) -> None:
         """
         Gives a reference to the email object so notifications can be sent.
@@ -0,0 +1,381 @@
+"""
+Keeps the serial connection of a multi-sensor up without ever blocking the caller. advance() is called often by the
+scheduler and only does the work of the current state:
+
+    DISCONNECTED    waits for the backoff delay of the last failure to pass, then starts the rfcomm process of a
+                    bluetooth sensor (or keeps the one already running) and moves to CONNECTING
+    CONNECTING      opens the port once it exists, starts the reader thread and moves to PROBING. Fails if the port can
+                    not be opened before connect_timeout.
+    PROBING         waits for the first valid reading then moves to STREAMING. Fails after probe_timeout.
+    STREAMING       fails if no valid reading arrives for stale_timeout or the reader thread stopped
+
+Each failure closes the port and waits twice as long as the last one (min_backoff up to max_backoff) before the next
+attempt, shortened by a random amount so several sensors that dropped together do not all retry at once. The rfcomm
+process is kept between attempts and only restarted after rfcomm_restart_failures failures in a row. Processes that are
+stopped are reaped by later calls of advance() instead of being waited for.
+"""
+
+from enum import Enum
+import logging as log
+import os
+import random
+import subprocess
+import time
+
+from framework.io.input.sensors.serial_reader import ReadingBuffer, SerialReader
+
+
+class ConnectionState(Enum):
+    DISCONNECTED = "DISCONNECTED"
+    CONNECTING = "CONNECTING"
+    PROBING = "PROBING"
+    STREAMING = "STREAMING"
+
+
+class SensorConnection:
+
+    def __init__(self, name: str, port: str, baudrate: int, parse, readings: ReadingBuffer, parse_frame=None,
+                 mac_address: str = None, timeout: float = 5, connect_timeout: float = 20, probe_timeout: float = 15,
+                 stale_timeout: float = 15, min_backoff: float = 1, max_backoff: float = 300, jitter: float = 0.5,
+                 rfcomm_restart_failures: int = 3, rfcomm_command: list = None, open_serial=None):
+        """
+        :param name: name of the sensor, used for the logs
+        :param port: name or path of the serial port ex. '/dev/rfcomm0'
+        :param baudrate: communication rate for the serial connection
+        :param parse: converts a line of text from the sensor to a dict of readings
+        :param readings: buffer the readings are pushed to
+        :param parse_frame: converts the values of a binary frame to a dict of readings
+        :param mac_address: MAC address of the bluetooth module on the sensor (None for a wired sensor)
+        :param timeout: read timeout of the port, how long the reader thread takes to notice it was stopped
+        :param connect_timeout: seconds to wait for the port to open
+        :param probe_timeout: seconds to wait for the first valid reading after the port opened
+        :param stale_timeout: seconds without a valid reading before the connection is restarted
+        :param min_backoff: seconds to wait after the first failure
+        :param max_backoff: longest wait between attempts in seconds
+        :param jitter: largest part of each wait that is randomly removed (0 to 1)
+        :param rfcomm_restart_failures: failures in a row before the rfcomm process is restarted
+        :param rfcomm_command: command that connects the bluetooth module (default 'sudo rfcomm connect hci0 <mac>')
+        :param open_serial: opens the port, called as open_serial(port, baudrate=, timeout=) (default serial.Serial)
+        """
+
+        self.name = name
+        self.port = port
+        self.baudrate = baudrate
+        self.parse = parse
+        self.readings = readings
+        self.parse_frame = parse_frame
+        self.mac_address = mac_address
+        self.timeout = timeout
+
+        self.connect_timeout = connect_timeout
+        self.probe_timeout = probe_timeout
+        self.stale_timeout = stale_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.rfcomm_restart_failures = rfcomm_restart_failures
+        self.rfcomm_command = rfcomm_command
+        self.open_serial = open_serial
+
+        self.state = ConnectionState.DISCONNECTED
+        self.state_since = time.monotonic()
+        self.next_attempt = 0
+        self.connect_deadline = 0
+        self.last_reading = 0
+        self.readings_seen = 0
+
+        self.serial_connection = None
+        self.serial_reader = None
+        self.rfcomm_process = None
+
+        # rfcomm processes that were asked to stop/monotonic time to kill them at if they have not exited
+        self.stopping_processes = []
+
+        # Health of the connection. See get_metrics()
+        self.connect_attempts = 0
+        self.consecutive_failures = 0
+        self.failures = 0
+        self.streams = 0
+        self.rfcomm_started = 0
+        self.rfcomm_reused = 0
+        self.rfcomm_reaped = 0
+        self.last_error = None
+        self.max_advance_seconds = 0
+
+    def advance(self, now: float = None) -> ConnectionState:
+        """
+        Does the work of the current state and moves to the next one if it is done. Never waits.
+
+        :param now: time.monotonic() of the call (default the current time)
+        :return: the state after the call
+        """
+
+        start = time.perf_counter()
+        if now is None:
+            now = time.monotonic()
+
+        self.reap_processes(now)
+
+        if self.state == ConnectionState.DISCONNECTED:
+
+            if now >= self.next_attempt:
+                self.start_connecting(now)
+
+        elif self.state == ConnectionState.CONNECTING:
+            self.try_open(now)
+
+        else:
+            self.check_readings(now)
+
+        self.max_advance_seconds = max(self.max_advance_seconds, time.perf_counter() - start)
+
+        return self.state
+
+    def set_state(self, state: ConnectionState, now: float) -> None:
+        """ Moves to a state and logs the change """
+
+        if state != self.state:
+            log.getLogger().warning(f"Connection of '{self.name}' {self.state.value} -> {state.value}")
+
+        self.state = state
+        self.state_since = now
+
+    def start_connecting(self, now: float) -> None:
+        """ Starts, or keeps, the rfcomm process then tries to open the port """
+
+        self.connect_attempts += 1
+        if self.mac_address is not None:
+            self.start_rfcomm()
+
+        self.connect_deadline = now + self.connect_timeout
+        self.set_state(ConnectionState.CONNECTING, now)
+        self.try_open(now)
+
+    def try_open(self, now: float) -> None:
+        """ Opens the port and starts the reader thread if the port exists """
+
+        error = f"'{self.port}' does not exist"
+        if os.path.exists(self.port):
+
+            try:
+                self.serial_connection = self.get_serial_opener()(self.port, baudrate=self.baudrate,
+                                                                  timeout=self.timeout)
+
+                self.serial_reader = SerialReader(self.name, self.serial_connection, self.parse, self.readings,
+                                                  parse_frame=self.parse_frame)
+                self.serial_reader.start()
+                self.readings_seen = 0
+                self.set_state(ConnectionState.PROBING, now)
+                return
+
+            except Exception as ex:
+                error = f"could not open '{self.port}': {ex}"
+
+        # The port of a bluetooth sensor only appears once rfcomm has connected
+        if now >= self.connect_deadline:
+            self.fail(error, now)
+
+    def get_serial_opener(self):
+        """
+        :return: the function that opens the port
+        """
+
+        if self.open_serial is None:
+
+            # Only imported when a port is opened so the tests do not need pyserial
+            from serial import Serial
+            self.open_serial = Serial
+
+        return self.open_serial
+
+    def check_readings(self, now: float) -> None:
+        """ Moves from PROBING to STREAMING on the first valid reading and fails if the readings stop """
+
+        readings_received = self.serial_reader.readings_received
+        if readings_received > self.readings_seen:
+
+            self.readings_seen = readings_received
+            self.last_reading = now
+            if self.state == ConnectionState.PROBING:
+
+                self.consecutive_failures = 0
+                self.streams += 1
+                self.set_state(ConnectionState.STREAMING, now)
+
+        elif not self.serial_reader.is_alive():
+            self.fail(f"reader stopped: {self.serial_reader.error}", now)
+
+        elif self.state == ConnectionState.PROBING and now - self.state_since >= self.probe_timeout:
+            self.fail(f"no valid readings {self.probe_timeout} seconds after opening '{self.port}'", now)
+
+        elif self.state == ConnectionState.STREAMING and now - self.last_reading >= self.stale_timeout:
+            self.fail(f"no readings for {self.stale_timeout} seconds", now)
+
+    def fail(self, error: str, now: float) -> None:
+        """
+        Closes the port and waits longer after each failure in a row before the next attempt
+
+        :param error: what went wrong, for the logs
+        :param now: time.monotonic() of the failure
+        :return: None
+        """
+
+        self.close_port()
+
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+
+        delay = min(self.max_backoff, self.min_backoff * 2 ** (self.consecutive_failures - 1))
+        delay *= 1 - self.jitter * random.random()
+        self.next_attempt = now + delay
+
+        # A stuck rfcomm process can be why connecting fails so start a new one after a few failures
+        if self.rfcomm_process is not None and self.consecutive_failures % self.rfcomm_restart_failures == 0:
+            self.stop_rfcomm(now)
+
+        log.getLogger().warning(f"Connection of '{self.name}' failed ({self.consecutive_failures} in a row): {error}. "
+                                f"Trying again in {delay:.1f} seconds")
+
+        self.set_state(ConnectionState.DISCONNECTED, now)
+
+    def close_port(self) -> None:
+        """ Stops the reader thread and closes the port without waiting for the thread """
+
+        if self.serial_reader is not None:
+            self.serial_reader.stop()
+            self.serial_reader = None
+
+        if self.serial_connection is not None:
+
+            try:
+                self.serial_connection.close()
+
+            except Exception as ex:
+                log.getLogger().warning(f"Could not close '{self.port}' of '{self.name}': {ex}")
+
+            self.serial_connection = None
+
+    def start_rfcomm(self) -> None:
+        """ Starts the process that connects the bluetooth module, unless the last one is still running """
+
+        if self.rfcomm_process is not None:
+
+            if self.rfcomm_process.poll() is None:
+                self.rfcomm_reused += 1
+                return
+
+            log.getLogger().warning(f"rfcomm for '{self.name}' exited with {self.rfcomm_process.returncode}")
+            self.rfcomm_reaped += 1
+            self.rfcomm_process = None
+
+        command = self.rfcomm_command
+        if command is None:
+            command = ['sudo', 'rfcomm', 'connect', 'hci0', self.mac_address]
+
+        # Output is thrown away so a full pipe can never stop rfcomm
+        try:
+            self.rfcomm_process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                                   stderr=subprocess.DEVNULL)
+            self.rfcomm_started += 1
+
+        except OSError as ex:
+            log.getLogger().critical(f"FAILED to start rfcomm for '{self.name}': {ex}")
+
+    def stop_rfcomm(self, now: float, grace_period: float = 5) -> None:
+        """
+        Asks the rfcomm process to exit. It is reaped, or killed after the grace period, by later calls of advance().
+
+        :param now: time.monotonic() of the call
+        :param grace_period: seconds to give the process to exit
+        :return: None
+        """
+
+        self.rfcomm_process.terminate()
+        self.stopping_processes.append((self.rfcomm_process, now + grace_period))
+        self.rfcomm_process = None
+
+    def reap_processes(self, now: float) -> None:
+        """ Collects the exit status of stopped rfcomm processes so they do not stay as zombies """
+
+        still_running = []
+        for process, kill_time in self.stopping_processes:
+
+            if process.poll() is not None:
+                self.rfcomm_reaped += 1
+                continue
+
+            if now >= kill_time:
+                process.kill()
+
+            still_running.append((process, kill_time))
+
+        self.stopping_processes = still_running
+
+    def reset(self) -> None:
+        """ Closes the port and connects again on the next call of advance(), without a backoff delay """
+
+        now = time.monotonic()
+        self.close_port()
+        self.consecutive_failures = 0
+        self.next_attempt = now
+        self.set_state(ConnectionState.DISCONNECTED, now)
+
+    def set_port(self, port: str, baudrate: int, timeout: float, mac_address: str = None) -> None:
+        """
+        Changes the port settings. The rfcomm process is for the old module so it is stopped, and the new port is opened
+        on the next call of advance().
+
+        :param port: name or path of the serial port
+        :param baudrate: communication rate for the serial connection
+        :param timeout: read timeout of the port
+        :param mac_address: MAC address of the bluetooth module on the sensor (None for a wired sensor)
+        :return: None
+        """
+
+        if self.rfcomm_process is not None:
+            self.stop_rfcomm(time.monotonic())
+
+        self.port, self.baudrate, self.timeout, self.mac_address = port, baudrate, timeout, mac_address
+        self.reset()
+
+    def close(self, timeout: float = 2) -> None:
+        """
+        Closes the port and stops the rfcomm processes. Only used when shutting down so it waits for them to exit.
+
+        :param timeout: seconds to wait for each process before killing it
+        :return: None
+        """
+
+        self.close_port()
+        if self.rfcomm_process is not None:
+            self.stop_rfcomm(time.monotonic())
+
+        for process, kill_time in self.stopping_processes:
+
+            try:
+                process.wait(timeout)
+
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+        self.stopping_processes = []
+        self.set_state(ConnectionState.DISCONNECTED, time.monotonic())
+
+    def get_metrics(self) -> dict:
+        """
+        :return: health of the connection ex. {"state": "STREAMING", "seconds_in_state": 3600.5, "failures": 2, ...}
+        """
+
+        return {"state": self.state.value,
+                "seconds_in_state": time.monotonic() - self.state_since,
+                "connect_attempts": self.connect_attempts,
+                "consecutive_failures": self.consecutive_failures,
+                "failures": self.failures,
+                "streams": self.streams,
+                "last_error": self.last_error,
+                "rfcomm_started": self.rfcomm_started,
+                "rfcomm_reused": self.rfcomm_reused,
+                "rfcomm_reaped": self.rfcomm_reaped,
+                "max_advance_seconds": self.max_advance_seconds}
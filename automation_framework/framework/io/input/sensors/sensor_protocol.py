@@ -0,0 +1,102 @@
+"""
+Binary frames sent by the multi-sensor sketch (arduino_code/aquaculture.ino built with BINARY_FRAMES set to 1). Boards
+with older sketches send lines of text instead. Both can be received on the same connection because a frame always
+starts with the sync bytes, which are never part of the text.
+
+Frame layout, all numbers little endian:
+    sync        2 bytes     0xAA 0x55
+    version     uint8       picks the payload layout in 'layouts'
+    length      uint8       bytes in the payload
+    payload     version 1: uint16 sequence number then float32 tds, water_pH, water_temp, air_temp, humidity
+    crc         uint16      CRC-16/CCITT-FALSE of the version, length and payload bytes
+
+The sequence number goes up by one for each frame and wraps at 65536 so lost frames can be counted.
+"""
+
+import binascii
+import math
+import struct
+
+sync_bytes = b"\xaa\x55"
+header = struct.Struct("<2sBB")
+crc_field = struct.Struct("<H")
+crc_start = 0xFFFF
+
+# Longest payload accepted. A bigger length means the sync bytes were found inside garbage.
+max_payload_length = 64
+
+# Version/(payload struct, the field each number after the sequence number is for). A new field layout needs a new
+# version so boards that were not updated are still decoded.
+layouts = {1: (struct.Struct("<H5f"), ("tds", "water_pH", "water_temp", "air_temp", "humidity"))}
+
+
+def crc16(data) -> int:
+    """
+    :param data: bytes or a memoryview
+    :return: CRC-16/CCITT-FALSE of the data
+    """
+
+    return binascii.crc_hqx(data, crc_start)
+
+
+def encode_frame(sequence: int, values: dict, version: int = 1) -> bytes:
+    """
+    Builds a frame the same way the sketch does. Fields missing from values are sent as NaN.
+
+    :param sequence: sequence number of the frame
+    :param values: field name/value ex. {"tds": 310.5}
+    :param version: payload layout to use
+    :return: the frame
+    """
+
+    payload_struct, fields = layouts[version]
+    payload = payload_struct.pack(sequence % 65536, *(values.get(field, math.nan) for field in fields))
+    body = bytes((version, len(payload))) + payload
+
+    return sync_bytes + body + crc_field.pack(crc16(body))
+
+
+def get_frame_length(buffer, start: int, end: int):
+    """
+    Finds the length of the frame starting at 'start' from its header
+
+    :param buffer: bytes received
+    :param start: position of the sync bytes of the frame
+    :param end: position after the last byte received
+    :return: length of the whole frame, None if the header is not complete or 0 if the length is not valid
+    """
+
+    if end - start < header.size:
+        return None
+
+    sync, version, length = header.unpack_from(buffer, start)
+    if length > max_payload_length:
+        return 0
+
+    return header.size + length + crc_field.size
+
+
+def decode_frame(buffer, start: int, frame_length: int):
+    """
+    Checks the CRC of a complete frame and unpacks its payload
+
+    :param buffer: bytes received
+    :param start: position of the sync bytes of the frame
+    :param frame_length: length of the frame from get_frame_length()
+    :return: (sequence number, field name/value) or None if the frame is damaged or its version is not known. Fields
+        sent as NaN are left out.
+    """
+
+    body = memoryview(buffer)[start + len(sync_bytes):start + frame_length - crc_field.size]
+    crc = crc_field.unpack_from(buffer, start + frame_length - crc_field.size)[0]
+    if crc16(body) != crc:
+        return None
+
+    sync, version, length = header.unpack_from(buffer, start)
+    if version not in layouts or layouts[version][0].size != length:
+        return None
+
+    payload_struct, fields = layouts[version]
+    sequence, *numbers = payload_struct.unpack_from(buffer, start + header.size)
+
+    return sequence, {field: number for field, number in zip(fields, numbers) if not math.isnan(number)}
@@ -0,0 +1,71 @@
+import logging as log
+from datetime import datetime
+
+from framework.database import database, rollups
+from framework.io.input.latest_readings import get_latest_readings
+
+
+class SensorTable:
+    """
+    The table a sensor board's readings are stored in, with its summaries, partitions and the newest reading kept in
+    memory. Used by MultiSensor and by each device of the IngestEngine.
+    """
+
+    def __init__(self, table_name: str, column_info: dict, partition_period: str = None,
+                 path_to_database: str = database.path_to_database):
+        """
+        Creates the table, or brings an existing one up to date, so readings can be stored in it
+
+        :param table_name: name of the table in the database to store sensor values in
+        :param column_info: column name and data type for each column ex. {"date_time": "TEXT", "temperature": "REAL"}
+        :param partition_period: 'day' or 'week' to store the readings in a table for each period (None for one table)
+        :param path_to_database: name of the database to connect to
+        """
+
+        self.table_name = table_name
+        self.column_info = column_info
+        self.path_to_database = path_to_database
+
+        database.init_database(table_name, column_info, True, path_to_database)
+        database.init_timestamp_column(table_name, path_to_database)
+
+        # Minute, hour and day summaries of the numeric columns. Kept up to date as readings are stored. Set up before
+        # the table is partitioned so the rows already in it are summarised.
+        self.rollup_columns = rollups.get_numeric_columns(column_info)
+        rollups.init_rollup_tables(table_name, self.rollup_columns, path_to_database)
+
+        # Readings are inserted through this when the table is split into a table for each day or week
+        self.partitioned_table = None
+        if partition_period is not None:
+            self.partitioned_table = database.init_database(table_name, column_info, True, path_to_database,
+                                                            partition_period=partition_period)
+
+        # Newest reading kept in memory for the alarm checks and the sensor outputs
+        self.latest_readings = get_latest_readings(table_name, path_to_database)
+
+    def store(self, sensor_values: dict, arrival_time: float) -> dict:
+        """
+        Stores one reading in the database and publishes it as the latest reading.
+
+        :param sensor_values: the validated values ex. {"water_temp": 70.5}. 'date_time' and 'timestamp' are added.
+        :param arrival_time: seconds since epoch the reading was received at
+        :return: the stored values
+        """
+
+        # 'date_time' is shown by the web app. 'timestamp' is indexed and used for every query.
+        sensor_values['date_time'] = datetime.fromtimestamp(arrival_time).strftime("%m/%d/%Y %H:%M:%S")
+        sensor_values['timestamp'] = int(arrival_time)
+
+        if self.partitioned_table is not None:
+            self.partitioned_table.insert(sensor_values)
+
+        else:
+            database.insert_data(self.table_name, sensor_values, self.path_to_database)
+
+        rollups.update_rollups(self.table_name, sensor_values, arrival_time, self.rollup_columns,
+                               self.path_to_database)
+        self.latest_readings.publish(sensor_values, arrival_time)
+
+        log.getLogger().debug(f"Stored a reading in '{self.table_name}'")
+
+        return sensor_values
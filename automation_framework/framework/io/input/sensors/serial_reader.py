@@ -0,0 +1,303 @@
+"""
+Background reading of a serial connection. A thread blocks on the connection and reads every byte as soon as it arrives
+into a preallocated buffer, splits it into lines of text and binary frames (see sensor_protocol), stamps each one with
+the time it arrived and parses it. The parsed readings are kept in a bounded ring buffer until the scheduler takes them,
+so a backlog is never left behind in the serial driver and the scheduler never waits on serial I/O.
+
+FrameSplitter does the splitting and parsing without reading anything so the IngestEngine can use it for many boards on
+one thread.
+"""
+
+import logging as log
+import threading
+import time
+
+from framework.io.input.sensors import sensor_protocol
+
+
+class ReadingBuffer:
+    """
+    Fixed size first in first out buffer shared by the reader thread and the scheduler. When it is full the oldest
+    reading is overwritten.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        """
+        :param capacity: max number of readings held before the oldest is overwritten
+        """
+
+        self.slots = [None] * capacity
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def push(self, item) -> None:
+        """
+        Adds an item after the newest one, overwriting the oldest if the buffer is full
+
+        :param item: the item to add
+        :return: None
+        """
+
+        with self.lock:
+
+            if self.count == self.capacity:
+                self.head = (self.head + 1) % self.capacity
+                self.count -= 1
+                self.dropped += 1
+
+            self.slots[(self.head + self.count) % self.capacity] = item
+            self.count += 1
+
+    def pop_all(self) -> list:
+        """
+        Takes every item out of the buffer
+
+        :return: the items, oldest first
+        """
+
+        with self.lock:
+
+            items = []
+            for index in range(self.count):
+
+                slot = (self.head + index) % self.capacity
+                items.append(self.slots[slot])
+                self.slots[slot] = None
+
+            self.head = 0
+            self.count = 0
+
+        return items
+
+
+class FrameSplitter:
+    """
+    Splits the bytes received from a sensor board into lines of text and binary frames. Each one that parses to a non
+    empty dict is pushed to a ReadingBuffer as (arrival time, reading).
+    """
+
+    def __init__(self, name: str, parse, readings: ReadingBuffer, buffer_size: int = 4096, parse_frame=None):
+        """
+        :param name: name of the sensor, used for the logs
+        :param parse: converts a decoded line to a dict of readings. An empty dict means the line was not valid.
+        :param readings: buffer the parsed readings are pushed to
+        :param buffer_size: longest line that can be received in bytes
+        :param parse_frame: converts the field name/value of a binary frame to a dict of readings (None to use them as
+            they are)
+        """
+
+        self.sensor_name = name
+        self.parse = parse
+        self.parse_frame = parse_frame
+        self.readings = readings
+
+        # Bytes of the line being received. The start of the buffer always holds the start of a line.
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.buffer_length = 0
+
+        self.bytes_read = 0
+        self.bytes_taken = 0
+        self.readings_received = 0
+        self.invalid_lines = 0
+        self.invalid_frames = 0
+        self.missed_frames = 0
+        self.last_sequence = None
+
+    def get_free_space(self) -> memoryview:
+        """
+        Gets the part of the buffer after the bytes already received. Bytes read into it are parsed by split_frames().
+
+        :return: the free part of the buffer, at least one byte long
+        """
+
+        # A line longer than the buffer is not from the sensor so throw it away
+        if self.buffer_length == len(self.buffer):
+
+            log.getLogger().warning(f"Serial reader '{self.sensor_name}' dropped {self.buffer_length} bytes "
+                                    f"without a line ending")
+            self.buffer_length = 0
+
+        return self.view[self.buffer_length:]
+
+    def split_frames(self, count: int, arrival_time: float) -> None:
+        """
+        Parses every complete line and frame in the buffer after new bytes were read into it. The rest of the last one
+        is moved to the start of the buffer.
+
+        :param count: number of bytes added after buffer_length
+        :param arrival_time: seconds since epoch the bytes were read at
+        :return: None
+        """
+
+        self.bytes_read += count
+        end = self.buffer_length + count
+        start = 0
+        while start < end:
+
+            # A line of text ends before the next frame starts
+            sync = self.buffer.find(sensor_protocol.sync_bytes, start, end)
+            newline = self.buffer.find(b"\n", start, end if sync < 0 else sync)
+            if newline >= 0:
+
+                self.push_line(bytes(self.view[start:newline]), arrival_time)
+                start = newline + 1
+
+            elif sync >= 0:
+
+                # Text without a line ending before a frame is the end of a line that was cut off
+                if sync > start:
+                    self.invalid_lines += 1
+                    start = sync
+
+                frame_length = sensor_protocol.get_frame_length(self.buffer, start, end)
+                if frame_length is None or start + frame_length > end:
+                    break
+
+                frame = sensor_protocol.decode_frame(self.buffer, start, frame_length) if frame_length else None
+                if frame is not None:
+                    self.push_frame(*frame, arrival_time)
+                    start += frame_length
+
+                else:
+                    # Damaged so look for the next sync bytes
+                    self.invalid_frames += 1
+                    start += 1
+
+            else:
+                break
+
+        self.buffer_length = end - start
+        if start > 0:
+            self.buffer[:self.buffer_length] = bytes(self.view[start:end])
+
+    def push_frame(self, sequence: int, values: dict, arrival_time: float) -> None:
+        """
+        Pushes the readings of a binary frame and counts the frames lost before it
+
+        :param sequence: sequence number of the frame
+        :param values: field name/value from the frame
+        :param arrival_time: seconds since epoch the frame was read at
+        :return: None
+        """
+
+        if self.last_sequence is not None and sequence != (self.last_sequence + 1) % 65536:
+
+            missed = (sequence - self.last_sequence - 1) % 65536
+            self.missed_frames += missed
+            log.getLogger().warning(f"Serial reader '{self.sensor_name}' missed {missed} frames")
+
+        self.last_sequence = sequence
+        if self.parse_frame is not None:
+            values = self.parse_frame(values)
+
+        if len(values) > 0:
+            self.readings.push((arrival_time, values))
+            self.readings_received += 1
+
+    def push_line(self, line: bytes, arrival_time: float) -> None:
+        """
+        Parses a line and pushes it to the readings if it is valid
+
+        :param line: the line without its line ending
+        :param arrival_time: seconds since epoch the line was read at
+        :return: None
+        """
+
+        values = self.parse(line.decode("utf-8", errors="replace").rstrip())
+        if len(values) > 0:
+            self.readings.push((arrival_time, values))
+            self.readings_received += 1
+
+        else:
+            self.invalid_lines += 1
+
+    def take_bytes_read(self) -> int:
+        """
+        :return: number of bytes read since the last call
+        """
+
+        # Only the caller writes bytes_taken so nothing is lost while the reader adds to bytes_read
+        bytes_read = self.bytes_read
+        new_bytes = bytes_read - self.bytes_taken
+        self.bytes_taken = bytes_read
+
+        return new_bytes
+
+
+class SerialReader(FrameSplitter, threading.Thread):
+    """
+    Reads lines and frames from a serial connection on its own thread until it is stopped.
+    """
+
+    def __init__(self, name: str, serial_connection, parse, readings: ReadingBuffer, buffer_size: int = 4096,
+                 parse_frame=None):
+        """
+        :param name: name of the sensor, used for the thread name and the logs
+        :param serial_connection: an open connection with readinto() and in_waiting, ex. a serial.Serial. Its timeout
+            is how often the thread checks if it was stopped.
+        :param parse: converts a decoded line to a dict of readings. An empty dict means the line was not valid.
+        :param readings: buffer the parsed readings are pushed to
+        :param buffer_size: longest line that can be received in bytes
+        :param parse_frame: converts the field name/value of a binary frame to a dict of readings (None to use them as
+            they are)
+        """
+
+        FrameSplitter.__init__(self, name, parse, readings, buffer_size, parse_frame)
+        threading.Thread.__init__(self, name=f"serial-reader-{name}", daemon=True)
+        self.serial_connection = serial_connection
+
+        self.stopped = threading.Event()
+        self.error = None
+
+    def run(self) -> None:
+
+        log.getLogger().debug(f"STARTING serial reader '{self.sensor_name}'")
+
+        while not self.stopped.is_set():
+
+            try:
+                # Wait for the first byte then take everything else already received
+                free_space = self.get_free_space()
+                count = self.serial_connection.readinto(free_space[:1])
+                if not count:
+                    continue
+
+                waiting = min(self.serial_connection.in_waiting, len(free_space) - 1)
+                if waiting > 0:
+                    count += self.serial_connection.readinto(free_space[1:1 + waiting])
+
+                self.split_frames(count, time.time())
+
+            except Exception as ex:
+
+                # Closing the connection to stop the thread also ends up here
+                if not self.stopped.is_set():
+                    self.error = ex
+                    log.getLogger().critical(f"FAILED serial reader '{self.sensor_name}' stopped. Exception: {ex}")
+                break
+
+        log.getLogger().debug(f"DONE serial reader '{self.sensor_name}'")
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Stops the thread. A read in progress is cancelled if the connection supports it, otherwise the thread ends when
+        the read times out.
+
+        :param timeout: seconds to wait for the thread to end (None to not wait)
+        :return: None
+        """
+
+        self.stopped.set()
+        cancel_read = getattr(self.serial_connection, "cancel_read", None)
+        if cancel_read is not None:
+            cancel_read()
+
+        if timeout is not None and self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
@@ -0,0 +1,151 @@
+"""
+Latest sensor readings shared between processes. The ingest process writes each new reading into a shared memory segment
+and the process that owns the gpio pins reads it directly, without a database query or a lock.
+
+The segment is a sequence lock (seqlock). The writer makes the sequence number odd, writes the values, then makes it even
+again. A reader copies the values and only keeps them if the sequence number was even and did not change while it was
+copying. There is one writer, so the writer never waits and a reader only retries if it raced a write.
+
+Layout: sequence (uint64) | timestamp (float64) | one float64 for each column (NaN when there is no value)
+"""
+
+import math
+import struct
+from datetime import datetime
+from multiprocessing import shared_memory
+
+header_format = "<Qd"
+header_size = struct.calcsize(header_format)
+
+
+class SharedReadings:
+
+    def __init__(self, name: str, columns: list, create: bool = False):
+        """
+        Creates or attaches to a shared memory segment for the latest readings of a sensor.
+
+        :param name: name of the shared memory segment. Both processes must use the same name.
+        :param columns: names of the numeric columns in the order they are stored
+        :param create: True in the process that creates the segment, False to attach to an existing one
+        """
+
+        self.name = name
+        self.columns = list(columns)
+        self.column_index = {column: index for index, column in enumerate(self.columns)}
+        self.values_format = f"<{len(self.columns)}d"
+        self.size = header_size + struct.calcsize(self.values_format)
+
+        self.shared_memory = shared_memory.SharedMemory(name=name, create=create, size=self.size)
+        self.buffer = self.shared_memory.buf
+
+        if create:
+            self.clear()
+
+        else:
+            # Carry on from the last writer so the sequence number never goes back. Rounded up to even in case the last
+            # writer stopped in the middle of a write.
+            self.sequence = struct.unpack_from("<Q", self.buffer, 0)[0]
+            self.sequence += self.sequence & 1
+
+    def clear(self) -> None:
+        """
+        Removes the latest reading so readers get None until a new one is published. Only call this when no other
+        process is writing, ex. after the ingest process died.
+
+        :return: None
+        """
+
+        self.sequence = 0
+        struct.pack_into(header_format, self.buffer, 0, 0, 0.0)
+        struct.pack_into(self.values_format, self.buffer, header_size, *([math.nan] * len(self.columns)))
+
+    def publish(self, values: dict, timestamp: float) -> None:
+        """
+        Writes a new reading. Only call this from the one process that owns the sensor.
+
+        :param values: column name/value for the reading. Missing columns are stored as NaN.
+        :param timestamp: time of the reading in seconds since epoch
+        :return: None
+        """
+
+        packed_values = []
+        for column in self.columns:
+
+            value = values.get(column)
+            packed_values.append(math.nan if value is None else float(value))
+
+        # Odd sequence number means a write is in progress
+        self.sequence += 1
+        struct.pack_into("<Q", self.buffer, 0, self.sequence)
+
+        struct.pack_into("<d", self.buffer, 8, timestamp)
+        struct.pack_into(self.values_format, self.buffer, header_size, *packed_values)
+
+        self.sequence += 1
+        struct.pack_into("<Q", self.buffer, 0, self.sequence)
+
+    def read(self, max_tries: int = 100):
+        """
+        Reads the latest reading
+
+        :param max_tries: number of times to retry if a write happens during the read
+        :return: (timestamp, tuple of values) or None if nothing has been published yet or every try raced a write
+        """
+
+        for try_count in range(max_tries):
+
+            sequence_before = struct.unpack_from("<Q", self.buffer, 0)[0]
+            if sequence_before & 1:
+                continue
+
+            timestamp = struct.unpack_from("<d", self.buffer, 8)[0]
+            values = struct.unpack_from(self.values_format, self.buffer, header_size)
+
+            if struct.unpack_from("<Q", self.buffer, 0)[0] == sequence_before:
+
+                if sequence_before == 0:
+                    return None
+
+                return timestamp, values
+
+        return None
+
+    def get_sensor_reading(self, columns: list):
+        """
+        Same result as database.get_sensor_reading() but read from shared memory. The 'timestamp' and 'date_time'
+        columns are filled in from the timestamp of the reading.
+
+        :param columns: columns to get ex. ["timestamp", "water_temp"]
+        :return: a list with the values of the columns or None if there is no reading
+        """
+
+        reading = self.read()
+        if reading is None:
+            return None
+
+        timestamp, values = reading
+        result = []
+        for column in columns:
+
+            if column == "timestamp":
+                result.append(timestamp)
+
+            elif column == "date_time":
+                result.append(datetime.fromtimestamp(timestamp).strftime("%m/%d/%Y %H:%M:%S"))
+
+            else:
+                value = values[self.column_index[column]]
+                result.append(None if math.isnan(value) else value)
+
+        return result
+
+    def close(self) -> None:
+        """ Detaches from the shared memory segment """
+
+        self.buffer = None
+        self.shared_memory.close()
+
+    def unlink(self) -> None:
+        """ Removes the shared memory segment. Only call this in the process that created it. """
+
+        self.shared_memory.unlink()
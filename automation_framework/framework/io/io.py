@@ -2,14 +2,19 @@
 This the parent class to input and output objects
 """
 import inspect
+import logging as log
 import time
 from enum import Enum
+from typing import TYPE_CHECKING
 
-from framework.managers.email import EmailController
-from framework.time.timer import Timer
+from framework.io.actions import ActionSlot, action, build_slot, compile_action_registry, validate_action_names
 
 from datetime import datetime
 
+# Only needed for type hints. Importing it at runtime would load smtplib and ssl for every object.
+if TYPE_CHECKING:
+    from framework.managers.email import EmailController
+
 
 class IoType(Enum):
 
@@ -20,21 +25,25 @@ class IoType(Enum):
 
 class Io:
 
+    # Rows of the settings table used by the class. Setting name/function that converts the stored value to the type the
+    # class uses ex. {"on_time": int}. The settings service calls apply_settings() when one of them changes.
+    database_settings = {}
+
     def __init__(self, name: str, io_type: IoType, actions: dict, output_pins: list):
         """
         Init Io object
 
         :param name: name of the output
-        :param actions: method name/how often to call method key/value pair
+        :param actions: action name/how often to call it key/value pair. Each action must be a method marked with
+            @action. How often can be a number of seconds, null to use the default or a dictionary such as
+            {"interval": 2, "missed_ticks": "coalesce", "blocking": false, "timeout": 10} for a fixed rate timer
         :param output_pins: output pins being used by the output
         """
 
         self.gpio_controller = None
-        self.timers = {}
         self.name = name
         self.io_type = io_type
         self.output_pins = output_pins
-        self.actions = self.build_actions_dict(list(actions.keys()))
 
         self.email_controller = None
 
@@ -42,11 +51,31 @@ class Io:
         self.timer_name = ""
 
         # Instead of storing a timer object in the json just store the name and interval. That is all you need to create
-        # a timer. To link timers to a method use the timer name as a key and the class method as a value to add to the
-        # dictionary named actions in perform_actions() method for that class.
-        self.timers = {}
-        for key in actions.keys():
-            self.timers[key] = Timer(name, actions[key])
+        # a timer. Each action in the json becomes a slot in the dispatch table holding the bound method, its timer and
+        # how it should be run. The slots keep the order of the actions in the json file.
+        # The value for each action can be an interval, null to use the default from the @action decorator or a
+        # dictionary. A dictionary with 'missed_ticks' or "fixed_rate": true uses a fixed rate timer.
+        # See Timer.from_config()
+        # Actions that do blocking io (serial, http, smtp...) are run off of the main thread when the runtime supports
+        # it so they can not delay other outputs. ex. {"call_api": {"interval": 3600, "blocking": true, "timeout": 60}}
+        validate_action_names(self.__class__, actions, name)
+        self.action_slots = [build_slot(self, key, actions[key]) for key in actions.keys()]
+        self.action_table = {slot.name: slot for slot in self.action_slots}
+
+        # Name/method and name/timer lookups used by the schedulers and subclasses
+        self.actions = {slot.name: slot.method for slot in self.action_slots}
+        self.timers = {slot.name: slot.timer for slot in self.action_slots}
+
+        self.action_executor = None
+
+        # Path of the json file the object was created from. Set by json_loader and used to reload the file.
+        self.config_path = None
+
+    def __init_subclass__(cls, **kwargs):
+        """ Compiles the actions marked with @action one time for each class """
+
+        super().__init_subclass__(**kwargs)
+        cls.action_registry = compile_action_registry(cls)
 
     def check_time(self) -> dict:
         """
@@ -57,60 +86,155 @@ class Io:
         """
 
         results = {}
-        for key in self.timers.keys():
+        for slot in self.action_slots:
 
-            results[key] = self.timers[key].check_time()
+            results[slot.name] = slot.timer.check_time()
 
         return results
 
-    def build_actions_dict(self, actions_input: list) -> dict:
+    def perform_actions(self, timer_results: dict) -> None:
+        """
+        This method is used to execute each of the actions this output should perform. Each action can have its own
+        interval. This also makes it easy to setup the order and interval of actions in the json file.
+
+        :param timer_results: results for each of the timers stored in the output
+        :return: None
+        """
+
+        # Check each of the time_results. Each key is a function name from the given class.
+        for key in timer_results.keys():
+
+            # If the value is True call the method from the given class
+            if timer_results[key]:
+                self.dispatch(self.action_table[key])
+
+    def tick(self) -> None:
         """
-        The purpose of this method is the preserve the order the actions in the json file. The actions or methods will
-        be called in the order as they appear in the json file for the object in the 'actions' field. This is so the
-        methods can later be called by perform_actions.
+        Same as calling check_time() then perform_actions() but walks the dispatch table directly without creating a
+        results dictionary.
 
-        :param actions_input: a list of methods that the input will call when running
-        :return: method name (action name)/point to the method
+        :return: None
         """
 
-        # This is a map of of the method name (a string) to the method itself.
-        actions = {}
-        object_members = inspect.getmembers(self)
-        for action in actions_input:
+        for slot in self.action_slots:
 
-            action_found = False
-            for member in object_members:
+            if slot.timer.check_time():
+                self.dispatch(slot)
 
-                if member[0] == action:
+    def dispatch(self, slot: ActionSlot) -> None:
+        """
+        Calls the action in a dispatch slot. Actions marked as blocking are sent to the action executor (if one is set)
+        so they run in a thread pool with a timeout instead of on the main thread. The run time and lateness of each call
+        are recorded in the stats of the slot.
 
-                    actions[action] = member[1]
-                    action_found = True
-                    break
+        :param slot: the slot of the action to run
+        :return: None
+        """
 
-            if not action_found:
-                raise ValueError(f"'{action}' is not a method name found in '{self.name}' object type '{self.__class__}'")
+        if slot.blocking and self.action_executor is not None:
+            self.action_executor.submit(self, slot.name, slot.timeout)
 
-        return actions
+        else:
+            start_seconds = time.perf_counter()
+            slot.method()
+            slot.stats.record(time.perf_counter() - start_seconds, slot.timer.lateness)
 
-    def perform_actions(self, timer_results: dict) -> None:
+    def run_action(self, action_name: str) -> None:
         """
-        This method is used to execute each of the actions this output should perform. Each action can have its own
-        interval. self.actions is a python dictionary where the keys are method names and the value is the method
-        itself. This ensures the name in the json matches to an actual method belonging to that class. This also makes
-        it easy to setup the order and interval of actions in the json file.
+        Calls one of the actions by name. See dispatch().
 
-        :param timer_results: results for each of the timers stored in the output
+        :param action_name: name of the action to run
         :return: None
         """
 
-        # Check each of the time_results. Each key is a function name from the given class.
-        for key in timer_results.keys():
+        self.dispatch(self.action_table[action_name])
 
-            # If the value is True call the method from the given class
-            if timer_results[key]:
-                self.actions[key]()
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file to the object without re-creating it. The base class handles the 'actions' field.
+        Timers of actions that are still in the file keep their place in the cycle and only get the new interval, so
+        nothing is run early or twice because of a reload. Subclasses extend this to update their own settings.
 
-    def set_email_controller(self, email_controller: EmailController) -> None:
+        :param data: the new contents of the json file
+        :return: if the actions changed and the object needs to be rescheduled
+        """
+
+        actions = data["actions"]
+        validate_action_names(self.__class__, actions, self.config_path)
+
+        changed = list(actions.keys()) != [slot.name for slot in self.action_slots]
+        action_slots = []
+        for key in actions.keys():
+
+            slot = build_slot(self, key, actions[key])
+            old_slot = self.action_table.get(key)
+
+            # Keep the running timer if it is the same kind of timer
+            if old_slot is not None and old_slot.timer.fixed_rate == slot.timer.fixed_rate and \
+                    old_slot.timer.missed_tick_policy == slot.timer.missed_tick_policy:
+
+                if old_slot.timer.interval != slot.timer.interval:
+                    log.getLogger().warning(f"'{self.name}' action '{key}' interval changed from "
+                                            f"{old_slot.timer.interval} to {slot.timer.interval}")
+                    old_slot.timer.interval = slot.timer.interval
+                    changed = True
+
+                slot.timer = old_slot.timer
+
+                # The schedulers hold on to the slot itself, so they need the new one to run the action the new way
+                if old_slot.blocking != slot.blocking or old_slot.timeout != slot.timeout:
+                    changed = True
+
+            else:
+                changed = True
+
+            action_slots.append(slot)
+
+        self.action_slots = action_slots
+        self.action_table = {slot.name: slot for slot in action_slots}
+        self.actions = {slot.name: slot.method for slot in action_slots}
+        self.timers = {slot.name: slot.timer for slot in action_slots}
+
+        return changed
+
+    def apply_settings(self, settings: dict) -> None:
+        """
+        Applies settings changed in the database (see SettingsService). Only the settings in database_settings that
+        changed are passed in and each value has already been converted to its type. Subclasses that use settings
+        override this.
+
+        :param settings: setting name/new value
+        :return: None
+        """
+
+        pass
+
+    def set_action_executor(self, action_executor) -> None:
+        """
+        Setter for the action executor. There should be one executor shared by every object so the number of threads
+        stays bounded.
+
+        :param action_executor: the ActionExecutor used to run blocking actions
+        """
+
+        self.action_executor = action_executor
+
+    def get_async_action(self, action_name: str):
+        """
+        Classes can provide a coroutine version of an action by adding a method named 'async_<action name>'. The asyncio
+        runtime uses it in place of the normal action.
+
+        :param action_name: name of the action in the json file
+        :return: the coroutine method or None if the class does not have one
+        """
+
+        method = getattr(self, "async_" + action_name, None)
+        if method is not None and inspect.iscoroutinefunction(method):
+            return method
+
+        return None
+
+    def set_email_controller(self, email_controller: "EmailController") -> None:
 
         pass
 
@@ -131,6 +255,10 @@ class Io:
 
         print(f"{self.timer_name} took: {time.time() - self.start_time}")
 
+    @action()
     def test_execution_interval(self) -> None:
         """ Used for debugging. Shows the interval a method is being executed. """
-        print(f"{self.name}: {datetime.now().strftime('%m/%d/%Y %H:%M:%S')}")
\ No newline at end of file
+        print(f"{self.name}: {datetime.now().strftime('%m/%d/%Y %H:%M:%S')}")
+
+
+Io.action_registry = compile_action_registry(Io)
@@ -3,11 +3,17 @@ This is the parent class to all outputs. This contains common variables and meth
 across all outputs.
 """
 
+from typing import TYPE_CHECKING
+
 from framework.database.database import ResultCount, path_to_database, update_output_state, select_data
-from framework.io.gpio import GPIOController
+from framework.io.actions import action
 from framework.io.io import Io, IoType
 import logging as log
 
+# Only needed for type hints. The gpio controller is passed in by framework_controller.
+if TYPE_CHECKING:
+    from framework.io.gpio import GPIOController
+
 
 class Output(Io):
 
@@ -35,6 +41,7 @@ class Output(Io):
 
         return self.state
 
+    @action(interval=60)
     def confirm_state(self) -> None:
         """
         Checks the state of each output pin against the variable stored in the object then logs the result
@@ -49,7 +56,7 @@ class Output(Io):
             else:
                 log.getLogger().error(f"{self.name} pin: {pin} should be {self.state} but is {not self.state}")
 
-    def set_gpio_controller(self, gpio_controller: GPIOController) -> None:
+    def set_gpio_controller(self, gpio_controller: "GPIOController") -> None:
         """
         Setter for gpio_controller. There should only be one gpio object per raspberry pi so pass each output object a
         reference to same object.
@@ -59,15 +66,18 @@ class Output(Io):
 
         self.gpio_controller = gpio_controller
 
+    @action(interval=5)
     def print_state(self) -> None:
         """ Used for debugging. Prints the current state of object. """
         print(f"{self.name}: {self.state}")
 
+    @action(interval=60)
     def log_state(self):
         """ Used for debugging. Logs the current state of the object. """
 
         update_output_state("sensors.db", self.name, self.state)
 
+    @action(interval=60)
     def print_log_state(self):
         """ Used for debugging. Prints the state of the output object stored in the database. """
 
@@ -1,6 +1,7 @@
 from datetime import datetime
 import logging as log
 
+from framework.io.actions import action
 from framework.io.output.output import Output
 
 
@@ -70,6 +71,24 @@ class ClockOutput(Output):
         self.on_hour = self.week_schedule[self.num_to_string[self.day_of_week]]["on_hour"]
         self.off_hour = self.week_schedule[self.num_to_string[self.day_of_week]]["off_hour"]
 
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file. The new schedule is used the next time find_state() runs.
+
+        :param data: the new contents of the json file
+        :return: if the object needs to be rescheduled
+        """
+
+        rescheduled = super().apply_config(data)
+
+        if "week_schedule" in data:
+            self.week_schedule = data["week_schedule"]
+            self._validate_hour()
+            self.set_on_off_time()
+
+        return rescheduled
+
+    @action(interval=60)
     def find_state(self) -> None:
         """ Using the current time and the on/off hours find the current state of the output """
 
@@ -106,6 +125,7 @@ class ClockOutput(Output):
             self.state = result
             self.gpio_controller.toggle_pins(self.output_pins, self.state)
 
+    @action(interval=1)
     def check_block_button(self) -> None:
         """
         Checks the button used to block the output. If the output is blocked it will be set to false for the duration
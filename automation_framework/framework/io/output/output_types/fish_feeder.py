@@ -1,11 +1,12 @@
 from datetime import datetime
 
-from framework.database.database import select_data, ResultCount
 from framework.io.output.output_types.clock_output import ClockOutput
 
 
 class FishFeeder(ClockOutput):
 
+    database_settings = {"fishfeeder_time": int, "fishfeeder_amount": int}
+
     def __init__(self, name: str, actions: dict, out_pins: list, feeding_time: int, feeding_amount: int):
 
         super().__init__(name, actions, out_pins, self.populate_weekly_schedule(int(feeding_time)))
@@ -48,12 +49,36 @@ class FishFeeder(ClockOutput):
 
         return weekly_schedule
 
-    def update_from_database(self):
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file. The weekly schedule is rebuilt from the feeding time.
+
+        :param data: the new contents of the json file
+        :return: if the object needs to be rescheduled
+        """
+
+        data = dict(data, week_schedule=self.populate_weekly_schedule(int(data["feeding_time"])))
+        rescheduled = super().apply_config(data)
+
+        self.feeding_time = data["feeding_time"]
+        self.feeding_amount = data["feeding_amount"]
+
+        return rescheduled
+
+    def apply_settings(self, settings: dict) -> None:
+        """
+        Applies the feeding time and amount changed in the web app. A new feeding time rebuilds the weekly schedule.
+
+        :param settings: 'fishfeeder_time' (hour of the day) and/or 'fishfeeder_amount'
+        :return: None
+        """
+
+        if "fishfeeder_time" in settings and settings["fishfeeder_time"] != int(self.feeding_time):
 
-        temp_feeding_time = select_data("Settings", ResultCount.ONE, columns=["Value"], where="Setting_name LIKE 'fishfeeder_time'")
-        if self.feeding_time != temp_feeding_time:
-            self.feeding_time = temp_feeding_time
+            self.feeding_time = settings["fishfeeder_time"]
+            self.week_schedule = self.populate_weekly_schedule(self.feeding_time)
+            self._validate_hour()
+            self.set_on_off_time()
 
-        temp_feeding_amount = select_data("Settings", ResultCount.ONE, columns=["Value"], where="Setting_name LIKE 'fishfeeder_amount'")
-        if self.feeding_amount != temp_feeding_amount:
-            self.feeding_amount = temp_feeding_amount
\ No newline at end of file
+        if "fishfeeder_amount" in settings:
+            self.feeding_amount = settings["fishfeeder_amount"]
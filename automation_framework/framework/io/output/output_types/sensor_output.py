@@ -1,12 +1,12 @@
 from collections import OrderedDict
 from typing import Union
 import logging as log
+import time
 
-from framework.database import database
+from framework.io.input.latest_readings import get_latest_readings
+from framework.io.actions import action
 from framework.io.output.output import Output
 
-from datetime import datetime
-
 
 class SensorOutput(Output):
 
@@ -44,6 +44,7 @@ class SensorOutput(Output):
 
         self.table_name = table_name
         self.columns = columns
+        self.query_columns = self.build_query_columns(columns)
 
         self.value_shift = value_shift
         self.target_value = target_value
@@ -56,9 +57,13 @@ class SensorOutput(Output):
 
         self.blocking_outputs = {}
 
+        # Where the latest readings come from. None means the in memory store the sensor of the table publishes to.
+        self.reading_source = None
+
         log.getLogger().debug(f"DONE to creating a sensor output named '{name}'")
         log.getLogger().debug("")
 
+    @action(interval=5)
     def find_state(self) -> None:
         """ Finds if the output associated with this sensor should be on or off based on the following """
 
@@ -171,14 +176,12 @@ class SensorOutput(Output):
 
             return False
 
-        reading_timestamp = datetime.strptime(self.sensor_values[0], "%m/%d/%Y %H:%M:%S")
-        now = datetime.now()
+        # Format is [timestamp, sensor_value]. Comparing numbers is much cheaper than parsing a date each tick.
+        seconds_since_reading = time.time() - self.sensor_values[0]
 
         sensor_value = self.sensor_values[1]
 
-        time_since_last_reading = now - reading_timestamp
-        if sensor_value is not None and time_since_last_reading.days == 0 and \
-                time_since_last_reading.seconds <= self.good_reading_interval:
+        if sensor_value is not None and 0 <= seconds_since_reading <= self.good_reading_interval:
 
             log.getLogger().debug(f"Sensor reading is valid.")
             result = True
@@ -192,14 +195,63 @@ class SensorOutput(Output):
 
         return result
 
+    @action(interval=5)
     def get_sensor_values(self):
 
         log.getLogger().debug(f"STARTING get_sensor_value '{self.name}'")
 
-        self.sensor_values = database.get_sensor_reading(self.database_name, self.table_name, self.columns)
+        if self.reading_source is not None:
+            self.sensor_values = self.reading_source.get_sensor_reading(self.query_columns)
+
+        else:
+            self.sensor_values = get_latest_readings(self.table_name).get_sensor_reading(self.query_columns)
 
         log.getLogger().debug(f"DONE get_sensor_value '{self.name}'")
 
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file. The output keeps its state and modulation point.
+
+        :param data: the new contents of the json file
+        :return: if the object needs to be rescheduled
+        """
+
+        rescheduled = super().apply_config(data)
+
+        self.table_name = data["table_name"]
+        self.columns = data["columns"]
+        self.query_columns = self.build_query_columns(self.columns)
+        self.value_shift = data["value_shift"]
+        self.target_value = data["target_value"]
+        self.target_range = data["target_range"]
+        self.good_reading_interval = data["good_reading_interval"]
+        self.max_value = data["max_value"]
+        self.min_value = data["min_value"]
+
+        return rescheduled
+
+    @staticmethod
+    def build_query_columns(columns: list) -> list:
+        """
+        The json files name the time column 'date_time'. Readings are looked up by their 'timestamp' (seconds since
+        epoch) instead so they can be checked without parsing a date.
+
+        :param columns: columns from the json file ex. ["date_time", "water_temp"]
+        :return: the columns to query ex. ["timestamp", "water_temp"]
+        """
+
+        return ["timestamp" if column == "date_time" else column for column in columns]
+
+    def set_reading_source(self, reading_source) -> None:
+        """
+        Setter for where the latest sensor readings are read from. Used to read straight from the shared memory of an
+        ingest process when the sensor does not run in this process.
+
+        :param reading_source: an object with a get_sensor_reading(columns) method such as SharedReadings
+        """
+
+        self.reading_source = reading_source
+
     def set_blocking_output(self, output: dict):
 
         log.getLogger().debug(f"STARTING set_blocking_output '{self.name}'")
@@ -237,6 +289,7 @@ class SensorOutput(Output):
 
         log.getLogger().debug(f"DONE toggle_state '{self.name}'")
 
+    @action(interval=5)
     def print_state(self):
 
         pin_states = {}
@@ -5,12 +5,14 @@ This class is to create an output object that is toggled based on time
 import logging as log
 from collections import OrderedDict
 
-from framework.database.database import select_data, ResultCount
+from framework.io.actions import action
 from framework.io.output.output import Output
 
 
 class TimerOutput(Output):
 
+    database_settings = {"on_time": int, "off_time": int}
+
     def __init__(self,  name: str, actions: OrderedDict, output_pins: list,
                  on_seconds: int, off_seconds: int):
         """
@@ -38,12 +40,16 @@ class TimerOutput(Output):
         log.getLogger().debug(f"DONE creating a timer based output named '{name}'")
         log.getLogger().debug("")
 
+    @action(interval=2)
     def find_state(self) -> None:
         """
         Finds the state of the timer using the number of seconds for each part of the cycle
         """
 
-        self.current_timer -= self.timers["find_state"].interval
+        # A fixed rate timer that went off late can stand for more than one interval. Count all of them so the on/off
+        # cycle stays the same length.
+        timer = self.timers["find_state"]
+        self.current_timer -= timer.interval * timer.ticks
 
         if self.current_timer <= 0:
 
@@ -62,12 +68,42 @@ class TimerOutput(Output):
             self.state = result
             self.gpio_controller.toggle_pins(self.output_pins, self.state)
 
-    def update_from_database(self):
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file. See set_on_off_seconds().
+
+        :param data: the new contents of the json file
+        :return: if the object needs to be rescheduled
+        """
+
+        rescheduled = super().apply_config(data)
+        self.set_on_off_seconds(data["on_seconds"], data["off_seconds"])
 
-        temp_seconds = select_data("Settings", ResultCount.ONE, columns=["Value"], where="Setting_name LIKE 'on_time'")
-        if self.on_seconds != temp_seconds:
-            self.on_seconds = temp_seconds
+        return rescheduled
+
+    def apply_settings(self, settings: dict) -> None:
+        """
+        Applies the on and off times changed in the web app
+
+        :param settings: 'on_time' and/or 'off_time' in seconds
+        :return: None
+        """
+
+        self.set_on_off_seconds(settings.get("on_time", self.on_seconds), settings.get("off_time", self.off_seconds))
+
+    def set_on_off_seconds(self, on_seconds: int, off_seconds: int) -> None:
+        """
+        Changes the length of the on and off parts of the cycle. The current part keeps running. If its new length is
+        shorter than the time left, the time left is cut to the new length.
+
+        :param on_seconds: seconds to stay on
+        :param off_seconds: seconds to stay off
+        :return: None
+        """
+
+        self.on_seconds = on_seconds
+        self.off_seconds = off_seconds
 
-        temp_seconds = select_data("Settings", ResultCount.ONE, columns=["Value"], where="Setting_name LIKE 'off_time'")
-        if self.off_seconds != temp_seconds:
-            self.off_seconds = temp_seconds
\ No newline at end of file
+        current_length = self.on_seconds if self.state else self.off_seconds
+        if self.current_timer > current_length:
+            self.current_timer = current_length
@@ -3,17 +3,28 @@ Utilizes the data in the JSON files located in the resources folder. Mainly used
 to create the output objects.
 """
 import collections
+import importlib
 import json
-
-from framework.database.database_manager import DatabaseManager
-from framework.io.output.output_types.fish_feeder import FishFeeder
-from framework.managers.email import EmailController
-from framework.io.input.sensors.multi_sensor import MultiSensor
-from framework.io.output.output_types.clock_output import ClockOutput
-from framework.io.output.output_types.sensor_output import SensorOutput
-from framework.io.output.output_types.timer_output import TimerOutput
-from framework.managers.plant_buddy import PlantBuddy
-from framework.managers.weather import WeatherManager
+from typing import TYPE_CHECKING
+
+from framework.io.actions import validate_action_names
+
+# Only needed for type hints. The modules are imported by get_device_type() when a json file uses them.
+if TYPE_CHECKING:
+    from framework.database.database_manager import DatabaseManager
+    from framework.database.settings import SettingsService
+    from framework.database.writer import DatabaseWriter
+    from framework.io.input.ingest_process import IngestProcess
+    from framework.io.input.sensors.ingest_engine import IngestEngine
+    from framework.io.input.sensors.multi_sensor import MultiSensor
+    from framework.io.output.output_types.clock_output import ClockOutput
+    from framework.io.output.output_types.fish_feeder import FishFeeder
+    from framework.io.output.output_types.sensor_output import SensorOutput
+    from framework.io.output.output_types.timer_output import TimerOutput
+    from framework.managers.config_watcher import ConfigWatcher
+    from framework.managers.email import EmailController
+    from framework.managers.plant_buddy import PlantBuddy
+    from framework.managers.weather import WeatherManager
 
 path_to_clock_outputs = "./resources/json_files/outputs/clock_outputs/"
 path_to_timer_outputs = "./resources/json_files/outputs/timer_outputs/"
@@ -24,10 +35,68 @@ path_to_email_info = "./resources/json_files/emails/"
 path_to_managers = "./resources/json_files/managers/"
 path_to_misc = "./resources/json_files/outputs/misc/"
 
+# Every type of input, output and manager. Type name/(module, class name). A module is only imported the first time a
+# json file of that type is loaded, so a controller that only runs timer outputs never loads requests, serial or smtplib.
+device_types = {"ClockOutput": ("framework.io.output.output_types.clock_output", "ClockOutput"),
+                "TimerOutput": ("framework.io.output.output_types.timer_output", "TimerOutput"),
+                "SensorOutput": ("framework.io.output.output_types.sensor_output", "SensorOutput"),
+                "FishFeeder": ("framework.io.output.output_types.fish_feeder", "FishFeeder"),
+                "MultiSensor": ("framework.io.input.sensors.multi_sensor", "MultiSensor"),
+                "IngestProcess": ("framework.io.input.ingest_process", "IngestProcess"),
+                "IngestEngine": ("framework.io.input.sensors.ingest_engine", "IngestEngine"),
+                "EmailController": ("framework.managers.email", "EmailController"),
+                "DatabaseManager": ("framework.database.database_manager", "DatabaseManager"),
+                "WeatherManager": ("framework.managers.weather", "WeatherManager"),
+                "PlantBuddy": ("framework.managers.plant_buddy", "PlantBuddy"),
+                "SettingsService": ("framework.database.settings", "SettingsService"),
+                "ConfigWatcher": ("framework.managers.config_watcher", "ConfigWatcher"),
+                "DatabaseWriter": ("framework.database.writer", "DatabaseWriter")}
+
+# Classes that have already been imported. Type name/class.
+loaded_device_types = {}
+
+
+def get_device_type(type_name: str):
+    """
+    Gets the class for a type of input, output or manager. The module holding the class is imported the first time
+    the type is used.
+
+    :param type_name: key in device_types ex. 'TimerOutput'
+    :return: the class
+    """
+
+    device_class = loaded_device_types.get(type_name)
+    if device_class is None:
+
+        if type_name not in device_types:
+            raise ValueError(f"Unknown device type '{type_name}'. Known types are: {', '.join(device_types.keys())}")
 
+        module_name, class_name = device_types[type_name]
+        device_class = getattr(importlib.import_module(module_name), class_name)
+        loaded_device_types[type_name] = device_class
 
+    return device_class
 
-def create_clock_output(file_name: str, block_button_pin: int = None, block_duration: int = None) -> ClockOutput:
+
+def load_config(path: str, io_class) -> dict:
+    """
+    Loads the json file for an input, output or manager and checks that each name in its 'actions' field is an action
+    of the class. This way a typo in a json file is found when the file is loaded.
+
+    :param path: path to the json file
+    :param io_class: class the json file is for
+    :return: the data in the json file
+    """
+
+    with open(path, 'r') as json_file:
+        data = json.load(json_file, object_pairs_hook=collections.OrderedDict)
+
+    validate_action_names(io_class, data["actions"], path)
+
+    return data
+
+
+def create_clock_output(file_name: str, block_button_pin: int = None, block_duration: int = None) -> "ClockOutput":
     """
     Creates a clock output based on the given file name. This function looks in the
     resources folder a matching JSON file and creates an object.
@@ -39,14 +108,17 @@ def create_clock_output(file_name: str, block_button_pin: int = None, block_dura
     """
 
     path = path_to_clock_outputs + file_name
-    with open(path, 'r') as json_file:
-        data = json.load(json_file)
+    device_class = get_device_type("ClockOutput")
+    data = load_config(path, device_class)
+
+    clock_output = device_class(data["name"], data["actions"], data["out_pins"], data["week_schedule"],
+                                block_button_pin=block_button_pin, block_duration=block_duration)
+    clock_output.config_path = path
 
-    return ClockOutput(data["name"], data["actions"], data["out_pins"], data["week_schedule"],
-                       block_button_pin=block_button_pin, block_duration=block_duration)
+    return clock_output
 
 
-def create_timer_output(file_name: str) -> TimerOutput:
+def create_timer_output(file_name: str) -> "TimerOutput":
     """
     Creates a timer output based on the given file name. This function looks in the
     resources folder a matching JSON file and creates an object.
@@ -56,14 +128,17 @@ def create_timer_output(file_name: str) -> TimerOutput:
     """
 
     path = path_to_timer_outputs + file_name
-    with open(path, 'r') as json_file:
-        data = json.load(json_file, object_pairs_hook=collections.OrderedDict)
+    device_class = get_device_type("TimerOutput")
+    data = load_config(path, device_class)
+
+    timer_output = device_class(data["name"], data["actions"], data["out_pins"], data["on_seconds"],
+                                data["off_seconds"])
+    timer_output.config_path = path
 
-    return TimerOutput(data["name"], data["actions"], data["out_pins"], data["on_seconds"],
-                       data["off_seconds"])
+    return timer_output
 
 
-def create_multi_sensor(file_name: str) -> MultiSensor:
+def create_multi_sensor(file_name: str) -> "MultiSensor":
     """
     Creates a multi-sensor output based on the given file name. This function looks in the
     resources folder a matching JSON file and creates an object.
@@ -73,16 +148,55 @@ def create_multi_sensor(file_name: str) -> MultiSensor:
     """
 
     path = path_to_sensor_inputs + file_name
-    with open(path, 'r') as json_file:
-        data = json.load(json_file)
+    device_class = get_device_type("MultiSensor")
+    data = load_config(path, device_class)
+
+    multi_sensor = device_class(data["name"], data["actions"], data["database_table_name"],
+                                data["database_column_info"], data["serial_connection_string"],
+                                data["alarm_values"], data["mac_address"], data["buadrate"], data["timeout"],
+                                data["no_readings_limit"], data.get("partition_period"),
+                                data.get("reading_buffer_size", 1024), data.get("label_aliases"))
+    multi_sensor.config_path = path
 
-    return MultiSensor(data["name"], data["actions"],
-                       data["database_table_name"], data["database_column_info"], data["serial_connection_string"],
-                       data["alarm_values"], data["mac_address"], data["buadrate"], data["timeout"],
-                       data["no_readings_limit"])
+    return multi_sensor
 
 
-def create_sensor_output(file_name: str) -> SensorOutput:
+def create_ingest_engine(file_name: str) -> "IngestEngine":
+    """
+    Creates an engine that reads several sensor boards on one thread. The engine is not started. This function looks in
+    the resources folder for a matching JSON file.
+
+    :param file_name: name of the JSON in resources/json_files/inputs/sensors
+    :return: IngestEngine
+    """
+
+    path = path_to_sensor_inputs + file_name
+    device_class = get_device_type("IngestEngine")
+    data = load_config(path, device_class)
+
+    ingest_engine = device_class(data["name"], data["actions"], data["devices"], data.get("reading_buffer_size", 1024),
+                                 stale_timeout=data.get("stale_timeout", 30))
+    ingest_engine.config_path = path
+
+    return ingest_engine
+
+
+def create_ingest_process(file_name: str):
+    """
+    Creates a worker process to run a multi-sensor in. The process is not started. This function looks in the
+    resources folder for a matching JSON file.
+
+    :param file_name: name of the JSON in resources/json_files/inputs/sensors
+    :return: IngestProcess
+    """
+
+    path = path_to_sensor_inputs + file_name
+    data = load_config(path, get_device_type("MultiSensor"))
+
+    return get_device_type("IngestProcess")(file_name, data["database_column_info"])
+
+
+def create_sensor_output(file_name: str) -> "SensorOutput":
     """
     Creates a sensor output based on the given file name. This function looks in the
     resources folder a matching JSON file and creates an object.
@@ -92,12 +206,15 @@ def create_sensor_output(file_name: str) -> SensorOutput:
     """
 
     path = path_to_sensor_outputs + file_name
-    with open(path, 'r') as json_file:
-        data = json.load(json_file)
+    device_class = get_device_type("SensorOutput")
+    data = load_config(path, device_class)
+
+    sensor_output = device_class(data["name"], data["actions"], data["out_pins"],
+                                 data["table_name"], data["columns"], data["value_shift"], data["target_value"],
+                                 data["target_range"], data["good_reading_interval"], data["max_value"], data["min_value"])
+    sensor_output.config_path = path
 
-    return SensorOutput(data["name"], data["actions"], data["out_pins"],
-                        data["table_name"], data["columns"], data["value_shift"], data["target_value"],
-                        data["target_range"], data["good_reading_interval"], data["max_value"], data["min_value"])
+    return sensor_output
 
 
 def create_email_controller(file_name: str):
@@ -114,7 +231,8 @@ def create_email_controller(file_name: str):
     with open(path, 'r') as json_file:
         data = json.load(json_file)
 
-        return EmailController(data["sender_email"], data["sender_password"], data["receiving_emails"])
+        email_controller_class = get_device_type("EmailController")
+        return email_controller_class(data["sender_email"], data["sender_password"], data["receiving_emails"])
 
 
 def create_database_manager(file_name: str):
@@ -126,34 +244,122 @@ def create_database_manager(file_name: str):
     :return: DatabaseManager
     """
 
+    from framework.database.database import path_to_database
+
     path = path_to_managers + file_name
-    with open(path, 'r') as json_file:
-        data = json.load(json_file)
+    device_class = get_device_type("DatabaseManager")
+    data = load_config(path, device_class)
+
+    database_manager = device_class(data["name"], data["actions"],
+                                    data.get("path_to_database", path_to_database), data["tables"],
+                                    data["batch_size"], data["max_lock_seconds"], data["batch_pause"],
+                                    data["incremental_vacuum"], data["vacuum_pages"], data["archive_directory"])
+    database_manager.config_path = path
 
-        return DatabaseManager(data["name"], data["actions"], data["database_name"], data["max_data_age"])
+    return database_manager
 
 def create_weather_manager(file_name: str):
 
     path = path_to_managers + file_name
-    with open(path, 'r') as json_file:
-        data = json.load(json_file)
+    device_class = get_device_type("WeatherManager")
+    data = load_config(path, device_class)
+
+    weather_manager = device_class(data["name"], data["actions"], data["zipcode"], data.get("history_hours", 24))
+    weather_manager.config_path = path
 
-        return WeatherManager(data["name"], data["actions"], data["zipcode"])
+    return weather_manager
 
 def create_fish_feeder(file_name: str):
 
     path = path_to_misc + file_name
-    with open(path, 'r') as json_file:
-        data = json.load(json_file)
+    device_class = get_device_type("FishFeeder")
+    data = load_config(path, device_class)
+
+    fish_feeder = device_class(data["name"], data["actions"], data["out_pins"], data["feeding_time"], data["feeding_amount"])
+    fish_feeder.config_path = path
 
-        return FishFeeder(data["name"], data["actions"], data["out_pins"], data["feeding_time"], data["feeding_amount"])
+    return fish_feeder
 
 
 def create_plant_buddy(file_name: str):
 
+    path = path_to_managers + file_name
+    device_class = get_device_type("PlantBuddy")
+    data = load_config(path, device_class)
+
+    plant_buddy = device_class(data["name"], data["actions"], data["sender_email"], data["sender_password"],
+                               data["receiving_emails"], data["zipcode"], data["phone_num"])
+    plant_buddy.config_path = path
+
+    return plant_buddy
+
+
+def create_config_watcher(file_name: str):
+    """
+    Creates a config watcher used to reload changed json files while the controller is running. This function looks in
+    the resources folder a matching JSON file and creates an object.
+
+    :param file_name: name of the JSON in resources/json_files/managers
+    :return: ConfigWatcher
+    """
+
+    path = path_to_managers + file_name
+    device_class = get_device_type("ConfigWatcher")
+    data = load_config(path, device_class)
+
+    config_watcher = device_class(data["name"], data["actions"], data["output_directories"])
+    config_watcher.config_path = path
+
+    return config_watcher
+
+
+def create_settings_service(file_name: str):
+    """
+    Creates the settings service used to send settings changed in the web app to the objects using them. This function
+    looks in the resources folder a matching JSON file and creates an object.
+
+    :param file_name: name of the JSON in resources/json_files/managers
+    :return: SettingsService
+    """
+
+    path = path_to_managers + file_name
+    device_class = get_device_type("SettingsService")
+    data = load_config(path, device_class)
+
+    settings_service = device_class(data["name"], data["actions"], data["table_name"])
+    settings_service.config_path = path
+
+    return settings_service
+
+
+def create_database_writer(file_name: str) -> "DatabaseWriter":
+    """
+    Creates the writer thread every database write goes through. The thread is not started. This function looks in
+    the resources folder a matching JSON file and creates an object.
+
+    :param file_name: name of the JSON in resources/json_files/managers
+    :return: DatabaseWriter
+    """
+
+    from framework.database.database import path_to_database
+
     path = path_to_managers + file_name
     with open(path, 'r') as json_file:
         data = json.load(json_file)
 
-        return PlantBuddy(data["name"], data["actions"], data["sender_email"], data["sender_password"],
-                          data["receiving_emails"], data["zipcode"], data["phone_num"])
\ No newline at end of file
+    return get_device_type("DatabaseWriter")(data.get("path_to_database", path_to_database), data["max_queue_size"],
+                                             data["batch_size"], data["flush_interval"], data["backpressure"],
+                                             data["max_retries"], data["retry_delay"])
+
+
+# Used by the config watcher to re-create an object from its json file. The key is the type name of the object.
+create_functions = {"ClockOutput": create_clock_output, "TimerOutput": create_timer_output,
+                    "SensorOutput": create_sensor_output, "FishFeeder": create_fish_feeder,
+                    "MultiSensor": create_multi_sensor, "WeatherManager": create_weather_manager,
+                    "DatabaseManager": create_database_manager, "PlantBuddy": create_plant_buddy,
+                    "SettingsService": create_settings_service}
+
+# Used by the config watcher to create an output from a json file added while running. Each of these folders only holds
+# one type of output.
+output_directories = {path_to_clock_outputs: create_clock_output, path_to_timer_outputs: create_timer_output,
+                      path_to_sensor_outputs: create_sensor_output}
@@ -0,0 +1,265 @@
+"""
+Reloads json files while the controller is running. Changed files are found by checking the modified time and size of
+each file, so a check costs one stat() call per file. Only the files that changed are parsed again and the change is
+applied to the live object (see Io.apply_config()) so outputs keep their state and the relays are not touched unless
+the output pins themselves changed.
+"""
+
+import logging as log
+import os
+
+from framework.io.actions import action
+from framework.io.io import Io, IoType
+
+
+class ConfigWatcher(Io):
+
+    def __init__(self, name: str, actions: dict, output_directories: list):
+        """
+        Watches the json files of the running objects and the folders new outputs can be added to.
+
+        :param name: name of the watcher
+        :param actions: the method names and the intervals to execute them ex. {"check_for_changes": 1}
+        :param output_directories: folders to check for new output json files
+        """
+
+        super().__init__(name, IoType.MANGER, actions, [])
+
+        self.output_directories = [os.path.normpath(directory) for directory in output_directories]
+        self.watched = {}
+        self.file_states = {}
+
+        # Files already in the output folders when the watcher is created. The controller decides which of them to
+        # load, so the ones it did not load are never created by the watcher. A file is only added if it appears
+        # after this.
+        self.existing_files = set()
+        for directory in self.output_directories:
+
+            try:
+                file_names = os.listdir(directory)
+
+            except FileNotFoundError:
+                continue
+
+            self.existing_files.update(os.path.join(directory, file_name) for file_name in file_names)
+
+        self.scheduler = None
+        self.settings_service = None
+
+    def set_scheduler(self, scheduler) -> None:
+        """
+        Setter for the scheduler running the objects. Needed to reschedule changed objects and add new ones.
+
+        :param scheduler: Scheduler or AsyncScheduler
+        """
+
+        self.scheduler = scheduler
+
+    def set_settings_service(self, settings_service) -> None:
+        """
+        Setter for the settings service. Objects added while running are subscribed to it.
+
+        :param settings_service: the SettingsService being used
+        """
+
+        self.settings_service = settings_service
+
+    def set_gpio_controller(self, gpio_controller) -> None:
+        """
+        Setter for the gpio controller. Needed to setup the pins of outputs added while running.
+
+        :param gpio_controller: the gpio controller being used
+        """
+
+        self.gpio_controller = gpio_controller
+
+    def watch(self, io) -> None:
+        """
+        Starts watching the json file an object was created from.
+
+        :param io: input, output or manager created by json_loader
+        :return: None
+        """
+
+        if io.config_path is None:
+            raise ValueError(f"'{io.name}' was not created from a json file so it can not be watched")
+
+        path = os.path.normpath(io.config_path)
+        self.watched[path] = io
+        self.file_states[path] = self.get_file_state(path)
+
+    @staticmethod
+    def get_file_state(path: str):
+        """
+        Cheap way to tell if a file changed
+
+        :param path: path to the file
+        :return: (modified time in nanoseconds, size) or None if the file does not exist
+        """
+
+        try:
+            stat = os.stat(path)
+
+        except FileNotFoundError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    @action(interval=1)
+    def check_for_changes(self) -> None:
+        """
+        Checks each watched file and each output folder. Changed files are applied, deleted files remove their object
+        and new files in an output folder create a new output.
+
+        :return: None
+        """
+
+        for path in list(self.watched.keys()):
+
+            file_state = self.get_file_state(path)
+            if file_state == self.file_states[path]:
+                continue
+
+            self.file_states[path] = file_state
+            if file_state is None:
+                self.remove_object(path)
+
+            else:
+                self.reload(path)
+
+        for directory in self.output_directories:
+
+            try:
+                file_names = os.listdir(directory)
+
+            except FileNotFoundError:
+                continue
+
+            # A file that was there at start up counts as new if it is deleted and comes back
+            if len(self.existing_files) > 0:
+                paths = {os.path.join(directory, file_name) for file_name in file_names}
+                self.existing_files = {path for path in self.existing_files
+                                       if os.path.dirname(path) != directory or path in paths}
+
+            for file_name in file_names:
+
+                # Files that failed to load are tried again once they change
+                path = os.path.join(directory, file_name)
+                if file_name.endswith(".json") and path not in self.watched and path not in self.existing_files and \
+                        self.file_states.get(path) != self.get_file_state(path):
+                    self.add_object(path)
+
+    def reload(self, path: str) -> None:
+        """
+        Parses a changed json file and applies it to its object. If the file can not be used the object keeps running
+        with its old settings.
+
+        :param path: path to the changed file
+        :return: None
+        """
+
+        import framework.json_loader as json_loader
+
+        io = self.watched[path]
+        try:
+            data = json_loader.load_config(path, io.__class__)
+
+        except (OSError, ValueError, KeyError) as ex:
+            log.getLogger().critical(f"FAILED to reload '{path}'. '{io.name}' keeps its old settings. {ex}")
+            return
+
+        # New pins need the gpio setup so the output is replaced
+        if data.get("out_pins", []) != io.output_pins:
+
+            log.getLogger().warning(f"Output pins changed in '{path}'. Replacing '{io.name}'.")
+            self.remove_object(path)
+            self.add_object(path, io.__class__)
+            return
+
+        try:
+            rescheduled = io.apply_config(data)
+
+        except (ValueError, KeyError) as ex:
+            log.getLogger().critical(f"FAILED to apply '{path}' to '{io.name}'. {ex}")
+            return
+
+        io.name = data["name"]
+        if rescheduled and self.scheduler is not None:
+            self.scheduler.reschedule(io)
+
+        log.getLogger().warning(f"Reloaded '{path}' for '{io.name}'")
+
+    def add_object(self, path: str, io_class=None) -> None:
+        """
+        Creates an object from a json file. Used for files added to one of the output folders and to replace objects.
+
+        :param path: path to the json file
+        :param io_class: class of the object (found from the folder if None)
+        :return: None
+        """
+
+        import framework.json_loader as json_loader
+
+        directory = os.path.dirname(path)
+        create_function = None
+        for output_directory, function in json_loader.output_directories.items():
+            if os.path.normpath(output_directory) == directory:
+                create_function = function
+
+        if create_function is None and io_class is not None:
+            create_function = json_loader.create_functions.get(io_class.__name__)
+
+        if create_function is None:
+            log.getLogger().critical(f"FAILED to add '{path}'. The type of object is not known.")
+            self.file_states[path] = self.get_file_state(path)
+            return
+
+        try:
+            io = create_function(os.path.basename(path))
+            io.config_path = path
+
+            if self.gpio_controller is not None and io.io_type == IoType.OUTPUT:
+
+                others = [other for other in self.watched.values() if other.io_type == IoType.OUTPUT]
+                self.gpio_controller.validate_pins(others + [io])
+                self.gpio_controller.setup_output_pins([io])
+                self.gpio_controller.toggle_pins(io.output_pins, io.state)
+                io.set_gpio_controller(self.gpio_controller)
+
+        except (OSError, ValueError, KeyError) as ex:
+            log.getLogger().critical(f"FAILED to add '{path}'. {ex}")
+            self.file_states[path] = self.get_file_state(path)
+            return
+
+        io.set_action_executor(self.action_executor)
+        self.watch(io)
+        if self.settings_service is not None:
+            self.settings_service.subscribe(io)
+
+        if self.scheduler is not None:
+            self.scheduler.add(io)
+
+        log.getLogger().warning(f"Added '{io.name}' from '{path}'")
+
+    def remove_object(self, path: str) -> None:
+        """
+        Stops running the object created from a json file and turns its output pins off.
+
+        :param path: path to the json file
+        :return: None
+        """
+
+        io = self.watched.pop(path, None)
+        if io is None:
+            return
+
+        if self.scheduler is not None:
+            self.scheduler.remove(io)
+
+        if self.settings_service is not None:
+            self.settings_service.unsubscribe(io)
+
+        if self.gpio_controller is not None and len(io.output_pins) > 0:
+            self.gpio_controller.toggle_pins(io.output_pins, False)
+
+        log.getLogger().warning(f"Removed '{io.name}' created from '{path}'")
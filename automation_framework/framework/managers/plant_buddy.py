@@ -5,7 +5,8 @@ from email.message import EmailMessage
 
 import framework.managers.email as email
 
-from framework.database.database import select_data, ResultCount, _execute_query, path_to_database
+from framework.database.database import select_data, ResultCount, execute
+from framework.io.actions import action
 from framework.io.io import IoType, Io
 
 
@@ -13,6 +14,8 @@ from framework.io.io import IoType, Io
 
 class PlantBuddy(Io):
 
+    database_settings = {"zipcode": str, "phone_num": str}
+
     def __init__(self, name: str, actions, sender_email, sender_password, receiving_emails, zipcode, phone_num):
 
         super().__init__(name, IoType.OUTPUT, actions, [])
@@ -24,9 +27,10 @@ class PlantBuddy(Io):
         self.phone_num = phone_num
 
         self.zone = "-99a"
-        self.zone = _execute_query(path_to_database, f"SELECT zone FROM zipcode_to_zone WHERE zipcode LIKE '{zipcode}'", ResultCount.ONE)[0]
+        self.zone = execute("SELECT zone FROM zipcode_to_zone WHERE zipcode = ?", (zipcode,), ResultCount.ONE)[0]
 
 
+    @action(interval=86400, blocking=True, timeout=60)
     def check_date(self):
 
         season_starts = {"start_seeds": [32, "last_frost"], "last_frost_warning": [7, "last_frost"],
@@ -43,7 +47,7 @@ class PlantBuddy(Io):
         found_date.strftime("%m-%d-%Y")
         for key in season_starts:
             date_string = select_data("frost_dates", ResultCount.ONE, [season_starts[key][1]],
-                                      where=f"zone LIKE '{self.zone}'")
+                                      where="zone = ?", parameters=(self.zone,))
             found_date = found_date.strptime(date_string[0], "%m-%d-%Y") - timedelta(days=season_starts[key][0])
 
             check_date = datetime.now()
@@ -85,13 +89,17 @@ class PlantBuddy(Io):
         except:
             log.getLogger().critical(f"Failed to send email using")
 
-    def update_from_database(self):
+    def apply_settings(self, settings: dict) -> None:
+        """
+        Applies the zip code and phone number changed in the web app. A new zip code looks up its growing zone.
+
+        :param settings: 'zipcode' and/or 'phone_num'
+        :return: None
+        """
 
-        temp_zipcode = select_data("Settings", ResultCount.ONE, columns=["Value"], where="Setting_name LIKE 'zipcode'")
-        if self.zipcode != temp_zipcode:
-            self.zipcode = temp_zipcode
-            self.zone = _execute_query(path_to_database, f"SELECT zone FROM zipcode_to_zone WHERE zipcode LIKE '{zipcode}'", ResultCount.ONE)[0]
+        if "zipcode" in settings and settings["zipcode"] != self.zipcode:
+            self.zipcode = settings["zipcode"]
+            self.zone = execute("SELECT zone FROM zipcode_to_zone WHERE zipcode = ?", (self.zipcode,), ResultCount.ONE)[0]
 
-        temp_phone_num = select_data("Settings", ResultCount.ONE, columns=["Value"], where="Setting_name LIKE 'phone_num'")
-        if self.phone_num != temp_phone_num:
-            self.phone_num = temp_phone_num
\ No newline at end of file
+        if "phone_num" in settings:
+            self.phone_num = settings["phone_num"]
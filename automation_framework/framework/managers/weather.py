@@ -1,16 +1,38 @@
 import requests
 import logging as log
+import time
 
 import framework.database.database as database
+from framework.database.connection import get_connection_manager
+from framework.io.actions import action
 from framework.io.io import IoType, Io
 
 
 
 
 
+# Columns of the forecast table in the order they are inserted. date_time is the time the forecast is for in seconds
+# since epoch, each time has one row.
+forecast_columns = ["date_time", "temperature", "min_temperature", "max_temperature", "humidity", "weather_label",
+                    "weather_description", "cloudiness_level", "wind_speed"]
+
+
 class WeatherManager(Io):
 
-    def __init__(self, name: str, actions, zipcode):
+    # Zip codes are text so a leading zero is kept
+    database_settings = {"zipcode": str}
+
+    def __init__(self, name: str, actions, zipcode, history_hours: int = 24,
+                 path_to_database: str = database.path_to_database):
+        """
+        Downloads the 5 day forecast from openWeather and keeps it in the database for the web app
+
+        :param name: name of the manager
+        :param actions: the method names and the intervals to execute them ex. {"call_api": 3600}
+        :param zipcode: zip code to get the forecast for
+        :param history_hours: hours to keep forecasts for after the time they were for has passed
+        :param path_to_database: database to store the forecast in
+        """
 
         super().__init__(name, IoType.OUTPUT, actions, [])
 
@@ -20,9 +42,12 @@ class WeatherManager(Io):
         self.zipcode = zipcode
         self.request = f"https://api.openweathermap.org/data/2.5/forecast?zip={self.zipcode},{self.country_code}&units={self.units}&appid={self.api_key}"
         self.table_name = "AC_webapp_weatherdata"
+        self.history_hours = history_hours
+        self.path_to_database = path_to_database
 
         self.init_weather_table()
 
+    @action(interval=3600, blocking=True, timeout=60)
     def call_api(self) -> dict:
         """
         Uses the python requests library to make a API response and returns a dict representing the data as it is stored
@@ -33,21 +58,30 @@ class WeatherManager(Io):
 
         try:
             api_request = requests.get(self.request)
+            self.store_api_response(api_request)
+
+        except Exception as ex:
+
+            ex_string = f"CRITICAL: failed to get response for API request: '{self.request}'\nException: {ex}"
+            print(ex_string)
+            log.getLogger().critical(ex_string)
+
+        return {}
 
-            if api_request.status_code == 200:
+    async def async_call_api(self) -> dict:
+        """
+        Coroutine version of call_api() used by the asyncio runtime. The http request and the database inserts do not
+        block the event loop.
 
-                result = api_request.json()
-                for row in result["list"]:
-                    database.insert_data(self.table_name, {"date_time": row["dt"], "temperature": row["main"]["temp"],
-                                                           "min_temperature": row["main"]["temp_min"], "max_temperature": row["main"]["temp_max"],
-                                                           "humidity": row["main"]["humidity"], "weather_label": row["weather"][0]["main"],
-                                                           "weather_description": row["weather"][0]["description"],
-                                                           "cloudiness_level": row["clouds"]["all"], "wind_speed": row["wind"]["speed"]})
+        :return: dict representing the data stored in as JSON
+        """
 
-            else:
-                warning = "FAILED: API response did not return status code 200"
-                log.getLogger().critical(warning)
-                print(warning)
+        # Only the asyncio runtime calls this so asyncio is not imported by the default runtime
+        from framework.time import async_adapters
+
+        try:
+            api_request = await async_adapters.http_get(self.request)
+            await async_adapters.run_blocking(self.store_api_response, api_request)
 
         except Exception as ex:
 
@@ -57,39 +91,138 @@ class WeatherManager(Io):
 
         return {}
 
-    def store_weather_data(self):
-        """ Retrieves the weather data from the openWeather api then stores the desired information in database"""
+    def store_api_response(self, api_request) -> None:
+        """
+        Stores the forecast from an openWeather api response in the database.
 
+        :param api_request: the response from the api
+        :return: None
+        """
+
+        if api_request.status_code == 200:
+
+            result = api_request.json()
+            rows = [(str(row["dt"]), row["main"]["temp"], row["main"]["temp_min"], row["main"]["temp_max"],
+                     row["main"]["humidity"], row["weather"][0]["main"], row["weather"][0]["description"],
+                     row["clouds"]["all"], row["wind"]["speed"]) for row in result["list"]]
+            self.store_forecast(rows)
 
-        weather_data = self.call_api()["list"]
-        if weather_data == {}:
-            database.clear_data_in_table("weather")
-            for entry in weather_data:
+        else:
+            warning = "FAILED: API response did not return status code 200"
+            log.getLogger().critical(warning)
+            print(warning)
 
-                try:
-                    data = {"date_time": entry["dt_txt"], "temperature": entry["main"]["temp"], "humidity": entry["main"]["humidity"],
-                            "min_temperature": entry["main"]["temp_min"], "max_temperature": entry["main"]["temp_max"],
-                            "weather_label": entry["weather"][0]["main"], "weather_description": entry["weather"][0]["description"],
-                            "cloudiness_level": entry["clouds"]["all"], "wind_speed": entry["wind"]["speed"]}
-                    database.insert_data(self.table_name, data)
+    def store_forecast(self, rows: list, now: float = None) -> int:
+        """
+        Replaces the stored forecast with a new one in one transaction, so the web app never sees half of a forecast.
+        Times already in the table are updated in place, times between the first and last time of the new forecast that
+        it no longer has are deleted and forecasts older than history_hours are purged. The table stays at about one
+        forecast plus the history, so the web app's WeatherData.objects.latest("id") reads a small table.
+
+        :param rows: a tuple of the values in forecast_columns for each time of the forecast
+        :param now: seconds since epoch used to find the old forecasts (default the current time)
+        :return: number of rows in the table after the update
+        """
 
-                except:
+        if not rows:
+            return 0
 
-                    ex_string = "FAILED: could not find or store all weather data from the openWeather API call\n"
-                    print(ex_string)
-                    log.getLogger(ex_string)
+        if now is None:
+            now = time.time()
 
-    def init_weather_table(self) -> None:
-        """ Creates a table in the database to store the weather information """
+        times = [row[0] for row in rows]
+        timestamps = [int(date_time) for date_time in times]
+        oldest_timestamp = int(now - self.history_hours * 3600)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in forecast_columns[1:])
 
-        column_info = {"date_time": "TEXT", "temperature": "REAL", "min_temperature": "REAL", "max_temperature": "REAL",
-                       "humidity": "INTEGER", "weather_label": "TEXT", "weather_description": "TEXT",
-                       "cloudiness_level": "INTEGER", "wind_speed": "REAL"}
-        database.create_table(self.table_name, column_info, True)
+        manager = get_connection_manager(self.path_to_database)
+        with manager.write_lock:
 
-    def update_from_database(self):
+            connection = manager.get_writer()
+            try:
+                connection.execute(f"DELETE FROM {self.table_name} "
+                                   f"WHERE CAST(date_time AS INTEGER) BETWEEN ? AND ? "
+                                   f"AND date_time NOT IN ({', '.join('?' for date_time in times)})",
+                                   (min(timestamps), max(timestamps), *times)).close()
 
-        temp_zipcode = database.select_data("Settings", database.ResultCount.ONE, columns=["Value"], where="Setting_name LIKE 'zipcode'")
-        if self.zipcode != temp_zipcode:
-            self.zipcode = temp_zipcode
+                connection.executemany(f"INSERT INTO {self.table_name} ({', '.join(forecast_columns)}) "
+                                       f"VALUES ({', '.join('?' for column in forecast_columns)}) "
+                                       f"ON CONFLICT (date_time) DO UPDATE SET {updates}", rows).close()
+
+                connection.execute(f"DELETE FROM {self.table_name} WHERE CAST(date_time AS INTEGER) < ?",
+                                   (oldest_timestamp,)).close()
+
+                row_count = connection.execute(f"SELECT count(*) FROM {self.table_name}").fetchone()[0]
+                connection.commit()
+
+            except Exception:
+                connection.rollback()
+                raise
+
+        log.getLogger().debug(f"Stored a forecast of {len(rows)} times, '{self.table_name}' has {row_count} rows")
+
+        return row_count
+
+    def apply_config(self, data: dict) -> bool:
+        """
+        Applies a changed json file.
+
+        :param data: the new contents of the json file
+        :return: if the object needs to be rescheduled
+        """
+
+        rescheduled = super().apply_config(data)
+
+        self.set_zipcode(data["zipcode"])
+        self.history_hours = data.get("history_hours", self.history_hours)
+
+        return rescheduled
+
+    def apply_settings(self, settings: dict) -> None:
+        """
+        Applies the zip code changed in the web app
+
+        :param settings: 'zipcode'
+        :return: None
+        """
+
+        self.set_zipcode(settings["zipcode"])
+
+    def set_zipcode(self, zipcode: str) -> None:
+        """
+        Changes the zip code the forecast is requested for
+
+        :param zipcode: the new zip code
+        :return: None
+        """
+
+        if zipcode != self.zipcode:
+            self.zipcode = zipcode
+            self.request = f"https://api.openweathermap.org/data/2.5/forecast?zip={self.zipcode},{self.country_code}&units={self.units}&appid={self.api_key}"
+
+    def init_weather_table(self) -> None:
+        """
+        Creates a table in the database to store the weather information. Tables filled before each time had one row
+        have their duplicate times removed, keeping the newest forecast, so the unique index on date_time can be made.
+        """
 
+        column_info = {"id": "INTEGER PRIMARY KEY AUTOINCREMENT", "date_time": "TEXT", "temperature": "REAL",
+                       "min_temperature": "REAL", "max_temperature": "REAL", "humidity": "INTEGER",
+                       "weather_label": "TEXT", "weather_description": "TEXT", "cloudiness_level": "INTEGER",
+                       "wind_speed": "REAL"}
+        database.create_table(self.table_name, column_info, True, self.path_to_database)
+
+        manager = get_connection_manager(self.path_to_database)
+        with manager.write_lock:
+
+            connection = manager.get_writer()
+            try:
+                connection.execute(f"DELETE FROM {self.table_name} WHERE rowid NOT IN "
+                                   f"(SELECT max(rowid) FROM {self.table_name} GROUP BY date_time)").close()
+                connection.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {self.table_name}_date_time "
+                                   f"ON {self.table_name} (date_time)").close()
+                connection.commit()
+
+            except Exception:
+                connection.rollback()
+                raise
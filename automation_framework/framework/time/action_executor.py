@@ -0,0 +1,166 @@
+"""
+Runs blocking actions in a bounded thread pool so a hung serial read or smtp login can not stop the timing critical
+outputs. Each action has a timeout. A watchdog thread logs actions that run past their timeout and an action is never
+started again while its last run is still going, the tick is skipped instead. Other actions of the same object still
+run, so one action that hangs can not stop the rest of its object.
+"""
+
+import logging as log
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RunningAction:
+
+    def __init__(self, name: str, future, timeout: float, slot):
+        """
+        Book keeping for an action running in the thread pool.
+
+        :param name: name used in log messages ex. 'aqua-culture-sensor-cluster:get_sensor_values'
+        :param future: future returned by the thread pool
+        :param timeout: number of seconds the action is allowed to run
+        :param slot: dispatch slot of the action
+        """
+
+        self.name = name
+        self.future = future
+        self.start_seconds = time.monotonic()
+        self.timeout = timeout
+        self.overrun = False
+        self.slot = slot
+        self.lateness = slot.timer.lateness
+
+
+class ActionExecutor:
+
+    def __init__(self, max_workers: int = 4, default_timeout: float = 30, watchdog_interval: float = 1):
+        """
+        Thread pool for blocking actions.
+
+        :param max_workers: max number of actions running at the same time
+        :param default_timeout: timeout for actions that do not set one in the json file
+        :param watchdog_interval: how often (in seconds) the watchdog checks for actions that are past their timeout
+        """
+
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="action")
+
+        self.running = {}
+        self.lock = threading.Lock()
+
+        self.skipped_count = 0
+        self.overrun_count = 0
+
+        self.stop_event = threading.Event()
+        self.watchdog_interval = watchdog_interval
+        self.watchdog = threading.Thread(target=self._run_watchdog, name="action-watchdog", daemon=True)
+        self.watchdog.start()
+
+    def submit(self, io, action_name: str, timeout: float = None):
+        """
+        Runs an action of an Io object in the thread pool. If the action is still running from an earlier tick, or every
+        worker is busy, the tick is skipped.
+
+        :param io: the object the action belongs to
+        :param action_name: name of the action
+        :param timeout: number of seconds the action is allowed to run (default_timeout if None)
+        :return: the future for the action or None if the tick was skipped
+        """
+
+        key = (id(io), action_name)
+        name = f"{io.name}:{action_name}"
+
+        with self.lock:
+
+            running_action = self.running.get(key)
+            if running_action is not None:
+
+                self.skipped_count += 1
+                state = "overran its timeout" if running_action.overrun else "is still running"
+                log.getLogger().warning(f"SKIPPED '{name}' because the last run {state}")
+                return None
+
+            if len(self.running) >= self.max_workers:
+
+                self.skipped_count += 1
+                log.getLogger().warning(f"SKIPPED '{name}' because all {self.max_workers} workers are busy")
+                return None
+
+            if timeout is None:
+                timeout = self.default_timeout
+
+            slot = io.action_table[action_name]
+            future = self.pool.submit(slot.method)
+            self.running[key] = RunningAction(name, future, timeout, slot)
+
+        future.add_done_callback(lambda done_future: self._finished(key, done_future))
+
+        return future
+
+    def _finished(self, key: tuple, future) -> None:
+        """
+        Called by the thread pool when an action is done.
+
+        :param key: key of the action in self.running
+        :param future: the future of the finished action
+        :return: None
+        """
+
+        with self.lock:
+            running_action = self.running.pop(key, None)
+
+        if running_action is None:
+            return
+
+        running_action.slot.stats.record(time.monotonic() - running_action.start_seconds, running_action.lateness)
+
+        exception = future.exception()
+        if exception is not None:
+            log.getLogger().critical(f"FAILED action '{running_action.name}' raised: {exception}")
+
+        if running_action.overrun:
+            log.getLogger().warning(f"Action '{running_action.name}' finished after "
+                                    f"{time.monotonic() - running_action.start_seconds:.1f} seconds")
+
+    def check_overruns(self) -> list:
+        """
+        Finds actions that have been running for longer than their timeout. Each one is logged once. A thread can not be
+        killed so the action keeps its slot and future ticks are skipped until it returns.
+
+        :return: names of the actions that overran since the last check
+        """
+
+        now = time.monotonic()
+        overruns = []
+        with self.lock:
+
+            for running_action in self.running.values():
+
+                if not running_action.overrun and now - running_action.start_seconds > running_action.timeout:
+                    running_action.overrun = True
+                    overruns.append(running_action.name)
+
+            self.overrun_count += len(overruns)
+
+        for name in overruns:
+            log.getLogger().critical(f"WATCHDOG action '{name}' has run past its timeout. Skipping it until it returns.")
+
+        return overruns
+
+    def _run_watchdog(self) -> None:
+
+        while not self.stop_event.wait(self.watchdog_interval):
+            self.check_overruns()
+
+    def shutdown(self, wait: bool = False) -> None:
+        """
+        Stops the watchdog and the thread pool.
+
+        :param wait: wait for running actions to return
+        :return: None
+        """
+
+        self.stop_event.set()
+        self.pool.shutdown(wait=wait)
@@ -0,0 +1,39 @@
+"""
+Non-blocking adapters for the blocking io used by the framework. Each adapter runs the blocking call in the event loop's
+thread pool so the loop (and the outputs toggling gpio pins) keeps running while the call waits on the network.
+
+Serial reads and database writes do not need an adapter. The multi-sensor reads its port on its own thread and every
+write goes through the database writer thread. Emails are sent by alarm_check, which is run in the thread pool as a
+blocking action.
+"""
+
+import asyncio
+import functools
+
+
+async def run_blocking(function, *args, **kwargs):
+    """
+    Runs a blocking function in the default thread pool of the running event loop.
+
+    :param function: function to call
+    :param args: positional arguments for the function
+    :param kwargs: keyword arguments for the function
+    :return: whatever the function returns
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+
+async def http_get(url: str, timeout: float = 30):
+    """
+    Non-blocking version of requests.get()
+
+    :param url: url to send the get request to
+    :param timeout: max number of seconds to wait on the server
+    :return: requests.Response
+    """
+
+    import requests
+
+    return await run_blocking(requests.get, url, timeout=timeout)
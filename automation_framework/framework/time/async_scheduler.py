@@ -0,0 +1,161 @@
+"""
+asyncio version of the scheduler. Each (Io object, action) pair gets its own task that sleeps until its timer is due.
+Actions can be coroutines (see Io.get_async_action()) and actions marked as blocking in the json file are run in a
+thread pool, so one slow network call can never delay the gpio toggles of other outputs.
+"""
+
+import asyncio
+import logging as log
+import time
+
+from framework.time.async_adapters import run_blocking
+
+
+class AsyncScheduler:
+
+    def __init__(self, io_objects: list = None):
+        """
+        Async scheduler for inputs, outputs and managers.
+
+        :param io_objects: inputs, outputs and managers to schedule
+        """
+
+        self.io_objects = []
+        self.tasks = {}
+
+        # Actions belonging to the same object are never run at the same time. Objects such as MultiSensor share state
+        # (the serial connection) between their actions.
+        self.locks = {}
+        self.stop_event = None
+
+        if io_objects is not None:
+            self.io_objects.extend(io_objects)
+
+    def add(self, io) -> None:
+        """
+        Adds the actions of an Io object. If the scheduler is already running the tasks are started right away.
+
+        :param io: the input, output or manager to schedule
+        :return: None
+        """
+
+        if io not in self.io_objects:
+            self.io_objects.append(io)
+
+        try:
+            asyncio.get_running_loop()
+
+        except RuntimeError:
+            # The tasks are created when run() is called
+            return
+
+        self._start_tasks(io)
+
+    def remove(self, io) -> None:
+        """
+        Cancels the tasks of an Io object.
+
+        :param io: the input, output or manager to stop scheduling
+        :return: None
+        """
+
+        if io in self.io_objects:
+            self.io_objects.remove(io)
+
+        for task in self.tasks.pop(io, []):
+            task.cancel()
+
+    def reschedule(self, io) -> None:
+        """
+        Restarts the tasks of an Io object so a changed interval takes effect right away.
+
+        :param io: the input, output or manager that changed
+        :return: None
+        """
+
+        self.remove(io)
+        self.add(io)
+
+    def _start_tasks(self, io) -> None:
+
+        self.locks.setdefault(io, asyncio.Lock())
+        self.tasks[io] = [asyncio.create_task(self._run_action(io, slot), name=f"{io.name}:{slot.name}")
+                          for slot in io.action_slots]
+
+    async def _run_action(self, io, slot) -> None:
+        """
+        Loop for one action. Sleeps until the timer is due then runs the action.
+
+        :param io: object the action belongs to
+        :param slot: dispatch slot of the action
+        :return: None
+        """
+
+        timer = slot.timer
+        coroutine_action = io.get_async_action(slot.name)
+
+        while True:
+
+            await asyncio.sleep(timer.time_until_due())
+            if not timer.check_time():
+                continue
+
+            async with self.locks[io]:
+
+                start_seconds = time.perf_counter()
+                try:
+
+                    if coroutine_action is not None:
+                        await coroutine_action()
+
+                    elif slot.blocking and io.action_executor is not None:
+
+                        # The executor makes sure the action never runs twice at the same time so the lock can be
+                        # released once the timeout is reached even if the thread is still going
+                        future = io.action_executor.submit(io, slot.name, slot.timeout)
+                        if future is not None:
+                            timeout = slot.timeout or io.action_executor.default_timeout
+                            await asyncio.wait({asyncio.wrap_future(future)}, timeout=timeout)
+
+                    elif slot.blocking:
+                        await run_blocking(slot.method)
+
+                    else:
+                        slot.method()
+
+                except asyncio.CancelledError:
+                    raise
+
+                except Exception as ex:
+                    log.getLogger().critical(f"FAILED action '{slot.name}' of '{io.name}' raised: {ex}")
+
+                # Actions sent to the action executor are recorded by the executor when they finish
+                if not (slot.blocking and io.action_executor is not None):
+                    slot.stats.record(time.perf_counter() - start_seconds, timer.lateness)
+
+    async def run(self) -> None:
+        """
+        Starts a task for each action then waits until stop() is called.
+
+        :return: None
+        """
+
+        log.getLogger().debug("STARTING run 'AsyncScheduler'")
+
+        self.stop_event = asyncio.Event()
+        for io in self.io_objects:
+            self._start_tasks(io)
+
+        await self.stop_event.wait()
+
+        for io in list(self.tasks.keys()):
+            for task in self.tasks.pop(io):
+                task.cancel()
+
+        log.getLogger().debug("DONE run 'AsyncScheduler'")
+
+    def stop(self) -> None:
+        """ Cancels all of the running actions and lets run() return """
+
+        if self.stop_event is not None:
+            self.stop_event.set()
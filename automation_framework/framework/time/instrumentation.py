@@ -0,0 +1,157 @@
+"""
+Per action instrumentation for the dispatch path. Each action gets an ActionStats object when its dispatch slot is
+built. Every call records how long the action took and how late it ran compared to its interval. Everything is kept in
+fixed size structures (counters and histograms with fixed buckets) so recording never allocates and memory does not grow
+the longer the controller runs. A snapshot is dumped to a json file when the controller gets SIGUSR1. Objects with state
+worth checking on a running controller (ex. the health of a sensor connection) can add it to the snapshot with
+register_health().
+"""
+
+import json
+import logging as log
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bound (in seconds) of each histogram bucket. The last bucket holds everything larger.
+bucket_bounds = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+
+class ActionStats:
+
+    __slots__ = ("name", "count", "total_seconds", "max_seconds", "histogram",
+                 "total_lateness", "max_lateness", "lateness_histogram")
+
+    def __init__(self, name: str):
+        """
+        Counters for one action
+
+        :param name: name of the action ex. 'water_pump:find_state'
+        """
+
+        self.name = name
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = [0] * (len(bucket_bounds) + 1)
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+        self.lateness_histogram = [0] * (len(bucket_bounds) + 1)
+
+    def record(self, seconds: float, lateness: float) -> None:
+        """
+        Records one call of the action
+
+        :param seconds: how long the action took to run
+        :param lateness: how many seconds after its deadline the action ran
+        :return: None
+        """
+
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        self.histogram[bisect_left(bucket_bounds, seconds)] += 1
+
+        self.total_lateness += lateness
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        self.lateness_histogram[bisect_left(bucket_bounds, lateness)] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Copies the counters into a dictionary
+
+        :return: the counters for the action
+        """
+
+        count = self.count if self.count > 0 else 1
+        return {"name": self.name, "count": self.count,
+                "mean_seconds": self.total_seconds / count, "max_seconds": self.max_seconds,
+                "histogram": list(self.histogram),
+                "mean_lateness": self.total_lateness / count, "max_lateness": self.max_lateness,
+                "lateness_histogram": list(self.lateness_histogram)}
+
+
+class Instrumentation:
+
+    def __init__(self):
+        """ Holds the stats of every action """
+
+        self.stats = {}
+        self.lock = threading.Lock()
+
+        # Name/function returning a dictionary of health metrics
+        self.health_sources = {}
+
+    def register(self, name: str) -> ActionStats:
+        """
+        Gets the stats for an action, creating them the first time.
+
+        :param name: name of the action ex. 'water_pump:find_state'
+        :return: ActionStats
+        """
+
+        with self.lock:
+
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = ActionStats(name)
+                self.stats[name] = stats
+
+        return stats
+
+    def register_health(self, name: str, get_metrics) -> None:
+        """
+        Adds the metrics of an object to every json dump
+
+        :param name: name of the metrics ex. 'aqua-culture-sensor-cluster:connection'
+        :param get_metrics: function that returns a dictionary that can be written as json
+        :return: None
+        """
+
+        with self.lock:
+            self.health_sources[name] = get_metrics
+
+    def get_health(self) -> dict:
+        """
+        Gets the metrics of every registered object
+
+        :return: name/metrics
+        """
+
+        with self.lock:
+            health_sources = list(self.health_sources.items())
+
+        return {name: get_metrics() for name, get_metrics in health_sources}
+
+    def snapshot(self) -> list:
+        """
+        Copies the counters of every action
+
+        :return: list of dictionaries, one for each action
+        """
+
+        with self.lock:
+            stats = list(self.stats.values())
+
+        return [action_stats.snapshot() for action_stats in stats]
+
+    def dump_json(self, path: str) -> None:
+        """
+        Writes a snapshot to a json file
+
+        :param path: file to write
+        :return: None
+        """
+
+        data = {"time": time.time(), "bucket_bounds": bucket_bounds, "actions": self.snapshot(),
+                "health": self.get_health()}
+        with open(path, 'w') as json_file:
+            json.dump(data, json_file, indent=2)
+
+        log.getLogger().warning(f"Action stats written to '{path}'")
+
+
+# One instance shared by every object so a single snapshot covers the whole controller
+instrumentation = Instrumentation()
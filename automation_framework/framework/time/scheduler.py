@@ -0,0 +1,133 @@
+"""
+Deadline driven replacement for the busy loop in framework_controller. Instead of asking every timer if it has gone off
+as fast as the cpu allows, the scheduler keeps a priority queue of when each (Io object, action) pair is next due. The
+controller sleeps until the earliest deadline and then only dispatches the actions that are actually due.
+"""
+
+import heapq
+import itertools
+import logging as log
+import threading
+import time
+
+
+class Scheduler:
+
+    def __init__(self, io_objects: list = None):
+        """
+        Builds a priority queue from the dispatch table of each Io object. Each entry in the queue is
+        [deadline, sequence, io object, action slot]. The sequence number keeps the order of actions with the same
+        deadline the same as the order they were added (the order in the json files).
+
+        :param io_objects: inputs, outputs and managers to schedule
+        """
+
+        self.queue = []
+        self.sequence = itertools.count()
+        self.removed_io = None
+        self.stop_event = threading.Event()
+
+        if io_objects is not None:
+            for io in io_objects:
+                self.add(io)
+
+    def add(self, io) -> None:
+        """
+        Adds each of the actions belonging to the Io object to the queue. The first deadline is found from the timer
+        linked to the action so the behaviour matches calling check_time() in a loop.
+
+        :param io: the input, output or manager to schedule
+        :return: None
+        """
+
+        now = time.monotonic()
+        for slot in io.action_slots:
+            deadline = now + slot.timer.time_until_due()
+            heapq.heappush(self.queue, [deadline, next(self.sequence), io, slot])
+
+        log.getLogger().debug(f"Scheduled {list(io.actions.keys())} for '{io.name}'")
+
+    def remove(self, io) -> None:
+        """
+        Removes all of the actions belonging to the Io object from the queue.
+
+        :param io: the input, output or manager to stop scheduling
+        :return: None
+        """
+
+        # The queue is changed in place because this can be called by an action while run_pending() is using it. The
+        # entry being run is not in the queue at that point so run_pending() checks removed_io before putting it back.
+        self.queue[:] = [entry for entry in self.queue if entry[2] is not io]
+        heapq.heapify(self.queue)
+        self.removed_io = io
+
+    def reschedule(self, io) -> None:
+        """
+        Re-computes the deadlines for an Io object. Use this after changing the interval of one of its timers so the
+        change takes effect right away instead of after the old deadline.
+
+        :param io: the input, output or manager that changed
+        :return: None
+        """
+
+        self.remove(io)
+        self.add(io)
+
+    def run_pending(self) -> float:
+        """
+        Dispatches every action with a deadline that has passed then puts it back in the queue with its next deadline.
+
+        :return: number of seconds until the next deadline
+        """
+
+        queue = self.queue
+        while queue:
+
+            entry = queue[0]
+            now = time.monotonic()
+            if entry[0] > now:
+                return entry[0] - now
+
+            heapq.heappop(queue)
+            io = entry[2]
+            slot = entry[3]
+            timer = slot.timer
+
+            # The timer still decides if the action is due. This keeps the same behaviour as the old loop and picks up
+            # changes objects make to their own timers (ex. MultiSensor changing the serial check interval).
+            self.removed_io = None
+            if timer.check_time():
+                io.dispatch(slot)
+
+            # The action may have removed or rescheduled its own object (ex. the config watcher)
+            if self.removed_io is io:
+                continue
+
+            entry[0] = time.monotonic() + timer.time_until_due()
+            entry[1] = next(self.sequence)
+            heapq.heappush(queue, entry)
+
+        return None
+
+    def run(self) -> None:
+        """
+        Main loop. Sleeps until the earliest deadline, runs what is due then repeats until stop() is called.
+
+        :return: None
+        """
+
+        log.getLogger().debug("STARTING run 'Scheduler'")
+
+        while not self.stop_event.is_set():
+
+            delay = self.run_pending()
+
+            # Sleep until the next deadline. If nothing is scheduled wait until the scheduler is stopped.
+            self.stop_event.wait(delay)
+
+        log.getLogger().debug("DONE run 'Scheduler'")
+
+    def stop(self) -> None:
+        """ Stops the main loop after the current action finishes """
+
+        self.stop_event.set()
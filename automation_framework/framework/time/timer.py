@@ -5,18 +5,81 @@ intervals for different outputs. Each input and output group gets a timer. In mo
 the interval of the sensor should match the output but it does not have to.
 """
 
+import logging as log
 import time
+from enum import Enum
+
+
+class MissedTickPolicy(Enum):
+
+    # Fire once for every missed tick, one per check, until the timer is back on schedule
+    CATCH_UP = "catch_up"
+    # Fire once and drop the missed ticks
+    SKIP = "skip"
+    # Fire once and record how many ticks the call stands for in Timer.ticks
+    COALESCE = "coalesce"
 
 
 class Timer:
 
-    def __init__(self, name: str, interval: int):
+    def __init__(self, name: str, interval: int, fixed_rate: bool = False,
+                 missed_tick_policy: MissedTickPolicy = MissedTickPolicy.COALESCE):
+        """
+        Timer used to find when an action should run.
+
+        The default timer is based on the wall clock and restarts from the time it was last checked, so every late check
+        pushes the schedule back. A fixed rate timer is based on the monotonic clock and keeps its deadlines on a fixed
+        grid (start, start + interval, start + 2 * interval...). Late checks do not move the grid and changes to the
+        wall clock (ex. NTP syncing after boot) have no effect.
+
+        :param name: name of the timer
+        :param interval: number of seconds between each time the timer goes off
+        :param fixed_rate: use monotonic fixed rate deadlines instead of the wall clock
+        :param missed_tick_policy: what a fixed rate timer does when more than one interval has passed since the last
+            deadline
+        """
 
         self.interval = interval
         self.name = name
         self.previous_seconds = 0
         self.current_seconds = 0
 
+        self.fixed_rate = fixed_rate
+        self.missed_tick_policy = missed_tick_policy
+        self.deadline = None
+
+        # Number of intervals the last time the timer went off stands for. This is only more than 1 for a fixed rate
+        # timer using MissedTickPolicy.COALESCE.
+        self.ticks = 1
+        self.missed_ticks = 0
+
+        # How late (in seconds) the timer went off compared to when it was due
+        self.lateness = 0.0
+        self.max_lateness = 0.0
+        self.jitter = 0.0
+
+    @classmethod
+    def from_config(cls, name: str, config):
+        """
+        Creates a timer from the value of an action in the json 'actions' field. The value can be the interval or a
+        dictionary. A dictionary only makes a fixed rate timer when it has a 'missed_ticks' key or "fixed_rate": true,
+        other keys (ex. 'blocking') keep the default timer.
+
+        ex. {"find_state": 2} or {"find_state": {"interval": 2, "missed_ticks": "coalesce"}}
+
+        :param name: name of the timer
+        :param config: the interval or a dict with an 'interval' key and optional 'missed_ticks' and 'fixed_rate' keys
+        :return: Timer
+        """
+
+        if isinstance(config, dict):
+
+            fixed_rate = config.get("fixed_rate", "missed_ticks" in config)
+            policy = MissedTickPolicy(config.get("missed_ticks", MissedTickPolicy.COALESCE.value))
+            return cls(name, config["interval"], fixed_rate=fixed_rate, missed_tick_policy=policy)
+
+        return cls(name, config)
+
     def check_time(self) -> bool:
         """
         Simulates a timer using the current time from epoch and the previous time from epoch when this timer last went
@@ -25,6 +88,9 @@ class Timer:
         :return: if the output should check its state
         """
 
+        if self.fixed_rate:
+            return self._check_fixed_rate()
+
         # Set the current time
         self.current_seconds = time.time()
 
@@ -36,6 +102,9 @@ class Timer:
         # then the interval then you know it has been at least as many seconds as the interval
         if self.current_seconds - self.previous_seconds > self.interval:
 
+            if self.previous_seconds > 0:
+                self._record_lateness(self.current_seconds - self.previous_seconds - self.interval)
+
             # Now that the interval has been reached set the previous time from epoch to the current time. This is the
             # same as resetting the timer
             self.previous_seconds = self.current_seconds
@@ -43,3 +112,97 @@ class Timer:
 
         else:
             return False
+
+    def _check_fixed_rate(self) -> bool:
+        """
+        Fixed rate version of check_time(). The first check always goes off and sets the start of the grid.
+
+        :return: if the output should check its state
+        """
+
+        now = time.monotonic()
+        self.current_seconds = now
+
+        if self.deadline is None:
+            self.deadline = now + self.interval
+            self.ticks = 1
+            return True
+
+        if now < self.deadline:
+            return False
+
+        lateness = now - self.deadline
+        self._record_lateness(lateness)
+
+        # Intervals that passed after the one that is due now
+        self.missed_ticks = int(lateness // self.interval) if self.interval > 0 else 0
+
+        if self.missed_tick_policy == MissedTickPolicy.CATCH_UP:
+
+            # Only move forward one interval. The next check will go off right away until the timer is caught up.
+            self.deadline += self.interval
+            self.ticks = 1
+
+        else:
+
+            # Jump to the next deadline on the grid that is still in the future
+            self.deadline += (self.missed_ticks + 1) * self.interval
+
+            if self.missed_tick_policy == MissedTickPolicy.COALESCE:
+                self.ticks = self.missed_ticks + 1
+
+            else:
+                self.ticks = 1
+
+        if self.missed_ticks > 0:
+            log.getLogger().warning(f"Timer '{self.name}' went off {lateness:.3f} seconds late and missed "
+                                    f"{self.missed_ticks} tick(s). Policy: {self.missed_tick_policy.value}")
+
+        return True
+
+    def _record_lateness(self, lateness: float) -> None:
+        """
+        Keeps track of how late the timer went off. Jitter is a smoothed average of the change in lateness between
+        each time the timer goes off (the same estimate used by RTP).
+
+        :param lateness: number of seconds past the deadline
+        :return: None
+        """
+
+        self.jitter += (abs(lateness - self.lateness) - self.jitter) / 16
+        self.lateness = lateness
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+
+    def time_until_due(self) -> float:
+        """
+        Number of seconds until check_time() will return True. Used by the scheduler to sleep until the timer goes off
+        instead of checking it in a loop.
+
+        :return: seconds until the timer goes off (0 if it is already due)
+        """
+
+        if self.fixed_rate:
+
+            if self.deadline is None:
+                return 0
+
+            remaining = self.deadline - time.monotonic()
+
+        else:
+            remaining = self.previous_seconds + self.interval - time.time()
+
+        if remaining < 0:
+            remaining = 0
+
+        return remaining
+
+    def get_stats(self) -> dict:
+        """
+        Getter for the lateness of the timer
+
+        :return: last lateness, max lateness and jitter in seconds
+        """
+
+        return {"name": self.name, "interval": self.interval, "lateness": self.lateness,
+                "max_lateness": self.max_lateness, "jitter": self.jitter, "missed_ticks": self.missed_ticks}
@@ -8,11 +8,17 @@ Gives something each of the classes to hook onto
     system from trying. Some are dependent.
 """
 from datetime import datetime
+import argparse
 import logging as log
+import signal
+import sys
 
 import framework.json_loader as json
 from framework.io.gpio import GPIOController
 from framework.io.io import IoType
+from framework.time.action_executor import ActionExecutor
+from framework.time.instrumentation import instrumentation
+from framework.time.scheduler import Scheduler
 
 
 def set_gpio_controller(outputs, gpio_controller: GPIOController) -> None:
@@ -30,7 +36,53 @@ def set_gpio_controller(outputs, gpio_controller: GPIOController) -> None:
             output.set_gpio_controller(gpio_controller)
 
 
-def main():
+def set_action_executor(outputs, action_executor: ActionExecutor) -> None:
+    """
+    Setter method to link the action executor to each input, output and manager. Actions marked as blocking in the json
+    files are run by the executor.
+    :param outputs: inputs, outputs and managers
+    :param action_executor: the executor being used
+    """
+
+    for output in outputs:
+
+        output.set_action_executor(action_executor)
+
+
+def dump_action_stats(signal_number=None, frame=None) -> None:
+    """
+    Writes the call count, run time and lateness of every action and the health of the sensor connections to a json
+    file in the logs folder. This is linked to SIGUSR1 so the stats of a running controller can be dumped with
+    'kill -USR1 <pid>'.
+    """
+
+    now = datetime.now()
+    instrumentation.dump_json(f"logs/action_stats_{now.strftime('%m_%d_%Y__%H_%M_%S')}.json")
+
+
+def set_reading_source(outputs, reading_source) -> None:
+    """
+    Setter method to make sensor outputs read the latest sensor values from shared memory instead of the database.
+    :param outputs: outputs that may use sensor readings
+    :param reading_source: the SharedReadings of the ingest process
+    """
+
+    for output in outputs:
+
+        if hasattr(output, "set_reading_source"):
+
+            output.set_reading_source(reading_source)
+
+
+def main(runtime: str = "scheduler", ingest_process: bool = False, ingest_engine: bool = False):
+    """
+    Creates the inputs, outputs and managers then runs them until the program is stopped.
+
+    :param runtime: 'scheduler' runs every action on one thread. 'asyncio' runs each action in its own task and runs
+        blocking actions in a thread pool so slow io can not delay the outputs.
+    :param ingest_process: run the multi-sensor (serial reads and database writes) in a separate process
+    :param ingest_engine: read every sensor board in ingest_engine.json on one thread instead of the one multi-sensor
+    """
 
     # Create log
     now = datetime.now()
@@ -42,12 +94,38 @@ def main():
     logger = log.getLogger()
     logger.setLevel(log.WARNING)
 
+    signal.signal(signal.SIGUSR1, dump_action_stats)
+
+    # Stopping the service sends SIGTERM. Exiting through SystemExit runs the clean up at the end of main().
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: sys.exit(0))
+
+    # Forked before the writer thread starts and before any database connection is opened, so the worker does not
+    # inherit a lock held by another thread or a writer thread that does not exist in it
+    sensor_ingest = None
+    if ingest_process:
+        sensor_ingest = json.create_ingest_process("multi_sensor.json")
+        sensor_ingest.start()
+
+    # Every database write goes through one thread that commits them in groups
+    database_writer = json.create_database_writer("database_writer.json")
+    database_writer.start()
+
+    database_manager = json.create_database_manager("database_manager.json")
+
     # Create the gpio controller
     gpio_controller = GPIOController()
     log.getLogger().debug("GPIO controller created")
 
     # Initialize outputs
-    multi_sensor = json.create_multi_sensor("multi_sensor.json")
+    multi_sensor = None
+    sensor_engine = None
+    if ingest_engine:
+        sensor_engine = json.create_ingest_engine("ingest_engine.json")
+        sensor_engine.start()
+
+    elif not ingest_process:
+        multi_sensor = json.create_multi_sensor("multi_sensor.json")
+
     water_pump = json.create_timer_output("water_pump.json")
     fish_feeder = json.create_fish_feeder("fish_feeder.json")
 
@@ -63,19 +141,87 @@ def main():
     gpio_controller.init_gpio(outputs)
     set_gpio_controller(outputs, gpio_controller)
 
-    outputs.append(multi_sensor)
+    if ingest_process:
+        set_reading_source(outputs, sensor_ingest.shared_readings)
+
+    elif ingest_engine:
+        outputs.append(sensor_engine)
+
+    else:
+        outputs.append(multi_sensor)
+
     outputs.append(weather_manager)
+    outputs.append(database_manager)
     #outputs.append(plant_buddy)
 
-    while True:
+    # Settings changed in the web app are read with one query and only sent to the objects that use them
+    settings_service = json.create_settings_service("settings.json")
+    for output in outputs:
+        settings_service.subscribe(output)
+
+    outputs.append(settings_service)
+
+    # Reload changed json files without restarting
+    config_watcher = json.create_config_watcher("config_watcher.json")
+    config_watcher.set_gpio_controller(gpio_controller)
+    config_watcher.set_settings_service(settings_service)
+    for output in outputs:
+        config_watcher.watch(output)
+
+    outputs.append(config_watcher)
 
-        # Go through each of the outputs
-        for output in outputs:
+    # Restarts the worker if it dies. Added after the watcher because it is configured by the multi-sensor json file.
+    if ingest_process:
+        outputs.append(sensor_ingest)
 
-            # Check if enough time has passed since the action was last preformed
-            timer_results = output.check_time()
-            output.perform_actions(timer_results)
+    # Blocking actions (serial reads, api calls, emails) run in a thread pool with a timeout
+    action_executor = ActionExecutor()
+    set_action_executor(outputs, action_executor)
+
+    try:
+        if runtime == "asyncio":
+
+            # Only loaded when used. asyncio is one of the slower modules to import on a Pi.
+            import asyncio
+            from framework.time.async_scheduler import AsyncScheduler
+
+            scheduler = AsyncScheduler(outputs)
+            config_watcher.set_scheduler(scheduler)
+            asyncio.run(scheduler.run())
+
+        else:
+
+            # Sleep until the next action is due instead of checking every timer as fast as possible
+            scheduler = Scheduler(outputs)
+            config_watcher.set_scheduler(scheduler)
+            scheduler.run()
+
+    finally:
+
+        # Stops the worker and removes its shared memory segment so the next start can create it again
+        if sensor_ingest is not None:
+            sensor_ingest.stop()
+
+        if sensor_engine is not None:
+            sensor_engine.stop()
+
+        # Stops the serial reader thread and the rfcomm process
+        if multi_sensor is not None:
+            multi_sensor.close_serial_connection()
+
+        # Write the readings still in the queue before exiting
+        database_writer.stop()
 
 
 if __name__ == "__main__":
-    main()
+
+    parser = argparse.ArgumentParser(description="Runs the automation framework")
+    parser.add_argument("--runtime", choices=["scheduler", "asyncio"], default="scheduler",
+                        help="how actions are run (default: scheduler)")
+    parser.add_argument("--ingest-process", action="store_true",
+                        help="run the multi-sensor in its own process and share readings through shared memory")
+    parser.add_argument("--ingest-engine", action="store_true",
+                        help="read every sensor board in ingest_engine.json on one thread")
+    arguments = parser.parse_args()
+
+    main(arguments.runtime, arguments.ingest_process, arguments.ingest_engine)
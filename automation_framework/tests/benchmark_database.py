@@ -0,0 +1,75 @@
+"""
+Compares statements per second of opening a connection for each statement (how framework.database worked before the
+connection manager) against the long lived connections of framework.database.connection. Run it on the Pi, on the same
+storage as the real database, from the automation_framework folder:
+
+    python3 -m tests.benchmark_database
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from framework.database.connection import ConnectionManager
+
+create_query = "CREATE TABLE IF NOT EXISTS sensors (date_time TEXT, water_temp REAL, tds REAL, water_pH REAL)"
+insert_query = "INSERT INTO sensors (date_time, water_temp, tds, water_pH) VALUES ('10/18/2026 12:00:00', 70.1, 450, 6.8)"
+select_query = "SELECT date_time, water_temp FROM sensors ORDER BY date_time DESC LIMIT 1"
+
+
+def connect_each_time(path_to_database: str, query: str) -> None:
+
+    # Same steps as the old _execute_query()
+    connection = sqlite3.connect(path_to_database)
+    cursor = connection.cursor()
+    cursor.execute(query)
+    cursor.fetchall()
+    connection.commit()
+    cursor.close()
+    connection.close()
+
+
+def measure(function, count: int) -> float:
+    """
+    Calls a function a number of times
+
+    :param function: function with no arguments
+    :param count: number of calls
+    :return: calls per second
+    """
+
+    start_seconds = time.perf_counter()
+    for call in range(count):
+        function()
+
+    return count / (time.perf_counter() - start_seconds)
+
+
+def main(count: int = 2000) -> None:
+
+    directory = tempfile.mkdtemp(dir=os.environ.get("BENCHMARK_DIRECTORY"))
+    old_path = os.path.join(directory, "connect_each_time.db")
+    new_path = os.path.join(directory, "connection_manager.db")
+
+    connect_each_time(old_path, create_query)
+    manager = ConnectionManager(new_path)
+    manager.execute(create_query)
+
+    results = {"insert": (measure(lambda: connect_each_time(old_path, insert_query), count),
+                          measure(lambda: manager.execute(insert_query), count)),
+               "select": (measure(lambda: connect_each_time(old_path, select_query), count),
+                          measure(lambda: manager.execute(select_query, fetch="ALL"), count))}
+
+    manager.close()
+
+    print(f"{count} statements each, database in '{directory}'")
+    print(f"{'':<8}{'connect each time':>20}{'connection manager':>20}")
+    for name, (old_rate, new_rate) in results.items():
+        print(f"{name:<8}{old_rate:>16.0f} /s {new_rate:>16.0f} /s   {new_rate / old_rate:.1f}x")
+
+
+if __name__ == "__main__":
+
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,168 @@
+"""
+Compares lines parsed per second of the old validate_sensor_data, which checked the edit distance of every label against
+every column, against the precomputed index of framework.io.input.sensors.label_matcher. Run it from the
+automation_framework folder:
+
+    python3 -m tests.benchmark_label_matcher [number of columns]
+
+No serial logs of the board are kept, so the lines are made from the format the sketch prints
+('TDS: 310.52 Ph: 7.04 Water Temp: 70.81 Air Temp: 68.00 Humidity: 45.20') and mangled the way a noisy bluetooth link
+does: letters dropped, changed or repeated, lines cut off and garbage at the start. The random seed is fixed so every run
+uses the same lines.
+"""
+
+import random
+import sys
+import time
+
+from framework.io.input.sensors.label_matcher import LabelMatcher
+
+column_info = {"id": "PRIMARY KEY", "date_time": "TEXT", "water_pH": "REAL", "tds": "REAL", "water_temp": "REAL",
+               "air_temp": "REAL", "humidity": "REAL"}
+aliases = {"Ph": "water_pH"}
+sketch_labels = ["TDS", "Ph", "Water Temp", "Air Temp", "Humidity"]
+
+
+def mangle(text: str, rng: random.Random) -> str:
+    """ Drops, changes or repeats one letter """
+
+    index = rng.randrange(len(text))
+    edit = rng.choice(("drop", "change", "repeat"))
+    if edit == "drop":
+        return text[:index] + text[index + 1:]
+
+    if edit == "change":
+        return text[:index] + rng.choice("abcdefghijklmnopqrstuvwxyz") + text[index + 1:]
+
+    return text[:index] + text[index] + text[index:]
+
+
+def build_corpus(count: int, seed: int = 1018) -> list:
+    """
+    :param count: number of lines
+    :param seed: seed of the random numbers
+    :return: lines like the sketch prints, about a third of them with mangled labels, cut off or with garbage
+    """
+
+    rng = random.Random(seed)
+    lines = []
+    for index in range(count):
+
+        labels = [mangle(label, rng) if rng.random() < 0.1 else label for label in sketch_labels]
+        values = [f"{rng.uniform(0, 1000):.2f}", f"{rng.uniform(5, 9):.2f}", f"{rng.uniform(60, 80):.2f}",
+                  f"{rng.uniform(50, 90):.2f}", f"{rng.uniform(20, 80):.2f}"]
+        line = " ".join(f"{label}: {value}" for label, value in zip(labels, values))
+
+        chance = rng.random()
+        if chance < 0.05:
+            line = line[:rng.randrange(len(line))]
+
+        elif chance < 0.1:
+            line = "\x00\x13" + line[rng.randrange(len(line)):]
+
+        lines.append(line)
+
+    return lines
+
+
+def check_edit_distance(string1, string2) -> int:
+    """ MultiSensor.check_edit_distance before the label index """
+
+    m = len(string1)
+    n = len(string2)
+    count = 0
+    i = 0
+    j = 0
+    while i < m and j < n:
+
+        if string1[i] != string2[j]:
+
+            if m > n:
+                i += 1
+            elif m < n:
+                j += 1
+            else:
+                i += 1
+                j += 1
+
+            count += 1
+
+        else:
+            i += 1
+            j += 1
+
+    if i < m or j < n:
+        count += 1
+
+    return count
+
+
+def validate_with_edit_distance(sensor_readings: str, columns: dict) -> dict:
+    """ MultiSensor.validate_sensor_data before the label index """
+
+    sensor_data = {}
+    for reading_pair in sensor_readings.split(" "):
+
+        key_value = reading_pair.split(":")
+        if len(key_value) != 2:
+            continue
+
+        sensor_name, data = key_value
+        for column_name in columns.keys():
+
+            if check_edit_distance(sensor_name, column_name) <= 1 and data != "":
+
+                try:
+                    if columns[column_name] == "REAL":
+                        float(data)
+
+                    elif columns[column_name] == "INTEGER":
+                        int(data)
+
+                    else:
+                        raise ValueError("Datatype should be 'REAL' for floats and 'INTEGERS' for integers")
+
+                    sensor_data[column_name] = data
+
+                except ValueError:
+                    pass
+
+    return sensor_data
+
+
+def measure(function, lines: list) -> float:
+    """
+    :param function: parses one line
+    :param lines: lines to parse
+    :return: lines per second
+    """
+
+    start = time.perf_counter()
+    for line in lines:
+        function(line)
+
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main() -> None:
+
+    # More columns shows how each approach grows as sensors are added
+    extra_columns = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    columns = dict(column_info)
+    columns.update({f"extra_sensor_{index}": "REAL" for index in range(extra_columns)})
+
+    lines = build_corpus(20000)
+    matcher = LabelMatcher(columns, aliases)
+
+    parsed = [matcher.parse(line) for line in lines]
+    complete = sum(1 for values in parsed if len(values) == 5)
+    print(f"{len(lines)} lines, {len(columns)} columns, {complete} lines with all 5 readings found by the index")
+
+    old = measure(lambda line: validate_with_edit_distance(line, columns), lines)
+    new = measure(matcher.parse, lines)
+    print(f"edit distance to every column: {old:10.0f} lines/s")
+    print(f"one edit index:                {new:10.0f} lines/s ({new / old:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
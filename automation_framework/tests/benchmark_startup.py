@@ -0,0 +1,77 @@
+"""
+Measures how long a cold start of the controller takes to load its code. Each case runs in a new python process so
+nothing is already imported, the same as restarting the controller. Run this on the Pi the controller runs on, from the
+automation_framework folder:
+
+    python3 -m tests.benchmark_startup
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that are slow to import on a Pi and are only needed by some types of objects
+heavy_modules = ["requests", "serial", "smtplib", "ssl", "asyncio", "RPi"]
+
+cases = {"import json_loader": "import framework.json_loader",
+         "timer output": "import framework.json_loader as json\n"
+                         "json.create_timer_output('water_pump.json')",
+         "clock output": "import framework.json_loader as json\n"
+                         "json.create_fish_feeder('fish_feeder.json')",
+         "weather manager": "import framework.json_loader as json\n"
+                            "json.create_weather_manager('weather_manager.json')",
+         "multi-sensor": "import framework.json_loader as json\n"
+                         "json.get_device_type('MultiSensor')"}
+
+report = "import sys\nprint(','.join(module for module in {modules} if module in sys.modules))"
+
+
+def run_case(code: str, runs: int) -> tuple:
+    """
+    Runs the code in a new python process a number of times
+
+    :param code: python code to run
+    :param runs: number of times to run it
+    :return: (list of run times in seconds, heavy modules that were imported) or (None, error) if the code failed
+    """
+
+    seconds = []
+    loaded = ""
+    for run in range(runs):
+
+        start_seconds = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code + "\n" + report.format(modules=heavy_modules)],
+                                capture_output=True, text=True)
+        seconds.append(time.perf_counter() - start_seconds)
+
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+
+        loaded = result.stdout.strip()
+
+    return seconds, loaded
+
+
+def main(runs: int = 10) -> None:
+
+    # An empty interpreter is the floor. Everything above it is our code and its imports.
+    baseline, _ = run_case("pass", runs)
+    baseline_median = statistics.median(baseline)
+    print(f"{'python with no imports':<24} median {baseline_median * 1000:7.1f} ms")
+
+    for name, code in cases.items():
+
+        seconds, loaded = run_case(code, runs)
+        if seconds is None:
+            print(f"{name:<24} FAILED: {loaded}")
+            continue
+
+        median = statistics.median(seconds)
+        print(f"{name:<24} median {median * 1000:7.1f} ms  (+{(median - baseline_median) * 1000:.1f} ms)  "
+              f"min {min(seconds) * 1000:7.1f} ms  heavy modules: {loaded if loaded else 'none'}")
+
+
+if __name__ == "__main__":
+
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,89 @@
+"""
+Tests for the compressed archive files of old rows and the reader that joins them with the live table
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from framework.database import archive, database
+
+column_info = {"date_time": "TEXT", "timestamp": "INTEGER", "water_temp": "REAL", "tds": "INTEGER"}
+columns = ["date_time", "timestamp", "water_temp", "tds"]
+
+
+def make_rows(days_ago: int, count: int, seconds_apart: int = 60) -> list:
+    """ Readings starting at midnight a number of days ago """
+
+    day = datetime.now().date() - timedelta(days=days_ago)
+    start = int(datetime(day.year, day.month, day.day).timestamp())
+    return [(f"reading {days_ago} {number}", start + number * seconds_apart,
+             None if number % 10 == 3 else 70 + number % 5 / 4, 300 + number) for number in range(count)]
+
+
+def create_sensor_table(path: str, rows: list) -> None:
+
+    database.create_table("sensors", column_info, True, path)
+    database.insert_many("sensors", columns, rows, path)
+
+
+def test_columns_round_trip(tmp_path):
+
+    path = str(tmp_path / "archive" / "day.arc")
+    rows = make_rows(3, 1440)
+    archive.write_archive(path, "sensors", "timestamp", columns, rows)
+
+    archive_file = archive.ArchiveFile(path)
+    try:
+        assert archive_file.row_count == 1440
+        assert archive_file.get_rows(columns, 0, 2 ** 40) == rows
+        assert archive_file.get_rows(["tds", "air_temp"], rows[5][1], rows[7][1]) == \
+            [(305, None), (306, None), (307, None)]
+        assert archive_file.columns["water_temp"]["type"] == "real"
+
+    finally:
+        archive_file.close()
+
+    # A day of minute readings is much smaller than the raw values
+    assert os.path.getsize(path) < 1440 * 8 * 4 / 4
+
+
+def test_old_days_move_to_archive_files(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    archive_directory = str(tmp_path / "archives")
+    old_rows = make_rows(5, 500) + make_rows(4, 500)
+    live_rows = make_rows(1, 100) + make_rows(0, 10)
+    create_sensor_table(path, old_rows + live_rows)
+
+    assert archive.archive_old_data("sensors", 2, archive_directory, path, batch_pause=0) == 1000
+    assert [day for day, file_path in archive.get_archive_days("sensors", archive_directory)] == \
+        [datetime.now().date() - timedelta(days=5), datetime.now().date() - timedelta(days=4)]
+    assert database.execute("SELECT count(*) FROM sensors", result_count=database.ResultCount.ONE,
+                            path_to_database=path) == (110,)
+
+    # Rows left behind by an archive that stopped before deleting them are not stored twice
+    database.insert_many("sensors", columns, old_rows[:20], path)
+    assert archive.archive_old_data("sensors", 2, archive_directory, path, batch_pause=0) == 20
+
+    reader = archive.ArchiveReader("sensors", archive_directory, path)
+    try:
+        assert reader.get_readings_between(columns, 0, 2 ** 40) == old_rows + live_rows
+        assert reader.get_readings_between(["timestamp", "tds"], old_rows[490][1], live_rows[1][1]) == \
+            [(row[1], row[3]) for row in old_rows[490:] + live_rows[:2]]
+
+        values = [row[2] for row in old_rows + live_rows if row[2] is not None]
+        minimum, maximum, mean, count = reader.get_aggregate("water_temp", 0, 2 ** 40)
+        assert (minimum, maximum, count) == (min(values), max(values), len(values))
+        assert abs(mean - sum(values) / len(values)) < 1e-9
+
+    finally:
+        reader.close()
+
+    assert archive.delete_old_archives("sensors", 4, archive_directory) == 1
+    database.get_connection_manager(path).close()
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
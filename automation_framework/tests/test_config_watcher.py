@@ -0,0 +1,198 @@
+"""
+Tests for reloading json files while the controller is running. The output folder is a temporary folder so the files in
+resources are never touched.
+"""
+
+import json
+import logging
+import os
+
+import framework.json_loader as json_loader
+from framework.io.input.sensors.ingest_engine import IngestEngine
+from framework.managers.config_watcher import ConfigWatcher
+from framework.time.scheduler import Scheduler
+
+column_info = {"id": "PRIMARY KEY", "date_time": "TEXT", "water_temp": "REAL"}
+
+
+class FakeScheduler:
+    """ Records what the watcher asks the scheduler to do """
+
+    def __init__(self):
+        self.calls = []
+
+    def add(self, io):
+        self.calls.append(("add", io.name))
+
+    def remove(self, io):
+        self.calls.append(("remove", io.name))
+
+    def reschedule(self, io):
+        self.calls.append(("reschedule", io.name))
+
+
+def write_json(path: str, data: dict) -> None:
+    """ Writes a json file and moves its modified time forward so the change is seen even on a coarse clock """
+
+    modified_time = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    with open(path, 'w') as json_file:
+        json.dump(data, json_file)
+
+    modified_time = max(modified_time + 1_000_000_000, os.stat(path).st_mtime_ns)
+    os.utime(path, ns=(modified_time, modified_time))
+
+
+def timer_output_data(name: str, pin: int, interval: int = 2, on_seconds: int = 10) -> dict:
+    return {"name": name, "actions": {"find_state": interval}, "out_pins": [pin], "on_seconds": on_seconds,
+            "off_seconds": 20}
+
+
+def create_watcher(tmp_path, monkeypatch) -> (ConfigWatcher, FakeScheduler, str):
+
+    directory = str(tmp_path / "timer_outputs") + "/"
+    os.mkdir(directory)
+    monkeypatch.setattr(json_loader, "path_to_timer_outputs", directory)
+    monkeypatch.setattr(json_loader, "output_directories", {directory: json_loader.create_timer_output})
+
+    watcher = ConfigWatcher("config_watcher", {"check_for_changes": 1}, [directory])
+    scheduler = FakeScheduler()
+    watcher.set_scheduler(scheduler)
+
+    return watcher, scheduler, directory
+
+
+def test_changed_file_is_applied_and_new_pins_replace_the_output(tmp_path, monkeypatch):
+
+    watcher, scheduler, directory = create_watcher(tmp_path, monkeypatch)
+    path = os.path.join(directory, "pump.json")
+    write_json(path, timer_output_data("pump", 18))
+
+    # A new file in an output folder creates an output
+    watcher.check_for_changes()
+    assert scheduler.calls == [("add", "pump")]
+    pump = watcher.watched[os.path.normpath(path)]
+
+    # Nothing changed
+    watcher.check_for_changes()
+    assert len(scheduler.calls) == 1
+
+    # New interval and on time are applied to the same object
+    write_json(path, timer_output_data("pump", 18, interval=5, on_seconds=30))
+    watcher.check_for_changes()
+    assert watcher.watched[os.path.normpath(path)] is pump
+    assert pump.timers["find_state"].interval == 5
+    assert pump.on_seconds == 30
+    assert scheduler.calls[-1] == ("reschedule", "pump")
+
+    # New pins replace the object
+    write_json(path, timer_output_data("pump", 23))
+    watcher.check_for_changes()
+    replaced = watcher.watched[os.path.normpath(path)]
+    assert replaced is not pump
+    assert replaced.output_pins == [23]
+    assert scheduler.calls[-2:] == [("remove", "pump"), ("add", "pump")]
+
+    # A file that can not be used leaves the object running with its old settings
+    write_json(path, dict(timer_output_data("pump", 23), actions={"not_an_action": 1}))
+    watcher.check_for_changes()
+    assert watcher.watched[os.path.normpath(path)] is replaced
+    assert replaced.timers["find_state"].interval == 2
+
+    # Removing the file removes the object
+    os.remove(path)
+    watcher.check_for_changes()
+    assert watcher.watched == {}
+    assert scheduler.calls[-1] == ("remove", "pump")
+
+
+def test_blocking_and_timeout_changes_reach_the_scheduler(tmp_path, monkeypatch):
+
+    watcher, fake_scheduler, directory = create_watcher(tmp_path, monkeypatch)
+    path = os.path.join(directory, "pump.json")
+    write_json(path, timer_output_data("pump", 18))
+
+    scheduler = Scheduler()
+    watcher.set_scheduler(scheduler)
+    watcher.check_for_changes()
+
+    # Same interval and timer, only how the action is run changes
+    data = timer_output_data("pump", 18)
+    data["actions"] = {"find_state": {"interval": 2, "blocking": True, "timeout": 3}}
+    write_json(path, data)
+    watcher.check_for_changes()
+
+    queued_slots = [entry[3] for entry in scheduler.queue]
+    assert [(slot.blocking, slot.timeout) for slot in queued_slots] == [(True, 3)]
+
+    pump = watcher.watched[os.path.normpath(path)]
+    assert queued_slots[0] is pump.action_table["find_state"]
+    assert not pump.apply_config(data)
+
+
+def test_files_in_the_output_folder_at_start_up_are_not_created(tmp_path, monkeypatch):
+
+    directory = str(tmp_path / "timer_outputs") + "/"
+    os.mkdir(directory)
+    monkeypatch.setattr(json_loader, "path_to_timer_outputs", directory)
+    monkeypatch.setattr(json_loader, "output_directories", {directory: json_loader.create_timer_output})
+
+    # A test config the controller does not load
+    path = os.path.join(directory, "timer_output_test.json")
+    write_json(path, timer_output_data("timer output test", 36))
+
+    watcher = ConfigWatcher("config_watcher", {"check_for_changes": 1}, [directory])
+    scheduler = FakeScheduler()
+    watcher.set_scheduler(scheduler)
+
+    watcher.check_for_changes()
+    write_json(path, timer_output_data("timer output test", 36, interval=5))
+    watcher.check_for_changes()
+    assert watcher.watched == {}
+    assert scheduler.calls == []
+
+    # Deleted then added again while running
+    os.remove(path)
+    watcher.check_for_changes()
+    write_json(path, timer_output_data("timer output test", 36))
+    watcher.check_for_changes()
+    assert scheduler.calls == [("add", "timer output test")]
+
+
+def test_ingest_engine_rejects_new_boards(tmp_path, monkeypatch, caplog):
+
+    watcher, scheduler, directory = create_watcher(tmp_path, monkeypatch)
+    path = str(tmp_path / "ingest_engine.json")
+    devices = {"tank_1": {"path": str(tmp_path / "board"), "database_table_name": "tank_1_sensordata",
+                          "database_column_info": column_info}}
+    data = {"name": "ingest_engine", "actions": {"store_readings": 5}, "devices": devices}
+    write_json(path, data)
+
+    engine = IngestEngine(data["name"], data["actions"], devices, path_to_database=str(tmp_path / "database.db"))
+    engine.config_path = path
+    watcher.watch(engine)
+
+    try:
+        # A second board can not be added while running
+        new_devices = dict(devices, tank_2=dict(devices["tank_1"], database_table_name="tank_2_sensordata"))
+        write_json(path, dict(data, actions={"store_readings": 10}, devices=new_devices))
+        with caplog.at_level(logging.CRITICAL):
+            watcher.check_for_changes()
+
+        assert "can not be changed while it is running" in caplog.text
+        assert [device.name for device in engine.devices] == ["tank_1"]
+        assert engine.timers["store_readings"].interval == 5
+
+        # The actions can
+        write_json(path, dict(data, actions={"store_readings": 10}))
+        watcher.check_for_changes()
+        assert engine.timers["store_readings"].interval == 10
+        assert scheduler.calls == [("reschedule", "ingest_engine")]
+
+    finally:
+        engine.stop()
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
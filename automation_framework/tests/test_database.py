@@ -0,0 +1,246 @@
+"""
+Tests for the database functions and the connection manager
+"""
+
+import multiprocessing
+import sqlite3
+import threading
+from datetime import datetime
+
+from framework.database import database
+from framework.database.connection import ConnectionManager
+from framework.database.database_manager import DatabaseManager
+
+
+def test_execute_query_keeps_connections_open(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    database.create_table("sensors", {"date_time": "TEXT", "timestamp": "INTEGER", "water_temp": "REAL"}, True, path)
+    database.insert_data("sensors", {"date_time": "10/18/2026 12:00:00", "timestamp": 1, "water_temp": 70.5}, path)
+
+    assert database.get_sensor_reading("sensors", ["date_time", "water_temp"], path) == \
+        ("10/18/2026 12:00:00", 70.5)
+
+    manager = database.get_connection_manager(path)
+    writer = manager.get_writer()
+    database.insert_data("sensors", {"date_time": "10/18/2026 12:00:05", "timestamp": 6, "water_temp": 71.0}, path)
+    assert manager.get_writer() is writer
+
+    assert writer.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    manager.close()
+
+
+def test_readers_are_per_thread_and_read_only(tmp_path):
+
+    manager = ConnectionManager(str(tmp_path / "database.db"))
+    manager.execute("CREATE TABLE numbers (number INTEGER)")
+    manager.execute("INSERT INTO numbers VALUES (?)", (1,))
+
+    readers = []
+    thread = threading.Thread(target=lambda: readers.append(manager.get_reader()))
+    thread.start()
+    thread.join()
+
+    assert manager.get_reader() is manager.get_reader()
+    assert manager.get_reader() is not readers[0]
+    assert manager.execute("SELECT number FROM numbers", fetch="ALL") == [(1,)]
+
+    try:
+        manager.get_reader().execute("INSERT INTO numbers VALUES (2)")
+        assert False, "reader connections should not write"
+
+    except sqlite3.OperationalError:
+        pass
+
+    manager.close()
+
+
+def test_reader_is_not_blocked_by_an_open_write(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    manager = ConnectionManager(path)
+    manager.execute("CREATE TABLE numbers (number INTEGER)")
+    manager.execute("INSERT INTO numbers VALUES (1)")
+
+    # Another process (the web app) holds a write transaction open
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+    other.execute("INSERT INTO numbers VALUES (2)")
+
+    assert manager.execute("SELECT COUNT(*) FROM numbers", fetch="ONE") == (1,)
+
+    other.commit()
+    other.close()
+    assert manager.execute("SELECT COUNT(*) FROM numbers", fetch="ONE") == (2,)
+    manager.close()
+
+
+def insert_number(path: str) -> None:
+
+    database.get_connection_manager(path).execute("INSERT INTO numbers VALUES (?)", (2,))
+
+
+def test_child_process_does_not_inherit_a_held_write_lock(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    manager = database.get_connection_manager(path)
+    manager.execute("CREATE TABLE numbers (number INTEGER)")
+
+    # Another thread holds the lock while the process forks
+    held = threading.Event()
+    release = threading.Event()
+
+    def hold_write_lock():
+        with manager.write_lock:
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold_write_lock)
+    thread.start()
+    held.wait()
+
+    process = multiprocessing.get_context("fork").Process(target=insert_number, args=(path,))
+    process.start()
+    process.join(10)
+    if process.is_alive():
+        process.kill()
+
+    release.set()
+    thread.join()
+
+    assert process.exitcode == 0
+    assert manager.execute("SELECT number FROM numbers", fetch="ALL") == [(2,)]
+    manager.close()
+
+
+def test_values_are_bound_not_formatted(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    database.create_table("Settings", {"Setting_name": "TEXT", "Value": "TEXT"}, True, path)
+
+    # Quotes in a value used to break the insert
+    database.insert_data("Settings", {"Setting_name": "note", "Value": 'say "hi" it\'s on'}, path)
+    assert database.select_data("Settings", database.ResultCount.ONE, ["Value"], path_to_database=path,
+                                where="Setting_name = ?", parameters=("note",)) == ('say "hi" it\'s on',)
+
+    assert database.build_insert_query("Settings", ("Setting_name", "Value")) == \
+        "INSERT INTO Settings (Setting_name, Value) VALUES (?, ?)"
+    database.get_connection_manager(path).close()
+
+
+def test_insert_many_is_one_transaction(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    database.create_table("weather", {"date_time": "INTEGER", "temperature": "REAL NOT NULL"}, True, path)
+
+    assert database.insert_many("weather", ["date_time", "temperature"], [(1, 50.0), (2, 51.5), (3, 49.0)], path) == 3
+    assert database.execute("SELECT COUNT(*) FROM weather", result_count=database.ResultCount.ONE,
+                            path_to_database=path) == (3,)
+
+    # The last row breaks a constraint so none of the rows are kept
+    assert database.insert_many("weather", ["date_time", "temperature"], [(4, 50.0), (5, None)], path) == 0
+    assert database.execute("SELECT COUNT(*) FROM weather", result_count=database.ResultCount.ONE,
+                            path_to_database=path) == (3,)
+    database.get_connection_manager(path).close()
+
+
+def test_timestamp_migration_and_queries(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    manager = database.get_connection_manager(path)
+
+    # A table from before the timestamp column. Month first text sorts 01/... (2025) before 12/... (2024).
+    database.create_table("sensors", {"id": "INTEGER PRIMARY KEY", "date_time": "TEXT", "water_temp": "REAL"}, True,
+                          path)
+    rows = [("12/31/2024 23:59:50", 70.0), ("01/01/2025 00:00:05", 71.0), ("not a date", 72.0)]
+    database.insert_many("sensors", ["date_time", "water_temp"], rows, path)
+
+    assert database.init_timestamp_column("sensors", path, batch_size=2) == 2
+    assert database.init_timestamp_column("sensors", path) == 0
+
+    new_year = int(datetime(2025, 1, 1, 0, 0, 5).timestamp())
+    assert database.get_sensor_reading("sensors", ["timestamp", "water_temp"], path) == (new_year, 71.0)
+    assert database.get_sensor_readings_between("sensors", ["water_temp"], new_year - 15, new_year, path) == \
+        [(70.0,), (71.0,)]
+
+    plan = manager.execute("EXPLAIN QUERY PLAN SELECT water_temp FROM sensors ORDER BY timestamp DESC LIMIT 1",
+                           fetch="ALL")
+    assert "sensors_timestamp" in str(plan)
+
+    # Rows older than 1 day are removed. The row without a timestamp is kept.
+    database.insert_data("sensors", {"date_time": "now", "timestamp": int(datetime.now().timestamp()),
+                                     "water_temp": 73.0}, path)
+    database.purge_old_data("sensors", 1, path)
+    assert manager.execute("SELECT water_temp FROM sensors ORDER BY id", fetch="ALL") == [(72.0,), (73.0,)]
+    manager.close()
+
+
+def test_purge_deletes_in_batches_and_vacuum_reclaims_space(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    manager = database.get_connection_manager(path)
+    assert not database.is_incremental_vacuum(path)
+    assert database.init_incremental_vacuum(path)
+    assert database.is_incremental_vacuum(path)
+
+    database.create_table("sensors", {"timestamp": "INTEGER", "note": "TEXT"}, True, path)
+    manager.execute("CREATE INDEX sensors_timestamp ON sensors (timestamp)")
+    manager.execute("CREATE TABLE sensors_minute (bucket INTEGER, column_name TEXT, PRIMARY KEY (bucket, column_name)) "
+                    "WITHOUT ROWID")
+
+    now = int(datetime.now().timestamp())
+    old = now - 3 * 86400
+    database.insert_many("sensors", ["timestamp", "note"],
+                         [(old + number, "x" * 200) for number in range(3000)] + [(now, "new")], path)
+    database.insert_many("sensors_minute", ["bucket", "column_name"],
+                         [(old + number * 60, column) for number in range(300) for column in ("tds", "ph")] +
+                         [(now, "tds")], path)
+
+    # Count the transactions so the batches can be checked
+    commits = []
+    writer = manager.get_writer()
+    writer.set_trace_callback(lambda statement: commits.append(statement) if statement == "COMMIT" else None)
+
+    assert database.purge_old_data("sensors", 1, path, batch_size=100, batch_pause=0) == 3000
+    assert len(commits) >= 30
+    assert manager.execute("SELECT note FROM sensors", fetch="ALL") == [("new",)]
+
+    assert database.purge_old_data("sensors_minute", 1, path, "bucket", batch_size=7, batch_pause=0) == 600
+    assert manager.execute("SELECT bucket FROM sensors_minute", fetch="ALL") == [(now,)]
+
+    writer.set_trace_callback(None)
+    assert database.incremental_vacuum(path, pages_per_step=10, step_pause=0) > 0
+    assert manager.execute("PRAGMA freelist_count", fetch="ONE") == (0,)
+    manager.close()
+
+
+def test_database_manager_purges_each_table(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    database.create_table("sensors", {"timestamp": "INTEGER"}, True, path)
+    database.create_table("weather", {"time_stamp": "INTEGER"}, True, path)
+
+    now = int(datetime.now().timestamp())
+    database.insert_many("sensors", ["timestamp"], [(now - 10 * 86400,), (now - 86400,), (now,)], path)
+    database.insert_many("weather", ["time_stamp"], [(now - 10 * 86400,), (now - 86400,), (now,)], path)
+
+    database_manager = DatabaseManager("database_manager", {"purge_old_data": 3600}, path,
+                                       {"sensors": {"max_age": 2},
+                                        "weather": {"max_age": 0.5, "timestamp_column": "time_stamp"}},
+                                       batch_pause=0)
+    # The database was not converted so the manager does not rebuild it
+    assert not database_manager.incremental_vacuum
+    assert not database.is_incremental_vacuum(path)
+
+    database_manager.purge_old_data()
+
+    assert database_manager.purged_rows == {"sensors": 1, "weather": 2}
+    assert database.execute("SELECT count(*) FROM sensors", result_count=database.ResultCount.ONE,
+                            path_to_database=path) == (2,)
+    database.get_connection_manager(path).close()
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
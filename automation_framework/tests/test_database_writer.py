@@ -0,0 +1,198 @@
+"""
+Tests for the database writer thread
+"""
+
+import logging
+import sqlite3
+import threading
+
+from framework.database import connection, database
+from framework.database.connection import ConnectionManager
+from framework.database.writer import DatabaseWriter, Write, get_database_writer
+
+insert_query = "INSERT INTO readings (number) VALUES (?)"
+
+
+def create_readings_table(path: str) -> None:
+
+    database.create_table("readings", {"number": "INTEGER"}, True, path)
+
+
+def count_rows(path: str) -> int:
+
+    return database.execute("SELECT COUNT(*) FROM readings", result_count=database.ResultCount.ONE,
+                            path_to_database=path)[0]
+
+
+def test_writes_are_committed_in_groups(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    create_readings_table(path)
+
+    writer = DatabaseWriter(path, batch_size=50, flush_interval=5)
+    writer.start()
+    try:
+        assert get_database_writer(path) is writer
+
+        # Goes through the writer because it is running
+        for number in range(120):
+            database.insert_data("readings", {"number": number}, path)
+
+        assert writer.flush(5)
+        assert count_rows(path) == 120
+        assert writer.written_count == 120
+        assert writer.commit_count == 3
+
+    finally:
+        writer.stop()
+        database.get_connection_manager(path).close()
+
+    assert get_database_writer(path) is None
+
+
+def test_drop_oldest_when_full(tmp_path):
+
+    # Not started so nothing leaves the queue
+    writer = DatabaseWriter(str(tmp_path / "database.db"), max_queue_size=3, backpressure="drop_oldest")
+    for number in range(5):
+        writer.write(insert_query, (number,))
+
+    assert writer.dropped_count == 2
+    assert [queued_write.parameters for queued_write in writer.queue] == [(2,), (3,), (4,)]
+
+
+def test_aggregate_keeps_latest_value_for_a_key(tmp_path):
+
+    writer = DatabaseWriter(str(tmp_path / "database.db"), max_queue_size=10, backpressure="aggregate")
+    update = "UPDATE output_states SET output_state = ? WHERE output_name = ?"
+    for state in ("True", "False", "True"):
+        writer.write(update, (state, "water_pump"), key=("output_states", "water_pump"))
+
+    writer.write(update, ("False", "fish_feeder"), key=("output_states", "fish_feeder"))
+
+    assert writer.aggregated_count == 2
+    assert [queued_write.parameters for queued_write in writer.queue] == [("True", "water_pump"),
+                                                                          ("False", "fish_feeder")]
+
+
+def test_block_waits_for_room(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    create_readings_table(path)
+
+    writer = DatabaseWriter(path, max_queue_size=2, batch_size=1, flush_interval=0)
+    for number in range(2):
+        writer.write(insert_query, (number,))
+
+    # The queue is full so the third write waits until the writer starts taking rows
+    blocked = threading.Thread(target=writer.write, args=(insert_query, (2,)))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    writer.start()
+    try:
+        blocked.join(5)
+        assert not blocked.is_alive()
+        assert writer.flush(5)
+        assert count_rows(path) == 3
+        assert writer.dropped_count == 0
+
+    finally:
+        writer.stop()
+        database.get_connection_manager(path).close()
+
+
+def test_locked_database_is_retried_not_dropped(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    connection.managers[path] = ConnectionManager(path, busy_timeout=10)
+    create_readings_table(path)
+
+    # The web app holds the write lock
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+
+    writer = DatabaseWriter(path, flush_interval=0, max_retries=50, retry_delay=0.01)
+    writer.start()
+    try:
+        writer.write(insert_query, (1,))
+        while writer.retry_count == 0:
+            writer.flush(0.01)
+
+        other.rollback()
+        other.close()
+
+        assert writer.flush(5)
+        assert count_rows(path) == 1
+        assert writer.failed_count == 0
+
+    finally:
+        writer.stop()
+        connection.managers.pop(path).close()
+
+
+
+def test_group_put_back_after_a_lock_keeps_the_queue_bounded(tmp_path):
+
+    writer = DatabaseWriter(str(tmp_path / "database.db"), max_queue_size=3, backpressure="drop_oldest")
+    for number in range(3, 6):
+        writer.write(insert_query, (number,))
+
+    # The group that was being retried is older than everything queued since
+    writer._put_back([Write(insert_query, (1,)), Write(insert_query, (2,))])
+    assert [queued_write.parameters for queued_write in writer.queue] == [(3,), (4,), (5,)]
+    assert writer.dropped_count == 2
+
+    # A newer value for the same key replaces the one that was put back
+    writer = DatabaseWriter(str(tmp_path / "database.db"), max_queue_size=3, backpressure="aggregate")
+    update = "UPDATE output_states SET output_state = ? WHERE output_name = ?"
+    writer.write(update, ("False", "water_pump"), key=("output_states", "water_pump"))
+    writer._put_back([Write(update, ("True", "water_pump"), ("output_states", "water_pump")),
+                      Write(update, ("True", "fish_feeder"), ("output_states", "fish_feeder"))])
+
+    assert [queued_write.parameters for queued_write in writer.queue] == [("True", "fish_feeder"),
+                                                                          ("False", "water_pump")]
+    assert writer.aggregated_count == 1
+
+
+def test_stop_reports_writes_left_when_locked(tmp_path, caplog):
+
+    path = str(tmp_path / "database.db")
+    connection.managers[path] = ConnectionManager(path, busy_timeout=10)
+    create_readings_table(path)
+
+    other = sqlite3.connect(path)
+    other.execute("BEGIN IMMEDIATE")
+
+    writer = DatabaseWriter(path, flush_interval=0, max_retries=2, retry_delay=0.01)
+    writer.start()
+    try:
+        for number in range(3):
+            writer.write(insert_query, (number,))
+
+        # Past max_retries block keeps retrying instead of putting the group back
+        while writer.retry_count <= 2:
+            writer.flush(0.01)
+
+        assert len(writer.queue) == 0
+
+        with caplog.at_level(logging.CRITICAL):
+            writer.stop(timeout=0.1)
+
+        assert "3 writes to" in caplog.text
+
+    finally:
+        other.rollback()
+        other.close()
+        writer.thread.join(5)
+        connection.managers.pop(path).close()
+
+    # Written by the thread once the lock was released
+    assert count_rows(path) == 3
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,144 @@
+"""
+Tests for reading several sensor boards on one thread. Each board is a pty linked into a temporary folder the way udev
+links boards into /dev/serial/by-id.
+"""
+
+import os
+import threading
+import time
+
+from framework.database import database
+from framework.io.input.sensors import sensor_protocol
+from framework.io.input.sensors.ingest_engine import IngestEngine
+
+column_info = {"id": "PRIMARY KEY", "date_time": "TEXT", "timestamp": "INTEGER", "water_temp": "REAL", "tds": "REAL"}
+
+
+class FakeBoard:
+    """ A pty the test writes to as the board. Plugging it in links its port to the path the engine looks for. """
+
+    def __init__(self, link: str):
+        self.link = link
+        self.board = None
+        self.port = None
+
+    def plug_in(self) -> None:
+        self.board, self.port = os.openpty()
+        os.symlink(os.ttyname(self.port), self.link)
+
+    def unplug(self) -> None:
+        os.remove(self.link)
+        os.close(self.board)
+        os.close(self.port)
+
+    def write(self, data: bytes) -> None:
+        os.write(self.board, data)
+
+
+def wait_for(condition) -> None:
+
+    deadline = time.time() + 5
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def get_rows(table_name: str, path: str) -> list:
+    return database.execute(f"SELECT water_temp, tds FROM {table_name} ORDER BY id",
+                            result_count=database.ResultCount.ALL, path_to_database=path)
+
+
+def test_boards_are_read_on_one_thread_and_replugged(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    boards = {f"tank_{index}": FakeBoard(str(tmp_path / f"usb-Arduino_{index}-if00")) for index in range(3)}
+    devices = {name: {"path": board.link, "database_table_name": f"{name}_sensordata",
+                      "database_column_info": column_info} for name, board in boards.items()}
+
+    threads = threading.active_count()
+    engine = IngestEngine("ingest_engine", {}, devices, path_to_database=path)
+    for board in boards.values():
+        board.plug_in()
+
+    engine.start()
+    wait_for(lambda: all(device.file_descriptor is not None for device in engine.devices))
+    assert threading.active_count() == threads + 1
+
+    # Text from one board, binary frames from another and one that has not sent anything yet
+    boards["tank_0"].write(b"water_temp:70.5 tds:300\r\nWater Temp: 71.5 TDS: 301\r\n")
+    boards["tank_1"].write(sensor_protocol.encode_frame(0, {"water_temp": 60.0, "tds": 200.0}))
+    wait_for(lambda: len(engine.devices[0].readings) == 2 and len(engine.devices[1].readings) == 1)
+    engine.store_readings()
+
+    assert get_rows("tank_0_sensordata", path) == [(70.5, 300.0), (71.5, 301.0)]
+    assert get_rows("tank_1_sensordata", path) == [(60.0, 200.0)]
+    assert get_rows("tank_2_sensordata", path) == []
+
+    # Unplugged boards are closed when their port hangs up and opened again when they come back
+    boards["tank_2"].unplug()
+    wait_for(lambda: engine.devices[2].file_descriptor is None)
+    assert engine.devices[2].file_descriptor is None
+
+    boards["tank_2"].plug_in()
+    engine.scan_devices()
+    wait_for(lambda: engine.devices[2].file_descriptor is not None)
+    assert engine.devices[2].connect_count == 2
+
+    boards["tank_2"].write(b"water_temp:50 tds:100\n")
+    wait_for(lambda: len(engine.devices[2].readings) == 1)
+    engine.store_readings()
+    assert get_rows("tank_2_sensordata", path) == [(50.0, 100.0)]
+
+    engine.stop()
+    assert not engine.thread.is_alive()
+    for board in boards.values():
+        board.unplug()
+
+
+
+def test_silent_and_failing_boards_are_opened_again(tmp_path, caplog):
+
+    path = str(tmp_path / "database.db")
+    boards = {"quiet": FakeBoard(str(tmp_path / "rfcomm0")), "broken": FakeBoard(str(tmp_path / "rfcomm1"))}
+    devices = {name: {"path": board.link, "database_table_name": f"{name}_sensordata",
+                      "database_column_info": column_info} for name, board in boards.items()}
+    devices["quiet"]["stale_timeout"] = 0.2
+
+    engine = IngestEngine("ingest_engine", {}, devices, path_to_database=path, stale_timeout=60)
+    quiet, broken = engine.devices
+    for board in boards.values():
+        board.plug_in()
+
+    def fail(count, arrival_time):
+        raise RuntimeError("bad frame")
+
+    broken.splitter.split_frames = fail
+
+    engine.start()
+    wait_for(lambda: quiet.file_descriptor is not None and broken.file_descriptor is not None)
+
+    # An error while reading one board closes it but the thread keeps reading the others
+    boards["broken"].write(b"water_temp:70.5\n")
+    wait_for(lambda: broken.file_descriptor is None)
+    assert engine.thread.is_alive()
+    assert "reading 'broken' raised: bad frame" in caplog.text
+
+    # The rfcomm port of a board out of range stays open without any data
+    time.sleep(0.3)
+    engine.scan_devices()
+    wait_for(lambda: quiet.connect_count == 2 and broken.connect_count == 2)
+    assert quiet.file_descriptor is not None
+    assert broken.file_descriptor is not None
+
+    boards["quiet"].write(b"water_temp:50 tds:100\n")
+    wait_for(lambda: len(quiet.readings) == 1)
+    assert len(quiet.readings) == 1
+
+    engine.stop()
+    for board in boards.values():
+        board.unplug()
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
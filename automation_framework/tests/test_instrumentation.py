@@ -0,0 +1,100 @@
+"""
+Tests for the per action run time and lateness stats
+"""
+
+import json
+import time
+
+import pytest
+
+from framework.io.actions import action
+from framework.io.io import Io, IoType
+from framework.time import timer as timer_module
+from framework.time.instrumentation import ActionStats, Instrumentation, bucket_bounds
+
+
+class SteppedIo(Io):
+
+    def __init__(self, name: str, actions: dict):
+        super().__init__(name, IoType.MANGER, actions, [])
+
+    @action(interval=2)
+    def step(self):
+        pass
+
+
+def test_calls_are_counted_in_histogram_buckets():
+
+    stats = ActionStats("test:action")
+    stats.record(0.0005, 0)
+    stats.record(0.002, 0.02)
+    stats.record(0.002, 0.001)
+    stats.record(100, 40)
+
+    # One bucket for each bound and one for everything larger
+    assert len(stats.histogram) == len(bucket_bounds) + 1
+    assert stats.histogram[0] == 1
+    assert stats.histogram[1] == 2
+    assert stats.histogram[-1] == 1
+    assert stats.lateness_histogram[0] == 2
+    assert stats.lateness_histogram[3] == 1
+    assert stats.lateness_histogram[-1] == 1
+
+    snapshot = stats.snapshot()
+    assert snapshot["count"] == 4
+    assert snapshot["max_seconds"] == 100
+    assert snapshot["mean_lateness"] == (0.02 + 0.001 + 40) / 4
+    assert snapshot["max_lateness"] == 40
+
+    # The snapshot is a copy
+    snapshot["histogram"][0] = 50
+    assert stats.histogram[0] == 1
+
+    assert ActionStats("test:unused").snapshot()["mean_seconds"] == 0
+
+
+def test_dispatch_records_lateness_and_jitter(monkeypatch):
+
+    clock = [1000.0]
+    monkeypatch.setattr(timer_module.time, "monotonic", lambda: clock[0])
+    io = SteppedIo("stepped", {"step": {"interval": 2, "fixed_rate": True}})
+    slot = io.action_table["step"]
+
+    for step in (0, 2, 2.5, 1.5, 2):
+        clock[0] += step
+        io.tick()
+
+    # Due at 1002, 1004, 1006 and 1008. Run 0, 0.5, 0 and 0 seconds late.
+    assert slot.stats.count == 5
+    assert slot.stats.max_lateness == 0.5
+    assert slot.timer.max_lateness == 0.5
+    # Smoothed change in lateness: up by 0.5, down by 0.5 then no change
+    jitter = 0.5 / 16
+    jitter += (0.5 - jitter) / 16
+    jitter -= jitter / 16
+    assert slot.timer.jitter == pytest.approx(jitter)
+
+
+def test_snapshot_is_dumped_to_json(tmp_path):
+
+    instrumentation = Instrumentation()
+    stats = instrumentation.register("water_pump:find_state")
+    assert instrumentation.register("water_pump:find_state") is stats
+    stats.record(0.002, 0.1)
+    instrumentation.register_health("sensor:connection", lambda: {"state": "STREAMING", "failures": 2})
+
+    path = tmp_path / "stats.json"
+    instrumentation.dump_json(str(path))
+    data = json.loads(path.read_text())
+
+    assert data["time"] <= time.time()
+    assert data["bucket_bounds"] == list(bucket_bounds)
+    assert [action_stats["name"] for action_stats in data["actions"]] == ["water_pump:find_state"]
+    assert data["actions"][0]["histogram"][1] == 1
+    assert data["health"] == {"sensor:connection": {"state": "STREAMING", "failures": 2}}
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
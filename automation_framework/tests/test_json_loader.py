@@ -0,0 +1,37 @@
+"""
+Tests for loading device types from the json files
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+import framework.json_loader as json
+
+
+def test_device_types_are_imported_when_used():
+
+    # A new process so modules imported by other tests do not count
+    code = "import sys\n" \
+           "import framework.json_loader as json\n" \
+           "json.create_timer_output('water_pump.json')\n" \
+           "print(','.join(module for module in ('requests', 'serial', 'smtplib', 'RPi') if module in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+def test_unknown_device_type():
+
+    with pytest.raises(ValueError):
+        json.get_device_type("NotADevice")
+
+    assert json.get_device_type("TimerOutput") is json.get_device_type("TimerOutput")
+
+
+if __name__ == "__main__":
+
+    test_device_types_are_imported_when_used()
+    test_unknown_device_type()
@@ -0,0 +1,43 @@
+"""
+Tests for matching the labels sent by a multi-sensor to the columns of its table
+"""
+
+from framework.io.input.sensors.label_matcher import LabelMatcher
+
+column_info = {"id": "PRIMARY KEY", "date_time": "TEXT", "water_pH": "REAL", "tds": "REAL", "water_temp": "REAL",
+               "air_temp": "REAL", "humidity": "REAL", "light": "INTEGER"}
+
+
+def test_labels_one_edit_away_match():
+
+    matcher = LabelMatcher(column_info, {"Ph": "water_pH"})
+
+    assert matcher.parse("TDS: 310.5 Ph: 7.1 Water Temp: 70.5 Air Temp: 68.0 Humidity: 45.2 light:300") == \
+           {"tds": 310.5, "water_pH": 7.1, "water_temp": 70.5, "air_temp": 68.0, "humidity": 45.2, "light": 300}
+
+    # A letter removed, changed and added
+    assert matcher.parse("Watr Temp: 70.5 Air Tamp: 68.0 Humiddity: 45.2") == \
+           {"water_temp": 70.5, "air_temp": 68.0, "humidity": 45.2}
+
+    # Two edits, text columns, a swap that is two edits and values of the wrong type are left out
+    assert matcher.parse("Wtr Temp: 70.5 date_time:10 Humdiity: 45.2 light:3.5 tds: Air Temp: x") == {}
+
+    # Garbage from the start of the connection
+    assert matcher.parse("\x00\x13TDS: 1 Ph: 7") == {"water_pH": 7.0}
+
+
+def test_label_one_edit_away_from_two_columns_is_not_matched():
+
+    matcher = LabelMatcher({"temp_a": "REAL", "temp_b": "REAL", "temp_bc": "REAL"})
+
+    assert matcher.match("temp_a") == ("temp_a", float)
+    assert matcher.match("temp_b") == ("temp_b", float)
+    assert matcher.match("temp_c") is None
+    assert matcher.match("temp_ac") is None
+    assert matcher.match("tmp_bc") == ("temp_bc", float)
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,88 @@
+"""
+Tests for the in memory store of the latest sensor readings
+"""
+
+from framework.database import database
+from framework.io.input.latest_readings import LatestReadings, get_latest_readings
+
+
+def create_sensor_table(path: str) -> None:
+
+    database.create_table("sensors", {"date_time": "TEXT", "timestamp": "INTEGER", "water_temp": "REAL", "tds": "REAL"},
+                          True, path)
+
+
+def test_published_reading_is_read_without_the_database(tmp_path):
+
+    # There is no sensors table so any database read would find nothing
+    latest_readings = LatestReadings("sensors", str(tmp_path / "database.db"))
+    latest_readings.publish({"water_temp": "70.5", "tds": "350", "date_time": "10/18/2026 12:00:00"}, 1000.0)
+
+    assert latest_readings.get_sensor_reading(["timestamp", "water_temp"]) == [1000.0, 70.5]
+    assert latest_readings.get_sensor_reading(["tds", "water_pH"]) == [350.0, None]
+
+    latest_readings.publish({"water_temp": 71}, 1005.0)
+    assert latest_readings.get_sensor_reading(["timestamp", "water_temp", "tds"]) == [1005.0, 71, None]
+
+
+def test_cold_start_reads_the_newest_row_from_the_database(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    create_sensor_table(path)
+    database.insert_data("sensors", {"date_time": "10/18/2026 12:00:00", "timestamp": 1000, "water_temp": 70.5,
+                                     "tds": 350}, path)
+    database.insert_data("sensors", {"date_time": "10/18/2026 12:00:05", "timestamp": 1005, "water_temp": 71.0,
+                                     "tds": 351}, path)
+
+    latest_readings = LatestReadings("sensors", path, refresh_interval=0)
+    assert latest_readings.get_sensor_reading(["timestamp", "water_temp"]) == [1005, 71.0]
+
+    # Rows written by another process are picked up until this process publishes its own readings
+    database.insert_data("sensors", {"timestamp": 1010, "water_temp": 72.0}, path)
+    assert latest_readings.get_sensor_reading(["timestamp", "water_temp"]) == [1010, 72.0]
+
+    latest_readings.publish({"water_temp": 73.0}, 1015.0)
+    database.insert_data("sensors", {"timestamp": 1020, "water_temp": 74.0}, path)
+    assert latest_readings.get_sensor_reading(["timestamp", "water_temp"]) == [1015.0, 73.0]
+
+
+def test_reading_published_during_a_database_load_is_kept(tmp_path, monkeypatch):
+
+    path = str(tmp_path / "database.db")
+    create_sensor_table(path)
+    database.insert_data("sensors", {"date_time": "10/18/2026 12:00:00", "timestamp": 1000, "water_temp": 70.5,
+                                     "tds": 350}, path)
+    latest_readings = LatestReadings("sensors", path, refresh_interval=0)
+
+    # The sensor publishes on its own thread while the alarm check is reading the old row from the database
+    select_data = database.select_data
+
+    def select_then_publish(*args, **kwargs):
+        row = select_data(*args, **kwargs)
+        latest_readings.publish({"water_temp": 72}, 1010.0)
+        return row
+
+    monkeypatch.setattr(database, "select_data", select_then_publish)
+    assert latest_readings.get_sensor_reading(["timestamp", "water_temp"]) == [1010.0, 72]
+
+
+def test_empty_table_reads_none(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    create_sensor_table(path)
+
+    assert LatestReadings("sensors", path).get_sensor_reading(["timestamp", "water_temp"]) is None
+
+
+def test_one_store_for_each_table(tmp_path):
+
+    path = str(tmp_path / "database.db")
+
+    assert get_latest_readings("sensors", path) is get_latest_readings("sensors", path)
+    assert get_latest_readings("sensors", path) is not get_latest_readings("other_sensors", path)
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,79 @@
+"""
+Tests for sensor tables split into a table for each day or week
+"""
+
+from datetime import datetime, timedelta
+
+from framework.database import archive, database, partitions
+
+column_info = {"id": "PRIMARY KEY", "date_time": "TEXT", "water_temp": "REAL"}
+
+
+def days_ago(days: int, seconds: int = 0) -> int:
+
+    day = datetime.now().date() - timedelta(days=days)
+    return int(datetime(day.year, day.month, day.day).timestamp()) + seconds
+
+
+def test_existing_table_is_partitioned_behind_a_view(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    database.init_database("sensors", dict(column_info, timestamp="INTEGER"), True, path)
+    database.insert_data("sensors", {"id": 1, "timestamp": days_ago(3), "water_temp": 70.0}, path)
+
+    table = database.init_database("sensors", column_info, True, path, partition_period="day")
+    assert partitions.get_table_type("sensors", path) == "view"
+    assert partitions.get_table_type("sensors_legacy", path) == "table"
+    assert database.init_timestamp_column("sensors", path) == 0
+
+    table.insert({"timestamp": days_ago(1, 60), "water_temp": 71.0})
+    table.insert({"timestamp": days_ago(0, 60), "water_temp": 72.0})
+    table.insert({"timestamp": days_ago(0, 120), "water_temp": 73.0})
+
+    assert [name for start, end, name in partitions.get_partitions("sensors", path)] == \
+        ["sensors_d" + (datetime.now().date() - timedelta(days=days)).strftime("%Y%m%d") for days in (1, 0)]
+
+    # Reads by the table name see every row and ids keep counting up across the partitions
+    assert database.select_data("sensors", database.ResultCount.ALL, ["id", "water_temp"], "ORDER BY timestamp",
+                                path) == [(1, 70.0), (2, 71.0), (3, 72.0), (4, 73.0)]
+    assert table.get_sensor_reading(["timestamp", "water_temp"]) == (days_ago(0, 120), 73.0)
+    assert table.get_sensor_readings_between(["water_temp"], days_ago(3), days_ago(1, 60)) == [(70.0,), (71.0,)]
+
+    # A restart finds the partitions again
+    table = database.init_database("sensors", column_info, True, path, partition_period="day")
+    assert table.next_id == 5
+    database.get_connection_manager(path).close()
+
+
+def test_retention_drops_old_partitions(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    archive_directory = str(tmp_path / "archives")
+    database.init_database("sensors", column_info, True, path)
+
+    # The empty table created before partitioning is not kept
+    table = database.init_database("sensors", column_info, True, path, partition_period="week")
+    assert partitions.get_table_type("sensors_legacy", path) is None
+
+    for days in (30, 20, 19, 0):
+        table.insert({"timestamp": days_ago(days, 60), "water_temp": 70.0 + days})
+
+    removed_count = partitions.drop_partitions_before("sensors", days_ago(7), path, archive_directory, batch_pause=0)
+    assert removed_count == 3
+    assert database.select_data("sensors", database.ResultCount.ALL, ["water_temp"], path_to_database=path) == [(70.0,)]
+    assert len(partitions.get_partitions("sensors", path)) == 1
+
+    reader = archive.ArchiveReader("sensors", archive_directory, path)
+    try:
+        assert reader.get_readings_between(["water_temp"], 0, 2 ** 40) == [(100.0,), (90.0,), (89.0,), (70.0,)]
+
+    finally:
+        reader.close()
+
+    database.get_connection_manager(path).close()
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
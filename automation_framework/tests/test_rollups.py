@@ -0,0 +1,66 @@
+"""
+Tests for the minute, hour and day summaries of sensor tables
+"""
+
+from framework.database import database, rollups
+
+column_info = {"date_time": "TEXT", "timestamp": "INTEGER", "water_temp": "REAL", "tds": "REAL"}
+columns = rollups.get_numeric_columns(column_info)
+
+# Readings 20 seconds apart starting on a minute
+start = 1760000040
+readings = [{"timestamp": start + index * 20, "water_temp": 70 + index % 7, "tds": 300 + index} for index in range(400)]
+
+
+def expected_summary(resolution: str, column: str) -> list:
+    """ Summaries calculated straight from the readings """
+
+    buckets = {}
+    for reading in readings:
+        buckets.setdefault(rollups.get_bucket(reading["timestamp"], resolution), []).append(reading[column])
+
+    return [(bucket, column, min(values), max(values), sum(values) / len(values), len(values), values[-1])
+            for bucket, values in sorted(buckets.items())]
+
+
+def test_readings_update_each_resolution(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    database.create_table("sensors", column_info, True, path)
+    rollups.init_rollup_tables("sensors", columns, path)
+
+    assert columns == ["water_temp", "tds"]
+
+    # Values are stored as text by the sensor
+    for reading in readings:
+        rollups.update_rollups("sensors", {key: str(value) for key, value in reading.items()}, reading["timestamp"],
+                               columns, path)
+
+    for resolution in rollups.resolutions:
+        assert rollups.get_rollups("sensors", resolution, ["water_temp"], 0, 2 ** 40, path) == \
+            expected_summary(resolution, "water_temp")
+
+    minute = rollups.get_rollups("sensors", "minute", ["tds"], start, start + 59, path)
+    assert minute == [(start, "tds", 300, 302, 301, 3, 302)]
+
+
+def test_existing_rows_are_back_filled_once(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    database.create_table("sensors", column_info, True, path)
+    database.insert_many("sensors", ["timestamp", "water_temp", "tds"],
+                         [(reading["timestamp"], reading["water_temp"], reading["tds"]) for reading in readings], path)
+
+    rollups.init_rollup_tables("sensors", columns, path, batch_size=33)
+    rollups.init_rollup_tables("sensors", columns, path, batch_size=33)
+
+    for resolution in rollups.resolutions:
+        for column in columns:
+            assert rollups.get_rollups("sensors", resolution, [column], 0, 2 ** 40, path) == \
+                expected_summary(resolution, column)
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
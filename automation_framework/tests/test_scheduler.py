@@ -0,0 +1,185 @@
+"""
+Tests for the deadline based scheduler
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from framework.io.actions import action
+from framework.io.io import Io, IoType
+from framework.time.action_executor import ActionExecutor
+from framework.time.async_scheduler import AsyncScheduler
+from framework.time.scheduler import Scheduler
+
+
+class CountingIo(Io):
+
+    def __init__(self, name: str, actions: dict):
+
+        self.calls = []
+        super().__init__(name, IoType.MANGER, actions, [])
+
+    @action(interval=1)
+    def fast(self):
+        self.calls.append("fast")
+
+    @action(interval=60)
+    def slow(self):
+        self.calls.append("slow")
+
+    @action(interval=10, blocking=True)
+    def blocking(self):
+        time.sleep(0.3)
+        self.calls.append("blocking")
+
+    @action(interval=10, blocking=True)
+    def other_blocking(self):
+        self.calls.append("other_blocking")
+
+
+def test_registry_rejects_unknown_action():
+
+    with pytest.raises(ValueError):
+        CountingIo("counter", {"not_an_action": 1})
+
+
+def test_registry_default_interval_and_tick():
+
+    io = CountingIo("counter", {"slow": None, "fast": 1})
+    assert io.timers["slow"].interval == 60
+
+    io.tick()
+    io.tick()
+    assert io.calls == ["slow", "fast"]
+
+    # Each dispatch is recorded in the stats of the slot
+    assert io.action_table["fast"].stats.count >= 1
+
+
+def test_apply_config_keeps_running_timers():
+
+    io = CountingIo("counter", {"fast": 1, "slow": 60})
+    fast_timer = io.timers["fast"]
+
+    assert not io.apply_config({"actions": {"fast": 1, "slow": 60}})
+    assert io.apply_config({"actions": {"fast": 5, "slow": 60}})
+
+    assert io.timers["fast"] is fast_timer
+    assert fast_timer.interval == 5
+    assert io.apply_config({"actions": {"slow": 60}})
+    assert list(io.actions.keys()) == ["slow"]
+
+
+def test_first_run_dispatches_every_action_in_order():
+
+    io = CountingIo("counter", {"fast": 1, "slow": 60})
+    scheduler = Scheduler([io])
+
+    delay = scheduler.run_pending()
+
+    assert io.calls == ["fast", "slow"]
+    assert 0 < delay <= 1
+
+
+def test_only_due_actions_are_dispatched():
+
+    io = CountingIo("counter", {"fast": 0.05, "slow": 60})
+    scheduler = Scheduler([io])
+    scheduler.run_pending()
+
+    time.sleep(scheduler.run_pending() + 0.01)
+    scheduler.run_pending()
+
+    assert io.calls == ["fast", "slow", "fast"]
+
+
+def test_action_can_reschedule_its_own_object():
+
+    io = CountingIo("counter", {"fast": 1})
+    scheduler = Scheduler([io])
+    io.fast = lambda: scheduler.reschedule(io)
+    io.action_slots[0].method = io.fast
+
+    scheduler.run_pending()
+
+    # Only the entries added by reschedule() are left
+    assert len(scheduler.queue) == 1
+
+
+def test_remove_stops_dispatching():
+
+    io = CountingIo("counter", {"fast": 0})
+    scheduler = Scheduler([io])
+    scheduler.remove(io)
+
+    assert scheduler.run_pending() is None
+    assert io.calls == []
+
+
+def test_async_blocking_action_does_not_delay_other_objects():
+
+    slow_io = CountingIo("slow", {"blocking": {"interval": 10, "blocking": True}})
+    fast_io = CountingIo("fast", {"fast": 0.05})
+    scheduler = AsyncScheduler([slow_io, fast_io])
+
+    snapshot = {}
+
+    def stop():
+        snapshot["slow"] = list(slow_io.calls)
+        snapshot["fast"] = list(fast_io.calls)
+        scheduler.stop()
+
+    async def run_for(seconds):
+        asyncio.get_running_loop().call_later(seconds, stop)
+        await scheduler.run()
+
+    asyncio.run(run_for(0.25))
+
+    # The blocking action is still running in the thread pool while the fast action keeps its cadence
+    assert snapshot["slow"] == []
+    assert snapshot["fast"].count("fast") >= 4
+
+
+def test_executor_skips_action_that_is_still_running():
+
+    io = CountingIo("hung", {"blocking": {"interval": 0, "blocking": True, "timeout": 0.1}})
+    executor = ActionExecutor(watchdog_interval=60)
+    io.set_action_executor(executor)
+
+    io.run_action("blocking")
+    io.run_action("blocking")
+    assert executor.skipped_count == 1
+
+    time.sleep(0.15)
+    assert executor.check_overruns() == ["hung:blocking"]
+    assert executor.check_overruns() == []
+
+    executor.shutdown(wait=True)
+    assert io.calls == ["blocking"]
+
+
+def test_overrun_does_not_stop_other_actions_of_the_object():
+
+    io = CountingIo("sensor", {"blocking": {"interval": 0, "blocking": True, "timeout": 0.1}, "other_blocking": 0})
+    executor = ActionExecutor(watchdog_interval=60)
+    io.set_action_executor(executor)
+
+    io.run_action("blocking")
+    time.sleep(0.15)
+    assert executor.check_overruns() == ["sensor:blocking"]
+
+    # The other action keeps running on every tick while the first one is stuck
+    executor.submit(io, "other_blocking").result(timeout=1)
+    executor.submit(io, "other_blocking").result(timeout=1)
+    assert executor.skipped_count == 0
+
+    executor.shutdown(wait=True)
+    assert io.calls == ["other_blocking", "other_blocking", "blocking"]
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,152 @@
+"""
+Tests for the connection state machine of the multi-sensor. A pty stands in for the serial port of the board and a
+python process for rfcomm.
+"""
+
+import fcntl
+import os
+import select
+import struct
+import sys
+import termios
+import time
+import tty
+
+from framework.io.input.sensors.sensor_connection import ConnectionState, SensorConnection
+from framework.io.input.sensors.serial_reader import ReadingBuffer
+
+
+class PtyConnection:
+    """ Opens a pty by path with the parts of serial.Serial used by the connection and its reader """
+
+    def __init__(self, port: str, baudrate: int, timeout: float):
+        self.file_descriptor = os.open(port, os.O_RDWR | os.O_NOCTTY)
+        tty.setraw(self.file_descriptor)
+
+    @property
+    def in_waiting(self) -> int:
+        return struct.unpack("i", fcntl.ioctl(self.file_descriptor, termios.FIONREAD, b"\0\0\0\0"))[0]
+
+    def readinto(self, buffer) -> int:
+
+        if not select.select([self.file_descriptor], [], [], 0.05)[0]:
+            return 0
+
+        return os.readv(self.file_descriptor, [buffer])
+
+    def close(self) -> None:
+        os.close(self.file_descriptor)
+
+
+def parse(line: str) -> dict:
+    """ 'name:value' pairs separated by spaces """
+
+    return dict(pair.split(":") for pair in line.split(" ") if pair.count(":") == 1)
+
+
+def test_failures_back_off_with_jitter(tmp_path):
+
+    connection = SensorConnection("sensor", str(tmp_path / "missing"), 9600, parse, ReadingBuffer(), connect_timeout=0,
+                                  min_backoff=1, max_backoff=10, jitter=0.5)
+
+    now = 1000.0
+    delays = []
+    for attempt in range(6):
+
+        assert connection.advance(now) == ConnectionState.DISCONNECTED
+        delays.append(connection.next_attempt - now)
+
+        # Nothing happens before the delay is over
+        assert connection.advance(now + delays[-1] / 2 - 0.01) == ConnectionState.DISCONNECTED
+        assert connection.connect_attempts == attempt + 1
+        now = connection.next_attempt
+
+    for attempt, delay in enumerate(delays):
+        full_delay = min(10, 2 ** attempt)
+        assert full_delay * 0.5 <= delay <= full_delay
+
+    assert connection.consecutive_failures == 6
+    assert connection.get_metrics()["last_error"].endswith("does not exist")
+
+    # Waiting for the next attempt costs microseconds
+    start = time.perf_counter()
+    for call in range(10000):
+        connection.advance(now - 1)
+
+    assert (time.perf_counter() - start) / 10000 < 0.0005
+
+
+def test_connection_streams_then_restarts_when_readings_stop():
+
+    board, port = os.openpty()
+    tty.setraw(port)
+    readings = ReadingBuffer()
+    connection = SensorConnection("sensor", os.ttyname(port), 9600, parse, readings, probe_timeout=5,
+                                  stale_timeout=10, open_serial=PtyConnection)
+
+    now = time.monotonic()
+    assert connection.advance(now) == ConnectionState.PROBING
+
+    # Garbage is not a valid reading so the connection keeps probing
+    os.write(board, b"\x00\x13garbage\n")
+    time.sleep(0.1)
+    assert connection.advance(now + 1) == ConnectionState.PROBING
+
+    os.write(board, b"tds:300 water_temp:70.5\n")
+    deadline = time.time() + 5
+    while connection.serial_reader.readings_received == 0 and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert connection.advance(now + 2) == ConnectionState.STREAMING
+    assert [values for arrival_time, values in readings.pop_all()] == [{"tds": "300", "water_temp": "70.5"}]
+
+    # No readings for stale_timeout
+    assert connection.advance(now + 11) == ConnectionState.STREAMING
+    assert connection.advance(now + 12) == ConnectionState.DISCONNECTED
+    assert connection.serial_connection is None
+
+    metrics = connection.get_metrics()
+    assert metrics["streams"] == 1
+    assert metrics["failures"] == 1
+    assert metrics["consecutive_failures"] == 1
+
+    connection.close()
+    os.close(board)
+    os.close(port)
+
+
+def test_rfcomm_process_is_reused_then_restarted_and_reaped(tmp_path):
+
+    rfcomm = [sys.executable, "-c", "import time; time.sleep(60)"]
+    connection = SensorConnection("sensor", str(tmp_path / "rfcomm0"), 9600, parse, ReadingBuffer(),
+                                  mac_address="98:D3:41:F9:24:CC", connect_timeout=0, min_backoff=0, jitter=0,
+                                  rfcomm_restart_failures=2, rfcomm_command=rfcomm)
+
+    connection.advance()
+    first_process = connection.rfcomm_process
+    assert connection.rfcomm_started == 1
+
+    # Reused by the next attempt then stopped after 2 failures in a row
+    connection.advance()
+    assert connection.rfcomm_reused == 1
+    assert connection.rfcomm_process is None
+    assert connection.stopping_processes == [(first_process, connection.stopping_processes[0][1])]
+
+    # The stopped process is reaped by a later call without waiting for it and a new one is started
+    deadline = time.time() + 5
+    while connection.rfcomm_reaped == 0 and time.time() < deadline:
+        connection.advance()
+        time.sleep(0.01)
+
+    assert first_process.returncode is not None
+    assert connection.rfcomm_started >= 2
+
+    connection.close()
+    assert connection.rfcomm_process is None
+    assert connection.stopping_processes == []
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,116 @@
+"""
+Tests for the binary frames of the multi-sensor sketch. A pty stands in for the serial port of the board.
+"""
+
+import fcntl
+import os
+import select
+import struct
+import termios
+import time
+import tty
+
+import pytest
+
+from framework.io.input.sensors import sensor_protocol
+from framework.io.input.sensors.serial_reader import ReadingBuffer, SerialReader
+
+
+class PtyConnection:
+    """ The end of a pty the framework reads from, with the parts of serial.Serial used by SerialReader """
+
+    def __init__(self, file_descriptor: int, timeout: float = 0.1):
+        self.file_descriptor = file_descriptor
+        self.timeout = timeout
+
+    @property
+    def in_waiting(self) -> int:
+        return struct.unpack("i", fcntl.ioctl(self.file_descriptor, termios.FIONREAD, b"\0\0\0\0"))[0]
+
+    def readinto(self, buffer) -> int:
+
+        if not select.select([self.file_descriptor], [], [], self.timeout)[0]:
+            return 0
+
+        return os.readv(self.file_descriptor, [buffer])
+
+
+@pytest.fixture
+def fake_device():
+    """ (file descriptor the test writes to as the board, connection the reader reads from) """
+
+    device, port = os.openpty()
+    tty.setraw(port)
+    yield device, PtyConnection(port)
+
+    os.close(device)
+    os.close(port)
+
+
+def parse(line: str) -> dict:
+    """ 'name:value' pairs separated by spaces """
+
+    return dict(pair.split(":") for pair in line.split(" ") if pair.count(":") == 1)
+
+
+def read_from_device(device: int, connection: PtyConnection, data: bytes, count: int) -> SerialReader:
+    """ Writes the data in small pieces like a 9600 baud link and waits for count readings """
+
+    reader = SerialReader("sensor", connection, parse, ReadingBuffer(100), buffer_size=256)
+    reader.start()
+    for start in range(0, len(data), 5):
+        os.write(device, data[start:start + 5])
+        time.sleep(0.001)
+
+    deadline = time.time() + 5
+    while len(reader.readings) < count and time.time() < deadline:
+        time.sleep(0.01)
+
+    reader.stop(1)
+
+    return reader
+
+
+def test_frame_matches_the_sketch():
+
+    frame = sensor_protocol.encode_frame(7, {"tds": 310.5, "water_pH": 7.25, "water_temp": 71.0, "air_temp": 68.5,
+                                             "humidity": 45.0})
+
+    assert len(frame) == 28
+    assert frame[:4] == b"\xaa\x55\x01\x16"
+    assert frame[4:6] == b"\x07\x00"
+
+    # CRC-16/CCITT-FALSE check value
+    assert sensor_protocol.crc16(b"123456789") == 0x29B1
+
+    assert sensor_protocol.decode_frame(frame, 0, sensor_protocol.get_frame_length(frame, 0, len(frame))) == \
+           (7, {"tds": 310.5, "water_pH": 7.25, "water_temp": 71.0, "air_temp": 68.5, "humidity": 45.0})
+
+
+def test_frames_and_text_from_a_fake_device(fake_device):
+
+    device, connection = fake_device
+    readings = [{"tds": 300.0 + index, "water_temp": 70.5, "air_temp": 10.0 * index} for index in range(6)]
+    frames = [sensor_protocol.encode_frame(sequence, values) for sequence, values in enumerate(readings)]
+
+    # Garbage from the start of the connection, a damaged frame, a lost frame and an old board sending text
+    damaged = bytearray(frames[2])
+    damaged[10] ^= 0xFF
+    data = b"\x00\x13TDS: 1" + frames[0] + frames[1] + bytes(damaged) + frames[4] + b"tds:5 water_temp:6\r\n" + \
+        frames[5]
+
+    reader = read_from_device(device, connection, data, 5)
+
+    assert [values for arrival_time, values in reader.readings.pop_all()] == \
+           [readings[0], readings[1], readings[4], {"tds": "5", "water_temp": "6"}, readings[5]]
+
+    # The rest of the damaged frame is skipped as text cut off by the next frame, like the garbage
+    assert reader.invalid_frames > 0
+    assert reader.invalid_lines == 2
+    assert reader.missed_frames == 2
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,108 @@
+"""
+Tests for the serial reader thread and its ring buffer
+"""
+
+import threading
+import time
+
+from framework.io.input.sensors.serial_reader import ReadingBuffer, SerialReader
+
+
+class FakeConnection:
+    """ Bytes written by the test are read like a serial.Serial with a timeout """
+
+    def __init__(self, timeout: float = 0.1):
+        self.pending = bytearray()
+        self.condition = threading.Condition()
+        self.timeout = timeout
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.pending)
+
+    def write(self, data: bytes) -> None:
+        with self.condition:
+            self.pending += data
+            self.condition.notify()
+
+    def readinto(self, buffer) -> int:
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.pending) > 0, self.timeout)
+            count = min(len(buffer), len(self.pending))
+            buffer[:count] = self.pending[:count]
+            del self.pending[:count]
+
+        return count
+
+
+def parse(line: str) -> dict:
+    """ 'name:value' pairs separated by spaces """
+
+    return dict(pair.split(":") for pair in line.split(" ") if pair.count(":") == 1)
+
+
+def wait_for_readings(readings: ReadingBuffer, count: int) -> None:
+
+    deadline = time.time() + 5
+    while len(readings) < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_ring_buffer_overwrites_the_oldest():
+
+    readings = ReadingBuffer(3)
+    for index in range(5):
+        readings.push(index)
+
+    assert readings.dropped == 2
+    assert readings.pop_all() == [2, 3, 4]
+    assert readings.pop_all() == []
+
+    readings.push(5)
+    assert readings.pop_all() == [5]
+
+
+def test_every_line_of_a_backlog_is_read():
+
+    connection = FakeConnection()
+    readings = ReadingBuffer(100)
+    reader = SerialReader("sensor", connection, parse, readings, buffer_size=64)
+
+    # A backlog of lines split at random places plus garbage from the start of the connection
+    data = b"\x00\xff garbage\r\n" + b"".join(f"tds:{index} water_temp:70.{index}\r\n".encode() for index in range(20))
+    before = time.time()
+    reader.start()
+    for start in range(0, len(data), 7):
+        connection.write(data[start:start + 7])
+
+    wait_for_readings(readings, 20)
+    reader.stop(1)
+
+    assert not reader.is_alive()
+    received = readings.pop_all()
+    assert [values for arrival_time, values in received] == \
+           [{"tds": str(index), "water_temp": f"70.{index}"} for index in range(20)]
+    assert all(before <= arrival_time <= time.time() for arrival_time, values in received)
+    assert reader.invalid_lines == 1
+    assert reader.take_bytes_read() == len(data)
+    assert reader.take_bytes_read() == 0
+
+
+def test_line_longer_than_the_buffer_is_dropped():
+
+    connection = FakeConnection()
+    readings = ReadingBuffer(10)
+    reader = SerialReader("sensor", connection, parse, readings, buffer_size=16)
+    reader.start()
+
+    connection.write(b"x" * 40 + b"\ntds:1\n")
+    wait_for_readings(readings, 1)
+    reader.stop(1)
+
+    assert [values for arrival_time, values in readings.pop_all()] == [{"tds": "1"}]
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
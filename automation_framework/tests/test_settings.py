@@ -0,0 +1,132 @@
+"""
+Tests for the settings service
+"""
+
+import sqlite3
+
+from framework.database.settings import SettingsService
+from framework.io.io import Io, IoType
+
+
+class SettingsIo(Io):
+
+    database_settings = {"on_time": int, "zipcode": str}
+
+    def __init__(self, name: str):
+
+        super().__init__(name, IoType.OUTPUT, {}, [])
+        self.applied = []
+
+    def apply_settings(self, settings: dict) -> None:
+
+        self.applied.append(settings)
+
+
+def create_settings_table(path: str, rows: list) -> None:
+
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE Settings (Setting_name TEXT, Value TEXT)")
+        connection.executemany("INSERT INTO Settings VALUES (?, ?)", rows)
+
+    connection.close()
+
+
+def update_setting(path: str, setting_name: str, value: str) -> None:
+
+    # A separate connection, like the web app
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("UPDATE Settings SET Value = ? WHERE Setting_name = ?", (value, setting_name))
+
+    connection.close()
+
+
+def test_settings_are_pushed_typed_and_only_when_changed(tmp_path):
+
+    path = str(tmp_path / "settings.db")
+    create_settings_table(path, [("on_time", "110"), ("zipcode", "01564"), ("phone_num", "555")])
+
+    service = SettingsService("settings", {}, "Settings", path)
+    io = SettingsIo("io")
+    service.subscribe(io)
+
+    service.check_for_changes()
+    assert io.applied == [{"on_time": 110, "zipcode": "01564"}]
+
+    # Nothing was written so the table is not read again
+    service.check_for_changes()
+    assert len(io.applied) == 1
+
+    # A setting the object does not use
+    update_setting(path, "phone_num", "666")
+    service.check_for_changes()
+    assert len(io.applied) == 1
+    assert service.get("phone_num") == "666"
+
+    update_setting(path, "on_time", "60")
+    service.check_for_changes()
+    assert io.applied[-1] == {"on_time": 60}
+
+    service.close()
+
+
+def test_writes_to_other_tables_do_not_reload_the_settings(tmp_path):
+
+    path = str(tmp_path / "settings.db")
+    create_settings_table(path, [("on_time", "110"), ("zipcode", None)])
+
+    service = SettingsService("settings", {}, "Settings", path)
+    io = SettingsIo("io")
+    service.subscribe(io)
+    service.check_for_changes()
+    assert service.load_count == 1
+
+    # Sensor readings committed by the writer thread change data_version but not the settings
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE readings (water_temp REAL)")
+
+    for reading in range(3):
+        with connection:
+            connection.execute("INSERT INTO readings VALUES (?)", (reading,))
+
+        service.check_for_changes()
+
+    assert service.load_count == 1
+
+    # Same length and a value that was NULL are still seen
+    update_setting(path, "on_time", "120")
+    update_setting(path, "zipcode", "01564")
+    service.check_for_changes()
+    assert service.load_count == 2
+    assert io.applied[-1] == {"on_time": 120, "zipcode": "01564"}
+
+    connection.close()
+    service.close()
+
+
+def test_late_subscriber_gets_loaded_settings_and_bad_values_are_skipped(tmp_path):
+
+    path = str(tmp_path / "settings.db")
+    create_settings_table(path, [("on_time", "not a number"), ("zipcode", "01564")])
+
+    service = SettingsService("settings", {}, "Settings", path)
+    service.check_for_changes()
+
+    io = SettingsIo("io")
+    service.subscribe(io)
+    assert io.applied == [{"zipcode": "01564"}]
+
+    service.unsubscribe(io)
+    update_setting(path, "zipcode", "02139")
+    service.check_for_changes()
+    assert len(io.applied) == 1
+
+    service.close()
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
@@ -0,0 +1,123 @@
+"""
+Tests for the shared memory readings used by the ingest process
+"""
+
+import math
+import multiprocessing
+import os
+
+import pytest
+
+from framework.io.input import ingest_process
+from framework.io.input.ingest_process import IngestProcess
+from framework.io.input.shared_readings import SharedReadings
+
+columns = ["water_pH", "tds", "water_temp"]
+
+
+def publish_readings(name: str, count: int) -> None:
+
+    shared_readings = SharedReadings(name, columns)
+    for number in range(1, count + 1):
+        shared_readings.publish({"water_pH": number, "tds": number, "water_temp": number}, float(number))
+
+    shared_readings.close()
+
+
+def test_nothing_published_reads_none():
+
+    shared_readings = SharedReadings(f"test_readings_{os.getpid()}_a", columns, create=True)
+    try:
+        assert shared_readings.read() is None
+        assert shared_readings.get_sensor_reading(["date_time", "tds"]) is None
+
+    finally:
+        shared_readings.close()
+        shared_readings.unlink()
+
+
+def test_reader_sees_latest_reading():
+
+    name = f"test_readings_{os.getpid()}_b"
+    writer = SharedReadings(name, columns, create=True)
+    reader = SharedReadings(name, columns)
+    try:
+        writer.publish({"water_pH": 7.1, "tds": 350}, 1000.0)
+
+        timestamp, values = reader.read()
+        assert timestamp == 1000.0
+        assert values[:2] == (7.1, 350.0)
+        assert math.isnan(values[2])
+        assert reader.get_sensor_reading(["tds", "water_temp"]) == [350.0, None]
+        assert reader.get_sensor_reading(["timestamp", "water_pH"]) == [1000.0, 7.1]
+
+    finally:
+        reader.close()
+        writer.close()
+        writer.unlink()
+
+
+def test_reads_from_another_process_are_never_torn():
+
+    name = f"test_readings_{os.getpid()}_c"
+    reader = SharedReadings(name, columns, create=True)
+    try:
+        process = multiprocessing.Process(target=publish_readings, args=(name, 20000))
+        process.start()
+
+        while process.is_alive():
+            reading = reader.read()
+            if reading is not None:
+
+                # Every value of a reading was written by the same publish() call
+                timestamp, values = reading
+                assert values == (timestamp, timestamp, timestamp)
+
+        process.join()
+        assert reader.read()[0] == 20000.0
+
+    finally:
+        reader.close()
+        reader.unlink()
+
+
+def exit_right_away(file_name: str, shared_memory_name: str, columns: list) -> None:
+    """ Stands in for a worker that crashed """
+
+
+def test_dead_ingest_process_is_restarted_and_its_readings_cleared(monkeypatch):
+
+    monkeypatch.setattr(ingest_process, "_run_ingest", exit_right_away)
+    name = f"test_readings_{os.getpid()}_d"
+
+    # Left over by a controller that was killed
+    SharedReadings(name, columns, create=True).close()
+
+    worker = IngestProcess("multi_sensor.json", {"date_time": "TEXT", "water_pH": "REAL", "tds": "REAL"}, name)
+    worker.start()
+    worker.process.join(5)
+
+    # Last reading of the worker before it died
+    writer = SharedReadings(name, ["water_pH", "tds"])
+    writer.publish({"water_pH": 7.0, "tds": 300}, 1000.0)
+    writer.close()
+    assert worker.shared_readings.read() == (1000.0, (7.0, 300.0))
+
+    worker.check_process()
+    assert worker.restart_count == 1
+    assert worker.shared_readings.read() is None
+
+    # A stopped worker is not restarted
+    worker.process.join(5)
+    worker.stop()
+    worker.check_process()
+    assert worker.restart_count == 1
+
+    with pytest.raises(FileNotFoundError):
+        SharedReadings(name, columns)
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])
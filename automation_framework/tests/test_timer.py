@@ -0,0 +1,86 @@
+"""
+Tests for the fixed rate timer and its missed tick policies
+"""
+
+from framework.time import timer as timer_module
+from framework.time.timer import Timer, MissedTickPolicy
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_timer(policy: MissedTickPolicy, monkeypatch) -> (Timer, FakeClock):
+
+    clock = FakeClock()
+    monkeypatch.setattr(timer_module.time, "monotonic", clock)
+    return Timer("test", 2, fixed_rate=True, missed_tick_policy=policy), clock
+
+
+def test_fixed_rate_does_not_drift(monkeypatch):
+
+    timer, clock = make_timer(MissedTickPolicy.SKIP, monkeypatch)
+    assert timer.check_time()
+
+    # Checked half a second late, the next deadline should still be on the grid
+    clock.now += 2.5
+    assert timer.check_time()
+    assert timer.lateness == 0.5
+
+    clock.now += 1.4
+    assert not timer.check_time()
+    clock.now += 0.1
+    assert timer.check_time()
+
+
+def test_catch_up_fires_for_every_missed_tick(monkeypatch):
+
+    timer, clock = make_timer(MissedTickPolicy.CATCH_UP, monkeypatch)
+    timer.check_time()
+
+    clock.now += 9
+    results = [timer.check_time() for _ in range(6)]
+
+    assert results == [True, True, True, True, False, False]
+
+
+def test_skip_fires_once(monkeypatch):
+
+    timer, clock = make_timer(MissedTickPolicy.SKIP, monkeypatch)
+    timer.check_time()
+
+    clock.now += 9
+    assert timer.check_time()
+    assert timer.ticks == 1
+    assert timer.missed_ticks == 3
+    assert not timer.check_time()
+
+
+def test_coalesce_reports_ticks(monkeypatch):
+
+    timer, clock = make_timer(MissedTickPolicy.COALESCE, monkeypatch)
+    timer.check_time()
+
+    clock.now += 9
+    assert timer.check_time()
+    assert timer.ticks == 4
+    assert timer.max_lateness == 7
+    assert timer.time_until_due() == 1
+
+
+def test_from_config():
+
+    assert not Timer.from_config("legacy", 5).fixed_rate
+
+    timer = Timer.from_config("fixed", {"interval": 2, "missed_ticks": "skip"})
+    assert timer.fixed_rate
+    assert timer.missed_tick_policy == MissedTickPolicy.SKIP
+
+    # Only the policy or an explicit flag makes a dictionary fixed rate
+    assert not Timer.from_config("blocking", {"interval": 5, "blocking": True}).fixed_rate
+    assert Timer.from_config("flag", {"interval": 5, "fixed_rate": True}).fixed_rate
@@ -0,0 +1,71 @@
+"""
+Tests for storing the openWeather forecast
+"""
+
+import pytest
+
+from framework.database import database
+
+# weather.py imports requests at the top
+weather = pytest.importorskip("framework.managers.weather", exc_type=ImportError)
+
+start = 1760000400
+
+
+def make_forecast(first_time: int, temperature: float, count: int = 40) -> list:
+    """ A forecast of a row every 3 hours like the openWeather 5 day forecast """
+
+    return [(str(first_time + index * 10800), temperature, temperature - 5, temperature + 5, 50, "Clouds",
+             "overcast clouds", 90, 4.5) for index in range(count)]
+
+
+def test_forecast_is_replaced_and_history_is_bounded(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    manager = weather.WeatherManager("weather_manager", {}, "01564", 6, path)
+
+    # Loading the same forecast every hour keeps one row for each time
+    for hour in range(5):
+        assert manager.store_forecast(make_forecast(start, 60.0 + hour), start) == 40
+
+    rows = database.execute("SELECT date_time, temperature FROM AC_webapp_weatherdata ORDER BY id",
+                            result_count=database.ResultCount.ALL, path_to_database=path)
+    assert [row[0] for row in rows] == [row[0] for row in make_forecast(start, 0)]
+    assert {row[1] for row in rows} == {64.0}
+
+    # A day later 8 times have passed. Times older than the history are purged and the new times are added after the
+    # newest id so latest("id") is the end of the forecast.
+    later = start + 86400
+    assert manager.store_forecast(make_forecast(later, 70.0), later) == 40 + 2
+    newest = database.execute("SELECT date_time, temperature FROM AC_webapp_weatherdata ORDER BY id DESC LIMIT 1",
+                              result_count=database.ResultCount.ONE, path_to_database=path)
+    assert newest == (str(later + 39 * 10800), 70.0)
+
+    # Times inside the new forecast that it no longer has are removed
+    shifted = make_forecast(later + 3600, 75.0)
+    manager.store_forecast(shifted, later)
+    times = database.execute("SELECT date_time FROM AC_webapp_weatherdata WHERE CAST(date_time AS INTEGER) >= ?",
+                             (later + 3600,), database.ResultCount.ALL, path)
+    assert sorted(int(row[0]) for row in times) == sorted(int(row[0]) for row in shifted)
+
+
+def test_duplicate_times_are_removed_from_old_tables(tmp_path):
+
+    path = str(tmp_path / "database.db")
+    database.create_table("AC_webapp_weatherdata", {"id": "INTEGER PRIMARY KEY AUTOINCREMENT", "date_time": "TEXT",
+                                                    "temperature": "REAL"}, True, path)
+    for temperature in (50.0, 51.0, 52.0):
+        database.insert_many("AC_webapp_weatherdata", ["date_time", "temperature"],
+                             [(start, temperature), (start + 10800, temperature)], path)
+
+    weather.WeatherManager("weather_manager", {}, "01564", 6, path)
+
+    rows = database.execute("SELECT date_time, temperature FROM AC_webapp_weatherdata ORDER BY id",
+                            result_count=database.ResultCount.ALL, path_to_database=path)
+    assert rows == [(str(start), 52.0), (str(start + 10800), 52.0)]
+
+
+if __name__ == "__main__":
+
+    import pytest
+    pytest.main([__file__])